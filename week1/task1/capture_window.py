@@ -1,9 +1,10 @@
 import chipwhisperer as cw
 import time
 import numpy as np
-import matplotlib.pyplot as plt
 import sys
 
+from plot_queue import PlotQueue
+
 scope = None
 target = None
 
@@ -32,7 +33,7 @@ def reset_target():
     time.sleep(0.05)
 
 
-def capture_window(offset, samples, plaintext):
+def capture_window(offset, samples, plaintext, plots):
     """Capture window starting at offset A with size S, decimate=1."""
     global scope, target
 
@@ -67,21 +68,13 @@ def capture_window(offset, samples, plaintext):
     np.save(base_name + ".npy", trace)
     print(f"[INFO] Saved data to {base_name}.npy")
 
-    # Save PNG
-    plt.figure(figsize=(10, 3))
-    x = np.arange(len(trace))
-    plt.plot(x, trace, linewidth=0.6)
-    plt.title(f"Power trace – offset={offset}, samples={samples}, decimate=1")
-    plt.xlabel("Sample index (this window)")
-    plt.ylabel("Power (ADC units)")
-
-    tick_step = max(1, len(trace) // 20)   # ~20 ticks
-    plt.xticks(np.arange(0, len(trace) + 1, tick_step))
-    plt.grid(alpha=0.3)
-    plt.tight_layout()
-    plt.savefig(base_name + ".png", dpi=300)
-    plt.close()
-    print(f"[INFO] Saved plot to {base_name}.png")
+    # Save PNG (rendered in the background, see plot_queue.py)
+    plots.submit(trace, {
+        "path": base_name + ".png",
+        "title": f"Power trace – offset={offset}, samples={samples}, decimate=1",
+        "xlabel": "Sample index (this window)",
+    })
+    print(f"[INFO] Queued plot {base_name}.png")
 
 
 def main():
@@ -103,7 +96,8 @@ def main():
               f"(you can override: python3 script.py <offset> <samples>)")
 
     pt = b"HWSEC_25"
-    capture_window(offset, samples, pt)
+    with PlotQueue() as plots:
+        capture_window(offset, samples, pt, plots)
 
 
 if __name__ == "__main__":
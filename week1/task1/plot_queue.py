@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Trace plots rendered off the capture path.
+
+A savefig(dpi=300) takes longer than the capture of the window it shows,
+so plotting inside the capture loop keeps the scope waiting. PlotQueue
+starts a small pool of worker processes fed by a multiprocessing Queue of
+(trace, meta) jobs; submit() only copies the trace into the queue and
+returns, the capture loop goes on at once. close() at the end of the
+session waits until every queued plot is written and reports them.
+
+meta is a dict describing one figure (render()):
+  path            output PNG (required)
+  title, xlabel, ylabel
+  figsize         default (10, 3)
+  n_ticks         about this many x ticks (default 20)
+  tick_rotation   x tick label rotation (default 0)
+  dpi             default 300
+
+With workers=0 the plots are drawn inline (same output, old timing).
+"""
+import time
+import queue
+import numpy as np
+from multiprocessing import Process, Queue
+
+
+# --------- config ---------
+PLOT_WORKERS = 2        # background plotting processes
+POLL = 1.0              # close(): seconds between checks that the workers still run
+# --------------------------
+
+
+def render(trace, meta):
+    """Draw and save one trace plot described by meta."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from trace_plot import plot_envelope
+
+    plt.figure(figsize=meta.get("figsize", (10, 3)))
+    plot_envelope(plt.gca(), trace, dpi=meta.get("dpi", 300), linewidth=0.6)
+    plt.title(meta.get("title", ""))
+    plt.xlabel(meta.get("xlabel", "Sample index"))
+    plt.ylabel(meta.get("ylabel", "Power (ADC units)"))
+
+    tick_step = max(1, len(trace) // meta.get("n_ticks", 20))
+    plt.xticks(np.arange(0, len(trace) + 1, tick_step), rotation=meta.get("tick_rotation", 0))
+
+    plt.grid(alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(meta["path"], dpi=meta.get("dpi", 300))
+    plt.close()
+
+
+def plot_worker(jobs, results):
+    """Render jobs until the None sentinel; one result message per job."""
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        trace, meta = job
+        t0 = time.time()
+        try:
+            render(trace, meta)
+            results.put(("ok", meta["path"], time.time() - t0))
+        except Exception as e:
+            results.put(("error", meta.get("path"), f"{type(e).__name__}: {e}"))
+
+
+class PlotQueue:
+    """Background trace plotting; use as a context manager or call close()."""
+
+    def __init__(self, workers=PLOT_WORKERS):
+        self.jobs = Queue()
+        self.results = Queue()
+        self.submitted = 0
+        self.inline = []
+        self.workers = [Process(target=plot_worker, args=(self.jobs, self.results), daemon=True)
+                        for _ in range(workers)]
+        for w in self.workers:
+            w.start()
+
+    def submit(self, trace, meta):
+        """Queue a plot of trace (a copy is sent, the caller may reuse it)."""
+        if not self.workers:
+            t0 = time.time()
+            render(trace, meta)
+            self.inline.append(("ok", meta["path"], time.time() - t0))
+            return
+        self.jobs.put((np.asarray(trace), dict(meta)))
+        self.submitted += 1
+
+    def close(self):
+        """
+        Wait for all queued plots; returns the number that failed or were
+        lost. Stops waiting once no worker is alive any more (a crashed
+        worker takes its current job with it) instead of hanging.
+        """
+        t0 = time.time()
+        for _ in self.workers:
+            self.jobs.put(None)
+        done = list(self.inline)
+        received = 0
+        while received < self.submitted:
+            try:
+                done.append(self.results.get(timeout=POLL))
+                received += 1
+            except queue.Empty:
+                if not any(w.is_alive() for w in self.workers):
+                    # all exited: take what they flushed before, then stop
+                    while received < self.submitted:
+                        try:
+                            done.append(self.results.get(timeout=0.1))
+                            received += 1
+                        except queue.Empty:
+                            break
+                    break
+        lost = self.submitted - received
+        for w in self.workers:
+            w.join(timeout=POLL)
+            if w.is_alive():
+                w.terminate()
+        self.workers = []
+        self.submitted = 0
+        self.inline = []
+
+        failed = 0
+        for status, path, info in done:
+            if status == "ok":
+                print(f"[INFO] Saved plot to {path} ({info:.2f} s)")
+            else:
+                failed += 1
+                print(f"[ERROR] Plot {path} failed: {info}")
+        if lost:
+            print(f"[ERROR] {lost} plots lost: plot worker(s) exited without a result")
+        total = len(done) + lost
+        if total:
+            print(f"[INFO] {len(done) - failed}/{total} plots written, "
+                  f"waited {time.time() - t0:.2f} s at the end of the session")
+        return failed + lost
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,11 +1,20 @@
 import chipwhisperer as cw
+import sys
 import time
 import numpy as np
-import matplotlib.pyplot as plt
+
+from stitch import Stitcher, average_passes
+from plot_queue import PlotQueue
 
 scope = None
 target = None
 
+# ---------- long-trace (--stitch) mode ----------
+OVERLAP = 2000          # samples shared by neighbouring windows
+MAX_SHIFT = 200         # largest trigger jitter corrected at a seam (samples)
+PASSES = 1              # captures averaged per window
+STITCHED_FILE = "trace_stitched.npy"
+
 def init():
     global scope, target
     try:
@@ -24,8 +33,8 @@ def reset_target():
     scope.io.nrst = 'high_z'
     time.sleep(0.05)
 
-def capture_step(samples, decimate, offset, plaintext, step_idx):
-    """Capture one trace at given offset and return the trace array."""
+def capture_raw(samples, decimate, offset, plaintext, verbose=True):
+    """Capture one trace at given offset; returns the trace array or None."""
     global scope, target
 
     scope.adc.samples = samples
@@ -34,63 +43,85 @@ def capture_step(samples, decimate, offset, plaintext, step_idx):
     scope.adc.presamples = 0
     scope.adc.timeout = 2
 
-    print(f"\n[INFO] Capturing step {step_idx}")
-    print("  samples  =", scope.adc.samples)
-    print("  decimate =", scope.adc.decimate)
-    print("  offset   =", scope.adc.offset)
+    if verbose:
+        print("  samples  =", scope.adc.samples)
+        print("  decimate =", scope.adc.decimate)
+        print("  offset   =", scope.adc.offset)
 
     scope.arm()
     target.simpleserial_write('d', plaintext)
     ciphertext = target.simpleserial_read('r', 8)
-    print("  Ciphertext =", ciphertext.hex())
+    if verbose:
+        print("  Ciphertext =", ciphertext.hex())
 
     if scope.capture():
         print("[ERROR] Capture timed out")
         return None
 
-    trace = np.array(scope.get_last_trace(), dtype=float)
+    return np.array(scope.get_last_trace(), dtype=float)
+
+def capture_step(samples, decimate, offset, plaintext, step_idx, plots):
+    """Capture one trace at given offset and return the trace array."""
+    print(f"\n[INFO] Capturing step {step_idx}")
+    trace = capture_raw(samples, decimate, offset, plaintext)
+    if trace is None:
+        return None
     print("  Trace length =", len(trace))
 
     # save raw data
     np.save(f"trace_step{step_idx}.npy", trace)
     print(f"  Saved step {step_idx} raw data to trace_step{step_idx}.npy")
 
-    # ---- per-step PNG ----
-    plt.figure(figsize=(10, 3))
-    x = np.arange(len(trace))
-    plt.plot(x, trace, linewidth=0.6)
-    plt.title(f"Power trace – step {step_idx} (samples={samples}, decimate={decimate})")
-    plt.xlabel("Sample index (this step)")
-    plt.ylabel("Power (ADC units)")
-
-    # ticks every ~len/20 samples, and rotate labels 45 degrees
-    step_tick = max(1, len(trace) // 20)   # about ~20 ticks max
-    tick_positions = np.arange(0, len(trace) + 1, step_tick)
-    plt.xticks(tick_positions, rotation=45)
-
-    plt.grid(alpha=0.3)
-    plt.tight_layout()
-    plt.savefig(f"trace_step{step_idx}.png", dpi=300)
-    plt.close()
-    print(f"  Saved step {step_idx} plot to trace_step{step_idx}.png")
+    # ---- per-step PNG (rendered in the background, see plot_queue.py) ----
+    plots.submit(trace, {
+        "path": f"trace_step{step_idx}.png",
+        "title": f"Power trace – step {step_idx} (samples={samples}, decimate={decimate})",
+        "xlabel": "Sample index (this step)",
+        "tick_rotation": 45,
+    })
+    print(f"  Queued step {step_idx} plot trace_step{step_idx}.png")
     return trace
 
-def main():
-    init()
-    reset_target()
-
-    pt = b"HWSEC_25"
-
-    SAMPLES = 24400
-    DECIMATE = 2
-    N_STEPS = 8
-    OFFSET_STEP = SAMPLES * DECIMATE  # real-time distance between step windows
-
+def capture_stitched(samples, decimate, n_steps, plaintext, overlap, max_shift, passes,
+                     path=STITCHED_FILE):
+    """
+    Long-trace mode: n_steps windows that overlap by `overlap` samples,
+    `passes` captures averaged per window, seams aligned by
+    cross-correlation (stitch.py) and streamed into the .npy memmap at
+    path. Nothing is written or plotted per window.
+    """
+    stitcher = Stitcher(path, n_steps, samples, overlap, max_shift)
+    step = (samples - overlap) * decimate
+    t0 = time.time()
+
+    for i in range(n_steps):
+        captured = [capture_raw(samples, decimate, i * step, plaintext, verbose=False)
+                    for _ in range(passes)]
+        captured = [t for t in captured if t is not None]
+        if not captured:
+            # a hole would break the seam chain: stop with what we have
+            print(f"[ERROR] Window {i+1} failed in all {passes} passes, stopping")
+            break
+        window, pass_shifts = average_passes(captured, max_shift)
+        d, score = stitcher.add(window)
+        print(f"[INFO] Window {i+1}/{n_steps}: offset={i * step}, seam shift={d:+d}, "
+              f"corr={score:.3f}, passes={len(captured)} (shifts {pass_shifts})")
+
+    n_windows = stitcher.n
+    uncovered = stitcher.close()
+    print(f"\n[INFO] Stitched {n_windows} windows into {path} "
+          f"({stitcher.length} samples, {time.time() - t0:.1f} s)")
+    if uncovered:
+        print(f"[WARN] {uncovered} samples not covered (left as NaN)")
+    return n_windows
+
+def capture_steps(samples, decimate, n_steps, offset_step, pt, plots):
+    """Step mode: n_steps back-to-back windows, per-step and combined plots."""
     all_traces = []
 
-    for i in range(N_STEPS):
-        offset = i * OFFSET_STEP
-        trace = capture_step(SAMPLES, DECIMATE, offset, pt, step_idx=i+1)
+    for i in range(n_steps):
+        offset = i * offset_step
+        trace = capture_step(samples, decimate, offset, pt, step_idx=i+1, plots=plots)
         if trace is None:
             print(f"[WARN] Step {i+1} failed, skipping in combined plot")
             continue
@@ -108,25 +139,61 @@ def main():
     print("[INFO] Saved combined raw data to trace_steps_combined.npy")
 
     # ---- combined PNG (all data, rotated labels) ----
-    plt.figure(figsize=(14, 4))
-    x = np.arange(len(combined_trace))
-    plt.plot(x, combined_trace, linewidth=0.6)
-    plt.title(f"Combined power trace over {len(all_traces)} steps "
-              f"(samples={SAMPLES}, decimate={DECIMATE})")
-    plt.xlabel("Sample index (across all steps)")
-    plt.ylabel("Power (ADC units)")
-
-    # choose tick spacing so labels don't overlap but still fairly dense
-    max_ticks = 20  # ~max number of labels
-    tick_interval = max(1, len(combined_trace) // max_ticks)
-    tick_positions = np.arange(0, len(combined_trace) + 1, tick_interval)
-    plt.xticks(tick_positions, rotation=45)
-
-    plt.grid(alpha=0.3)
-    plt.tight_layout()
-    plt.savefig("trace_steps_combined.png", dpi=300)
-    plt.close()
-    print("[INFO] Saved combined plot to trace_steps_combined.png")
+    plots.submit(combined_trace, {
+        "path": "trace_steps_combined.png",
+        "title": f"Combined power trace over {len(all_traces)} steps "
+                 f"(samples={samples}, decimate={decimate})",
+        "xlabel": "Sample index (across all steps)",
+        "figsize": (14, 4),
+        "tick_rotation": 45,
+    })
+
+    print("\n[INFO] Capture done, flushing plots")
+
+def main():
+    # ./task1.py [--stitch] [--overlap O] [--max-shift M] [--passes P]
+    SAMPLES = 24400
+    DECIMATE = 2
+    N_STEPS = 8
+    OFFSET_STEP = SAMPLES * DECIMATE  # real-time distance between step windows
+
+    args = sys.argv[1:]
+    stitch = "--stitch" in args
+    args = [a for a in args if a != "--stitch"]
+    opts = {"overlap": OVERLAP, "max-shift": MAX_SHIFT, "passes": PASSES}
+    try:
+        for name in opts:
+            if "--" + name in args:
+                i = args.index("--" + name)
+                opts[name] = int(args[i + 1])
+                del args[i:i + 2]
+        if args or opts["passes"] <= 0 or opts["overlap"] <= 2 * opts["max-shift"]:
+            raise ValueError
+        if opts["overlap"] >= SAMPLES:
+            raise ValueError
+    except (ValueError, IndexError):
+        print(f"Usage: {sys.argv[0]} [--stitch] [--overlap O] [--max-shift M] [--passes P]")
+        print(f"  (O must be larger than 2*M and smaller than the window, {SAMPLES} samples)")
+        sys.exit(1)
+
+    init()
+    reset_target()
+
+    pt = b"HWSEC_25"
+
+    if stitch:
+        # overlapping windows advance by SAMPLES - O: take enough of them to
+        # cover the same N_STEPS * SAMPLES span as the step mode
+        overlap = opts["overlap"]
+        n_windows = -(-(N_STEPS * SAMPLES - overlap) // (SAMPLES - overlap))
+        capture_stitched(SAMPLES, DECIMATE, n_windows, pt, overlap,
+                         opts["max-shift"], opts["passes"])
+        return
+
+    # plots are rendered in the background; leaving the with block (also
+    # on an error) waits until all queued PNGs are written
+    with PlotQueue() as plots:
+        capture_steps(SAMPLES, DECIMATE, N_STEPS, OFFSET_STEP, pt, plots)
 
 if __name__ == "__main__":
     main()
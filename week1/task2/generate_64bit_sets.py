@@ -1,22 +1,17 @@
-import random
+import numpy as np
 
-def generate_unique_lsb(count):
-    """Generate 'count' unique random 32-bit values."""
-    lsbs = set()
-    while len(lsbs) < count:
-        lsbs.add(random.getrandbits(32))
-    return list(lsbs)
+def generate_unique_lsb(count, rng=None):
+    """Generate 'count' unique random 32-bit values (one draw without replacement)."""
+    rng = rng or np.random.default_rng()
+    return rng.choice(1 << 32, size=count, replace=False).tolist()
 
 def main():
     count = 100
 
-    # Generate 100 unique 32-bit random values for each set
-    lsbs_A = generate_unique_lsb(count)
-    lsbs_B = generate_unique_lsb(count)
-
-    # Ensure they don't overlap
-    while set(lsbs_A) & set(lsbs_B):
-        lsbs_B = generate_unique_lsb(count)
+    # 2*count unique 32-bit values: the two sets can't overlap
+    lsbs = generate_unique_lsb(2 * count)
+    lsbs_A = lsbs[:count]
+    lsbs_B = lsbs[count:]
 
     # Construct full 64-bit numbers
     set_A = [f"0x00000000{lsb:08X}" for lsb in lsbs_A]
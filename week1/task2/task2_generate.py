@@ -10,6 +10,7 @@ target = None
 SAMPLES = 13420
 DECIMATE = 2
 OFFSET = 0
+REPEATS = 1     # captures per plaintext, averaged on the fly (mean + variance saved)
 
 def init():
     """Connect to ChipWhisperer and target."""
@@ -60,6 +61,42 @@ def capture_one_trace(plaintext_bytes):
     print("  Trace length =", len(trace))
     return trace
 
+class RunningStat:
+    """Welford mean/variance of a scalar or an array."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta / self.n
+        self.m2 = self.m2 + delta * (x - self.mean)
+
+    def variance(self):
+        """Sample variance (0 for fewer than two values)."""
+        return self.m2 / (self.n - 1) if self.n > 1 else np.zeros_like(self.mean)
+
+def capture_averaged_trace(plaintext_bytes, repeats):
+    """
+    Capture the same plaintext `repeats` times and keep only a running
+    mean and variance (RunningStat), not every repetition.
+    Returns (mean, variance) or (None, None) if all captures failed.
+    """
+    stat = RunningStat()
+    for _ in range(repeats):
+        trace = capture_one_trace(plaintext_bytes)
+        if trace is None:
+            continue
+        stat.add(trace)
+
+    if stat.n == 0:
+        return None, None
+    print(f"  Averaged {stat.n}/{repeats} repetitions")
+    return stat.mean, stat.variance()
+
 def read_plaintexts_from_file(filename):
     """
     Read lines like:
@@ -91,7 +128,10 @@ def capture_set(txt_file, out_dir, prefix):
 
     for i, pt in enumerate(plaintexts):
         print(f"\n[INFO] Capturing trace {i+1} / {len(plaintexts)} for set {prefix}")
-        trace = capture_one_trace(pt)
+        if REPEATS > 1:
+            trace, variance = capture_averaged_trace(pt, REPEATS)
+        else:
+            trace, variance = capture_one_trace(pt), None
         if trace is None:
             print("[WARN] Skipping this trace (capture failed)")
             continue
@@ -99,6 +139,11 @@ def capture_set(txt_file, out_dir, prefix):
         filename = os.path.join(out_dir, f"trace_{prefix}_{i:03d}.npy")
         np.save(filename, trace)
         print(f"[INFO] Saved trace to {filename}")
+        if variance is not None:
+            # kept outside out_dir so task2_process.py only averages the means
+            var_dir = out_dir + "_var"
+            os.makedirs(var_dir, exist_ok=True)
+            np.save(os.path.join(var_dir, f"var_{prefix}_{i:03d}.npy"), variance)
 
 def main():
     init()
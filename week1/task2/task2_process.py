@@ -1,27 +1,42 @@
 import numpy as np
 import os
+import sys
 import matplotlib.pyplot as plt
 
-def load_and_average(trace_dir):
+from trace_plot import plot_envelope
+
+def load_and_average(trace_dir, dtype=np.float64):
     """
     Load all .npy traces from trace_dir and compute the sample-by-sample average.
     Returns the average trace as a 1D numpy array.
+
+    With dtype=np.float32 (--float32) the running sum is kept in float32
+    with Kahan compensation, so the rounding error does not grow with the
+    number of traces.
     """
     files = sorted(f for f in os.listdir(trace_dir) if f.endswith(".npy"))
     if not files:
         raise RuntimeError(f"No .npy files found in directory {trace_dir}")
 
     avg = None
+    comp = None     # Kahan compensation (float32 only)
     count = 0
 
     for fname in files:
         path = os.path.join(trace_dir, fname)
-        trace = np.load(path)
+        trace = np.load(path).astype(dtype, copy=False)
 
         if avg is None:
-            avg = np.zeros_like(trace, dtype=float)
+            avg = np.zeros_like(trace, dtype=dtype)
+            comp = np.zeros_like(avg)
 
-        avg += trace
+        if dtype == np.float64:
+            avg += trace
+        else:
+            y = trace - comp
+            t = avg + y
+            comp = (t - avg) - y
+            avg = t
         count += 1
 
     avg /= float(count)
@@ -29,9 +44,12 @@ def load_and_average(trace_dir):
     return avg
 
 def main():
+    # ./task2_process.py [--float32]
+    dtype = np.float32 if "--float32" in sys.argv[1:] else np.float64
+
     # --- 1) Load and average set A and set B ---
-    tAavg = load_and_average("set_A")
-    tBavg = load_and_average("set_B")
+    tAavg = load_and_average("set_A", dtype)
+    tBavg = load_and_average("set_B", dtype)
 
     # Save averages
     np.save("set_A_average.npy", tAavg)
@@ -53,11 +71,9 @@ def main():
     example_trace = np.load(example_trace_path)
     print(f"[INFO] Using example trace: {example_trace_path}")
 
-    x = np.arange(len(example_trace))
-
     plt.figure(figsize=(12, 4))
-    plt.plot(x, example_trace, label="Example trace (from set A)")
-    plt.plot(x, diff, label="abs(tAavg - tBavg)")
+    plot_envelope(plt.gca(), example_trace, label="Example trace (from set A)")
+    plot_envelope(plt.gca(), diff, label="abs(tAavg - tBavg)")
     plt.xlabel("Sample index")
     plt.ylabel("Power (ADC units)")
     plt.title("Example power trace and |tAavg - tBavg|")
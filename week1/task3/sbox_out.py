@@ -1,3 +1,6 @@
+from permutation import Permutation
+
+
 #  Helper functions 
 
 def int_to_bits(x, n):
@@ -126,6 +129,11 @@ S8 = [13,  2,  8,  4,  6, 15, 11,  1, 10,  9,  3, 14,  5,  0, 12,  7,
 SBOXES = [S1, S2, S3, S4, S5, S6, S7, S8]
 
 
+# IP followed by E on the R0 half, compiled to byte lookups:
+# bit j of E(R0) is plaintext bit IP[32 + E_TABLE[j] - 1]
+IP_E_PERM = Permutation([IP[32 + e - 1] for e in E_TABLE], 64)
+
+
 # sbox_out implementation 
 
 def sbox_out(sbox_num, plaintext, guess_k1):
@@ -137,30 +145,17 @@ def sbox_out(sbox_num, plaintext, guess_k1):
     Returns: integer 0..15 (4-bit output of that S-box in round 1).
     """
 
-    # 1) Apply initial permutation IP to plaintext ---
-    pt_bits = int_to_bits(plaintext, 64)
-    ip_bits = permute(pt_bits, IP)
-
-    # Split into L0, R0 (we only need R0)
-    R0 = ip_bits[32:]   # last 32 bits
-
-    # 2) Expand R0 to 48 bits using E-table ---
-    e_bits = permute(R0, E_TABLE)
-
-    # 3) Take the 6-bit chunk for this S-box ---
-    start = (sbox_num - 1) * 6
-    B = e_bits[start:start + 6]
+    # 1-3) IP, take R0, expand with E: one compiled 64 -> 48 bit table ---
+    e48 = IP_E_PERM(plaintext)
+    B = (e48 >> ((8 - sbox_num) * 6)) & 0x3F
 
     # 4) XOR with guessed 6-bit subkey for this S-box ---
-    guess_bits = int_to_bits(guess_k1, 6)
-    B_xor = []
-    for b, k in zip(B, guess_bits):
-        B_xor.append(b ^ k)
+    B_xor = B ^ (guess_k1 & 0x3F)
 
     # 5) Look up in the S-box ---
     # row = first and last bit; col = middle 4 bits
-    row = (B_xor[0] << 1) | B_xor[5]
-    col = (B_xor[1] << 3) | (B_xor[2] << 2) | (B_xor[3] << 1) | B_xor[4]
+    row = ((B_xor >> 4) & 0b10) | (B_xor & 1)
+    col = (B_xor >> 1) & 0xF
     index = row * 16 + col
 
     sbox = SBOXES[sbox_num - 1]
@@ -169,21 +164,21 @@ def sbox_out(sbox_num, plaintext, guess_k1):
     return value
 
 
-def left_shift(bits, n):
-    return bits[n:] + bits[:n]
+# PC-1 (64 -> 56 bits) and PC-2 (56 -> 48 bits), compiled to byte lookups
+PC1_PERM = Permutation(PC1, 64)
+PC2_PERM = Permutation(PC2, 56)
+
+def rotl28(x, n):
+    """Rotate a 28-bit key half left by n."""
+    return ((x << n) | (x >> (28 - n))) & 0xFFFFFFF
 
 def compute_K1_bits_from_key(key64_int):
-    """Compute round-1 subkey K1 (48 bits) from 64-bit DES key."""
-    key_bits = int_to_bits(key64_int, 64)
-    k_plus = permute(key_bits, PC1)   # 56 bits
-    C0 = k_plus[:28]
-    D0 = k_plus[28:]
+    """Compute round-1 subkey K1 (48 bits, MSB first) from 64-bit DES key."""
+    cd0 = PC1_PERM(key64_int)                 # C0||D0, 56 bits
     # Round 1: shift by 1
-    C1 = left_shift(C0, 1)
-    D1 = left_shift(D0, 1)
-    CD1 = C1 + D1
-    K1_bits = permute(CD1, PC2)       # 48 bits
-    return K1_bits
+    c1 = rotl28(cd0 >> 28, 1)
+    d1 = rotl28(cd0 & 0xFFFFFFF, 1)
+    return int_to_bits(PC2_PERM((c1 << 28) | d1), 48)
 
 if __name__ == "__main__":
     # Example from your question:
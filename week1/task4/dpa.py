@@ -5,7 +5,10 @@ import time
 import numpy as np
 import chipwhisperer as cw
 
-from sbox_out import sbox_out
+from sbox_out import sbox_outputs
+from quality_gate import TraceQualityGate, RunningStat
+from sbox_pool import run_sboxes, print_timings
+from telemetry import Telemetry
 
 
 # --------- config ---------
@@ -15,11 +18,16 @@ TRACES_DIR = "traces"
 SAMPLES = 5000        # number of ADC samples per trace
 DECIMATE = 1
 OFFSET = 0        # start at original sample index
+MAX_RECAPTURES = 3    # re-captures of a plaintext rejected by the quality gate (--no-gate: off)
+JOBS = os.cpu_count() or 1    # worker processes for the 8 S-box DPAs (1 = serial)
+DPA_BLOCK = 4096      # traces per float64 block in the group sums
+FLOAT32 = False       # --float32: analyze a float32 copy of the traces (means in float64)
 # --------------------------
 
 
 scope = None
 target = None
+tm = Telemetry("dpa")
 
 
 # ========== ChipWhisperer setup ==========
@@ -44,13 +52,14 @@ def reset_target():
     time.sleep(0.05)
 
 
-def capture_one_trace(pt_bytes, idx):
+def capture_one_trace(pt_bytes, idx, save=True):
     """
     Capture ONE trace for 8-byte plaintext pt_bytes with:
       - samples = SAMPLES
       - decimate = DECIMATE
       - offset   = OFFSET
-    Returns the trace as a 1D NumPy array or None on timeout.
+    Returns (trace, ciphertext) with the trace as a 1D NumPy array
+    and the 8-byte ciphertext, or (None, None) on timeout.
     """
     global scope, target
 
@@ -60,42 +69,98 @@ def capture_one_trace(pt_bytes, idx):
     scope.adc.presamples = 0
     scope.adc.timeout = 2
 
-    print(f"\n[INFO] Capturing trace {idx}")
-    print("  pt      =", pt_bytes.hex())
-    print("  samples =", scope.adc.samples)
-    print("  decim   =", scope.adc.decimate)
-    print("  offset  =", scope.adc.offset)
+    tm.log(f"\n[INFO] Capturing trace {idx}")
+    tm.log("  pt      =", pt_bytes.hex())
+    tm.log("  samples =", scope.adc.samples)
+    tm.log("  decim   =", scope.adc.decimate)
+    tm.log("  offset  =", scope.adc.offset)
 
     scope.arm()
     target.simpleserial_write('d', pt_bytes)
-    # ct = target.simpleserial_read('r', 8)
-    # print("  ct      =", ct.hex())
 
+    tm.count("captures")
     if scope.capture():
-        print("[ERROR] Capture timed out")
-        return None
+        tm.count("timeouts")
+        tm.log("[ERROR] Capture timed out")
+        return None, None
+
+    ct = target.simpleserial_read('r', 8)
+    tm.log("  ct      =", ct.hex())
 
     trace = np.array(scope.get_last_trace(), dtype=float)
-    print("  trace length =", len(trace))
+    tm.log("  trace length =", len(trace))
 
     # optionally save per-trace if you like
+    if save:
+        save_trace(idx, trace)
+
+    return trace, ct
+
+
+def save_trace(idx, trace):
+    """Save one (good or averaged) trace as TRACES_DIR/trace_XXXX.npy."""
     os.makedirs(TRACES_DIR, exist_ok=True)
     np.save(os.path.join(TRACES_DIR, f"trace_{idx:04d}.npy"), trace)
+    tm.count("bytes_written", trace.nbytes)
+
+
+def capture_good_trace(pt_bytes, idx, gate, save=True):
+    """
+    capture_one_trace() behind the quality gate: timed-out or rejected
+    traces are re-captured with the same plaintext (MAX_RECAPTURES times).
+    Returns (trace, ciphertext) or (None, None).
+    """
+    for attempt in range(MAX_RECAPTURES + 1):
+        trace, ct = capture_one_trace(pt_bytes, idx, save=False)
+        reason = gate.check(trace)
+        if reason is None:
+            if save:
+                save_trace(idx, trace)
+            return trace, ct
+        if attempt < MAX_RECAPTURES:
+            print(f"[WARN] Trace {idx} rejected ({reason}), "
+                  f"re-capture {attempt + 1}/{MAX_RECAPTURES}")
+    print(f"[WARN] Trace {idx} rejected {MAX_RECAPTURES + 1} times, giving up.")
+    return None, None
+
+
+def capture_averaged_trace(pt_bytes, idx, repeats, gate=None):
+    """
+    Capture `repeats` traces of the same plaintext and keep a running
+    mean/variance (quality_gate.RunningStat) instead of every repetition.
+    With a gate every repetition goes through capture_good_trace().
+    Returns (mean, variance, ciphertext) or (None, None, None).
+    """
+    stat = RunningStat()
+    ct = None
+
+    for _ in range(repeats):
+        if gate is not None:
+            trace, ct_r = capture_good_trace(pt_bytes, idx, gate, save=False)
+        else:
+            trace, ct_r = capture_one_trace(pt_bytes, idx, save=False)
+        if trace is None:
+            continue
+        stat.add(trace)
+        ct = ct_r
+
+    if stat.n == 0:
+        return None, None, None
+
+    tm.log(f"  averaged {stat.n}/{repeats} repetitions")
 
-    return trace
+    save_trace(idx, stat.mean)
+    return stat.mean, stat.variance(), ct
 
 
 # ========== helper functions ==========
 
 def generate_random_plaintexts(n):
     """
-    Generate n random 64-bit plaintexts using os.urandom.
+    Generate n random 64-bit plaintexts from one os.urandom call.
     Returns a list of integers.
     """
-    pts = []
-    for _ in range(n):
-        val = int.from_bytes(os.urandom(8), "big")  # 64-bit
-        pts.append(val)
+    pts = np.frombuffer(os.urandom(8 * n), dtype=">u8").tolist()
     print(f"[INFO] Generated {n} random plaintexts in memory")
     return pts
 
@@ -107,14 +172,14 @@ def plaintext_int_to_bytes(pt_int):
 
 # ========== DPA using pre-captured traces ==========
 
-def run_dpa_all_sboxes(traces, plaintexts_int):
+def run_dpa_all_sboxes(traces, plaintexts_int, jobs=JOBS):
     """
     Capture phase is already done.
     Now DPA phase using global traces:
 
     for each sbox (1,8)
         for each key (0,63)
-            using sbox_out divide the plaintext indices into zero_list and one_list
+            using sbox_outputs divide the plaintext indices into zero_list and one_list
                 zero_indices = [i where LSB(sbox_out(sbox, PT[i], key)) == 0]
                 one_indices  = [i where LSB(sbox_out(sbox, PT[i], key)) == 1]
             zero_traces = traces[zero_indices]
@@ -131,76 +196,104 @@ def run_dpa_all_sboxes(traces, plaintexts_int):
         at the end for this sbox:
             sort all keys by peak_value
             take top 5
+
+    The S-boxes are independent: with jobs > 1 the traces go to shared
+    memory once and dpa_for_sbox() runs in worker processes.
     """
     num_traces, trace_len = traces.shape
     print(f"[INFO] DPA phase on {num_traces} traces, trace_len={trace_len}")
+    tm.count("guesses", 8 * 64)
 
-    all_results = {}   # sbox_num -> list of (key, peak, idx)
-
-    for sbox_num in range(1, 9):
-        print(f"\n[INFO] === DPA for S-box {sbox_num} ===")
-
-        sbox_results = []
+    if jobs <= 1:
+        return {sbox_num: dpa_for_sbox(traces, plaintexts_int, sbox_num)
+                for sbox_num in range(1, 9)}
 
-        for guess_key in range(64):
-            zero_indices = []
-            one_indices = []
-
-            # build zero/one lists by index
-            for i, pt_int in enumerate(plaintexts_int):
-                val = sbox_out(sbox_num, pt_int, guess_key)  # 0..15
-                bit = val & 1   # LSB
-
-                if bit == 0:
-                    zero_indices.append(i)
-                else:
-                    one_indices.append(i)
-
-            n_zero = len(zero_indices)
-            n_one = len(one_indices)
-            print(f"  S{sbox_num} key={guess_key:02d}: "
-                  f"{n_zero} zero, {n_one} one")
-
-            # skip if one of the groups is empty
-            if n_zero == 0 or n_one == 0:
-                continue
+    t0 = time.time()
+    all_results, timings = run_sboxes(dpa_for_sbox, traces, plaintexts_int, jobs)
+    print(f"\n[INFO] DPA timings ({jobs} workers):")
+    print_timings(timings, time.time() - t0)
+    return all_results
 
-            zero_traces = traces[zero_indices]
-            one_traces  = traces[one_indices]
 
-            avg_zero = np.mean(zero_traces, axis=0)
-            avg_one  = np.mean(one_traces, axis=0)
+def dpa_for_sbox(traces, plaintexts_int, sbox_num):
+    """
+    DPA of one S-box: list of (key, peak, idx) sorted by peak descending.
 
-            diff = np.abs(avg_one - avg_zero)
+    The LSB selection of all 64 guesses comes from sbox_outputs() in one
+    step; the "one" group sums of all guesses are a (64, N) x (N, L)
+    product over blocks of DPA_BLOCK traces, accumulated in float64 also
+    for float32 traces. The "zero" group is the total minus the "one" group.
+    """
+    print(f"\n[INFO] === DPA for S-box {sbox_num} ===")
+
+    pts = np.asarray(plaintexts_int, dtype=np.uint64)
+    sel = sbox_outputs(pts, sbox_num) & 1            # (64, N) LSB per guess
+    n_one = sel.sum(axis=1, dtype=np.int64)
+    n_zero = len(pts) - n_one
+
+    sum_one = np.zeros((64, traces.shape[1]))
+    total = np.zeros(traces.shape[1])
+    for a in range(0, len(pts), DPA_BLOCK):
+        block = np.asarray(traces[a:a + DPA_BLOCK], dtype=np.float64)
+        sum_one += sel[:, a:a + DPA_BLOCK].astype(np.float64) @ block
+        total += block.sum(axis=0)
+
+    sbox_results = []
+    for guess_key in range(64):
+        tm.log(f"  S{sbox_num} key={guess_key:02d}: "
+               f"{n_zero[guess_key]} zero, {n_one[guess_key]} one")
+
+        # skip if one of the groups is empty
+        if n_zero[guess_key] == 0 or n_one[guess_key] == 0:
+            continue
 
-            max_peak = float(np.max(diff))
-            peak_index = int(np.argmax(diff))
+        avg_one = sum_one[guess_key] / n_one[guess_key]
+        avg_zero = (total - sum_one[guess_key]) / n_zero[guess_key]
+        diff = np.abs(avg_one - avg_zero)
 
-            print(f"    -> max_peak={max_peak:.6f} at sample {peak_index}")
+        max_peak = float(np.max(diff))
+        peak_index = int(np.argmax(diff))
 
-            sbox_results.append((guess_key, max_peak, peak_index))
+        tm.log(f"    -> max_peak={max_peak:.6f} at sample {peak_index}")
 
-        # sort by peak descending for this S-box
-        sbox_results.sort(key=lambda x: x[1], reverse=True)
-        all_results[sbox_num] = sbox_results
+        sbox_results.append((guess_key, max_peak, peak_index))
 
-    return all_results
+    # sort by peak descending for this S-box
+    sbox_results.sort(key=lambda x: x[1], reverse=True)
+    return sbox_results
 
 
 # ========== main: capture phase + DPA phase ==========
 
 def main():
-    # ----- parse command line: ./dpa.py <n_traces> -----
-    if len(sys.argv) != 2:
-        print(f"Usage: {sys.argv[0]} <n_traces>")
+    # ----- parse command line: ./dpa.py <n_traces> [repeats] [--jobs J] [--float32] [--verbose]
+    #                                   [--no-gate] -----
+    args = sys.argv[1:]
+    jobs = JOBS
+    use_float32 = FLOAT32 or "--float32" in args
+    tm.verbose = "--verbose" in args
+    use_gate = "--no-gate" not in args
+    args = [a for a in args if a not in ("--float32", "--verbose", "--no-gate")]
+    try:
+        if "--jobs" in args:
+            i = args.index("--jobs")
+            jobs = int(args[i + 1])
+            del args[i:i + 2]
+    except (ValueError, IndexError):
+        jobs = 0
+
+    if len(args) not in (1, 2):
+        print(f"Usage: {sys.argv[0]} <n_traces> [repeats] [--jobs J] [--float32] [--verbose] "
+              f"[--no-gate]")
         sys.exit(1)
 
     try:
-        n_traces = int(sys.argv[1])
-        if n_traces <= 0:
+        n_traces = int(args[0])
+        repeats = int(args[1]) if len(args) == 2 else 1
+        if n_traces <= 0 or repeats <= 0 or jobs <= 0:
             raise ValueError
     except ValueError:
-        print("[ERROR] <n_traces> must be a positive integer")
+        print("[ERROR] <n_traces>, [repeats] and J must be positive integers")
         sys.exit(1)
 
     print(f"[INFO] Requested {n_traces} traces")
@@ -212,24 +305,44 @@ def main():
     init_scope()
     reset_target()
 
+    gate = TraceQualityGate() if use_gate else None
     traces_list = []
+    variances_list = []
     used_plaintexts_int = []
+    used_ciphertexts_int = []
+
+    with tm.phase("capture"):
+        for idx, pt_int in enumerate(plaintexts_int_all):
+            pt_bytes = plaintext_int_to_bytes(pt_int)
+            if repeats > 1:
+                trace, variance, ct = capture_averaged_trace(pt_bytes, idx, repeats, gate)
+            elif gate is not None:
+                trace, ct = capture_good_trace(pt_bytes, idx, gate)
+                variance = None
+            else:
+                trace, ct = capture_one_trace(pt_bytes, idx)
+                variance = None
+
+            tm.progress("capture", idx + 1, len(plaintexts_int_all), "plaintexts")
+            if trace is None:
+                print(f"[WARN] Skipping plaintext index {idx} due to capture error.")
+                continue
 
-    for idx, pt_int in enumerate(plaintexts_int_all):
-        pt_bytes = plaintext_int_to_bytes(pt_int)
-        trace = capture_one_trace(pt_bytes, idx)
-
-        if trace is None:
-            print(f"[WARN] Skipping plaintext index {idx} due to capture error.")
-            continue
+            traces_list.append(trace)
+            if variance is not None:
+                variances_list.append(variance)
+            used_plaintexts_int.append(pt_int)
+            used_ciphertexts_int.append(int.from_bytes(ct, "big"))
 
-        traces_list.append(trace)
-        used_plaintexts_int.append(pt_int)
+    if gate is not None:
+        print(gate.report())
 
     if len(traces_list) == 0:
         print("[ERROR] No traces captured, aborting DPA.")
         scope.dis()
         target.dis()
+        tm.set("n_traces", 0)
+        tm.write()
         return
 
     traces = np.vstack(traces_list)
@@ -237,15 +350,28 @@ def main():
 
     # (optional) save combined arrays
     os.makedirs(TRACES_DIR, exist_ok=True)
-    np.save(os.path.join(TRACES_DIR, "traces_all.npy"), traces)
-    np.save(os.path.join(TRACES_DIR, "plaintexts_all.npy"),
-            np.array(plaintexts_int, dtype=np.uint64))
+    arrays = {
+        "traces_all.npy": traces,
+        "plaintexts_all.npy": np.array(plaintexts_int, dtype=np.uint64),
+        "ciphertexts_all.npy": np.array(used_ciphertexts_int, dtype=np.uint64),
+    }
+    if variances_list:
+        arrays["traces_var_all.npy"] = np.vstack(variances_list)
+    with tm.phase("save"):
+        for name, arr in arrays.items():
+            np.save(os.path.join(TRACES_DIR, name), arr)
+            tm.count("bytes_saved", arr.nbytes)
 
     print(f"\n[INFO] Capture done. Traces shape = {traces.shape}")
+    tm.set("n_traces", traces.shape[0])
+    tm.set("trace_len", traces.shape[1])
     print(f"[INFO] Starting DPA phase using pre-captured traces.")
 
     # ----- DPA phase -----
-    all_results = run_dpa_all_sboxes(traces, plaintexts_int)
+    if use_float32:
+        traces = traces.astype(np.float32)
+    with tm.phase("dpa"):
+        all_results = run_dpa_all_sboxes(traces, plaintexts_int, jobs)
 
     # print top 5 per S-box
     print("\n=== DPA top 5 keys per S-box (reuse traces) ===")
@@ -262,6 +388,7 @@ def main():
             print(f"  #{rank}: key= (0x{key:02X}), "
                   f"max_peak={peak:.6f}, "
                   f"sample={idx} (original ≈ {original_sample})")
+    tm.write()
 
     # cleanup
     scope.dis()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Run telemetry for capture, analysis and key search.
+
+  tm = Telemetry("cpa")
+  with tm.phase("capture"):
+      for i in ...:
+          tm.count("captures")
+          tm.progress("capture", i + 1, total)   # at most one line per PROGRESS_INTERVAL
+          tm.log("per-item detail")               # printed only with verbose=True
+  tm.write()                                      # one JSON record -> METRICS_FILE
+
+Counters are attributed to the innermost active phase, so the record has
+a rate (<counter>/s) for every counter over the time of its phase.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+
+# --------- config ---------
+METRICS_FILE = "metrics.jsonl"   # one JSON record per run is appended
+PROGRESS_INTERVAL = 2.0          # seconds between progress lines
+# --------------------------
+
+
+class Telemetry:
+
+    def __init__(self, name, verbose=False, progress_interval=PROGRESS_INTERVAL):
+        self.name = name
+        self.verbose = verbose
+        self.progress_interval = progress_interval
+        self.started = time.time()
+        self.phases = {}          # phase -> seconds
+        self.counters = {}        # counter -> value
+        self.counter_phase = {}   # counter -> phase it was counted in
+        self.extra = {}           # free-form fields for the record
+        self._stack = []
+        self._entered = {}        # running phase -> start time
+        self._last_progress = {}
+
+    # ----- timers / counters -----
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block; phases with the same name add up."""
+        self._stack.append(name)
+        self._entered[name] = time.time()
+        try:
+            yield self
+        finally:
+            t0 = self._entered.pop(name)
+            self.phases[name] = self.phases.get(name, 0.0) + time.time() - t0
+            self._stack.pop()
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+        if self._stack:
+            self.counter_phase.setdefault(name, self._stack[-1])
+
+    def set(self, name, value):
+        """Attach a result field (key found, n_traces, ...) to the record."""
+        self.extra[name] = value
+
+    # ----- console -----
+
+    def log(self, *args):
+        """Per-item detail, printed only in verbose mode."""
+        if self.verbose:
+            print(*args)
+
+    def elapsed(self, phase):
+        """Seconds spent in phase so far (including the running part)."""
+        seconds = self.phases.get(phase, 0.0)
+        if phase in self._entered:
+            seconds += time.time() - self._entered[phase]
+        return seconds
+
+    def progress(self, phase, done, total=None, unit="items"):
+        """Rate-limited progress line: at most one per interval, plus the last one."""
+        now = time.time()
+        last = self._last_progress.setdefault(phase, now)
+        finished = total is not None and done >= total
+        if now - last < self.progress_interval and not finished:
+            return
+
+        elapsed = self.elapsed(phase)
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = f"[PROG] {phase}: {done}" + (f"/{total}" if total is not None else "")
+        line += f" {unit} ({rate:,.1f}/s"
+        if total is not None and rate > 0 and not finished:
+            line += f", eta {(total - done) / rate:.0f} s"
+        print(line + ")")
+        self._last_progress[phase] = now
+
+    # ----- record -----
+
+    def rates(self):
+        out = {}
+        for name, value in self.counters.items():
+            seconds = self.phases.get(self.counter_phase.get(name), 0.0)
+            if seconds > 0:
+                out[f"{name}/s"] = value / seconds
+        return out
+
+    def record(self):
+        return {
+            "run": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_s": time.time() - self.started,
+            "phases_s": self.phases,
+            "counters": self.counters,
+            "rates": self.rates(),
+            **self.extra,
+        }
+
+    def summary(self):
+        rec = self.record()
+        phases = ", ".join(f"{k}={v:.2f}s" for k, v in rec["phases_s"].items())
+        rates = ", ".join(f"{k}={v:,.1f}" for k, v in rec["rates"].items())
+        return f"[INFO] {self.name}: wall {rec['wall_s']:.2f}s ({phases}); {rates}"
+
+    def write(self, path=METRICS_FILE):
+        """Append the JSON record to path and print a one-line summary."""
+        with open(path, "a") as f:
+            f.write(json.dumps(self.record()) + "\n")
+        print(self.summary())
+        print(f"[INFO] Metrics record appended to {path}")
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Mergeable running-sum accumulators for the side-channel statistics.
+
+Every accumulator only keeps sums over the traces it has seen, so
+  A.merge(B)  gives exactly the accumulator of the union of both trace sets
+(in any order), and the state can be saved to / loaded from an .npz file
+or pickled to another process or host. Results are computed from the sums
+at the end:
+
+  CpaAccumulator       Pearson correlation of G hypotheses vs. every sample
+  DpaAccumulator       difference of means for G 0/1 selection functions
+  TTestAccumulator     Welch t-test between two trace groups (e.g. fixed/random)
+  ClassSumAccumulator  per-class means/variances and the class SNR
+
+CpaAccumulator keeps centred moments instead of raw sums (see its
+docstring) and overrides merge() with the pairwise update; the others
+merge by adding their sums.
+
+The sums are always float64. With dtype=np.float32 the expensive
+hypothesis x trace products of a block run in float32 on block-centered
+traces,  a @ y = a @ (y - m) + rowsum(a) * m,  and are folded into the
+float64 sums, so the float32 part never carries the DC level of the
+traces or the running total.
+"""
+import numpy as np
+
+
+class SumAccumulator:
+    """Base class: FIELDS are the sums, merged by addition."""
+
+    FIELDS = ()
+    dtype = np.float64
+
+    def merge(self, other):
+        if type(other) is not type(self):
+            raise TypeError(f"cannot merge {type(other).__name__} into {type(self).__name__}")
+        for name in self.FIELDS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def state(self):
+        """Dict of numpy arrays (the sums) that fully describes the accumulator."""
+        state = {name: np.asarray(getattr(self, name)) for name in self.FIELDS}
+        state["dtype"] = np.asarray(np.dtype(self.dtype).name)
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls.__new__(cls)
+        for name in cls.FIELDS:
+            value = np.asarray(state[name])
+            setattr(acc, name, value.item() if value.ndim == 0 else value.copy())
+        if "dtype" in state:
+            acc.dtype = np.dtype(str(state["dtype"])).type
+        return acc
+
+    def _product_sum(self, a, traces):
+        """float64 a @ traces; the product runs in self.dtype (see module doc)."""
+        if self.dtype == np.float64:
+            return np.asarray(a, dtype=float) @ np.asarray(traces, dtype=float)
+        y = np.asarray(traces, dtype=self.dtype)
+        m = y.mean(axis=0, dtype=np.float64).astype(self.dtype)
+        prod = np.asarray(a, dtype=self.dtype) @ (y - m)
+        return prod + np.outer(np.sum(a, axis=1, dtype=np.float64), m)
+
+    def save(self, path):
+        np.savez(path, kind=type(self).__name__, **self.state())
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        if str(data["kind"]) != cls.__name__:
+            raise ValueError(f"{path} holds a {data['kind']}, not a {cls.__name__}")
+        return cls.from_state(data)
+
+
+def merge_all(accumulators):
+    """Merge a non-empty sequence of accumulators of the same type."""
+    accumulators = list(accumulators)
+    total = type(accumulators[0]).from_state(accumulators[0].state())
+    for acc in accumulators[1:]:
+        total.merge(acc)
+    return total
+
+
+class CpaAccumulator(SumAccumulator):
+    """
+    Running centred moments for Pearson correlation of G hypotheses against
+    every sample, so traces can be added block by block:
+      n, mean(h), mean(y), M2(h), M2(y), C(h, y)
+    with M2 and C the sums of squared / cross deviations from the means.
+    Raw sums like n*sum(y^2) - sum(y)^2 cancel catastrophically when the
+    traces sit on a large DC level; the centred moments do not. Blocks and
+    accumulators are combined with the pairwise update of Chan et al., which
+    is exact (up to rounding) in any order, like the plain sums.
+    correlation() after any update gives the CPA result on the traces
+    seen so far (prefix of the trace set).
+    """
+
+    FIELDS = ("n", "mean_h", "mean_y", "m2_h", "m2_y", "c_hy")
+
+    def __init__(self, n_guesses, trace_len, dtype=np.float64):
+        self.dtype = dtype
+        self.n = 0
+        self.mean_h = np.zeros(n_guesses)
+        self.mean_y = np.zeros(trace_len)
+        self.m2_h = np.zeros(n_guesses)
+        self.m2_y = np.zeros(trace_len)
+        self.c_hy = np.zeros((n_guesses, trace_len))
+
+    def _combine(self, n_b, mean_h, mean_y, m2_h, m2_y, c_hy):
+        """Fold the moments of n_b other traces into self (Chan et al.)."""
+        n_a = self.n
+        n = n_a + n_b
+        if n_b == 0:
+            return
+        delta_h = mean_h - self.mean_h
+        delta_y = mean_y - self.mean_y
+        w = n_a * n_b / n
+        self.mean_h = self.mean_h + delta_h * (n_b / n)
+        self.mean_y = self.mean_y + delta_y * (n_b / n)
+        self.m2_h = self.m2_h + m2_h + w * delta_h**2
+        self.m2_y = self.m2_y + m2_y + w * delta_y**2
+        self.c_hy = self.c_hy + c_hy + w * np.outer(delta_h, delta_y)
+        self.n = n
+
+    def update(self, hyp, traces):
+        """hyp: (G, B) hypotheses (e.g. uint8), traces: (B, trace_len) for B new traces."""
+        hyp = np.asarray(hyp)
+        traces = np.asarray(traces)
+        mean_h = hyp.mean(axis=1, dtype=np.float64)
+        mean_y = traces.mean(axis=0, dtype=np.float64)
+        hc = hyp - mean_h[:, None]
+        yc = traces - mean_y
+        # the product runs in self.dtype, on centred operands only
+        c_hy = np.asarray(hc, dtype=self.dtype) @ np.asarray(yc, dtype=self.dtype)
+        self._combine(traces.shape[0], mean_h, mean_y,
+                      np.sum(hc**2, axis=1), np.sum(yc**2, axis=0), c_hy.astype(np.float64))
+
+    @classmethod
+    def from_state(cls, state):
+        if "sum_hy" in state:
+            # older .npz with raw sums: convert (keeps their rounding error)
+            n = float(state["n"])
+            mean_h = state["sum_h"] / max(n, 1)
+            mean_y = state["sum_y"] / max(n, 1)
+            state = {"n": state["n"], "mean_h": mean_h, "mean_y": mean_y,
+                     "m2_h": state["sum_h2"] - state["sum_h"] * mean_h,
+                     "m2_y": state["sum_y2"] - state["sum_y"] * mean_y,
+                     "c_hy": state["sum_hy"] - np.outer(state["sum_h"], mean_y),
+                     **({"dtype": state["dtype"]} if "dtype" in state else {})}
+        return super().from_state(state)
+
+    def merge(self, other):
+        if type(other) is not type(self):
+            raise TypeError(f"cannot merge {type(other).__name__} into {type(self).__name__}")
+        self._combine(other.n, other.mean_h, other.mean_y, other.m2_h, other.m2_y, other.c_hy)
+        return self
+
+    def correlation(self):
+        """(G, trace_len) Pearson correlation on all traces added so far."""
+        m2_h = self.m2_h.copy()
+        m2_y = self.m2_y.copy()
+        m2_h[m2_h <= 0] = np.inf
+        m2_y[m2_y <= 0] = np.inf
+        return self.c_hy / np.sqrt(np.outer(m2_h, m2_y))
+
+
+class DpaAccumulator(SumAccumulator):
+    """
+    Sums for the difference of means of G selection functions:
+      n, sum(y), n_one[g], sum(y | sel_g = 1)
+    difference() is the same as cpa_engine.dpa_difference() on all traces.
+    """
+
+    FIELDS = ("n", "sum_y", "n_one", "sum_one")
+
+    def __init__(self, n_guesses, trace_len, dtype=np.float64):
+        self.dtype = dtype
+        self.n = 0
+        self.sum_y = np.zeros(trace_len)
+        self.n_one = np.zeros(n_guesses)
+        self.sum_one = np.zeros((n_guesses, trace_len))
+
+    def update(self, sel, traces):
+        """sel: (G, B) 0/1 selection, traces: (B, trace_len)."""
+        sel = np.asarray(sel)
+        traces = np.asarray(traces)
+        self.n += traces.shape[0]
+        self.sum_y += np.sum(traces, axis=0, dtype=np.float64)
+        self.n_one += np.sum(sel, axis=1, dtype=np.float64)
+        self.sum_one += self._product_sum(sel, traces)
+
+    def difference(self):
+        """(G, trace_len) |mean(sel=1) - mean(sel=0)|, 0 for an empty group."""
+        n_one = self.n_one.copy()
+        n_zero = self.n - n_one
+        valid = (n_one > 0) & (n_zero > 0)
+        n_one[~valid] = 1
+        n_zero[~valid] = 1
+        sum_zero = self.sum_y[None, :] - self.sum_one
+        diff = np.abs(self.sum_one / n_one[:, None] - sum_zero / n_zero[:, None])
+        diff[~valid] = 0
+        return diff
+
+
+class TTestAccumulator(SumAccumulator):
+    """Welch t-test between group 0 and group 1 (per sample)."""
+
+    FIELDS = ("n", "sum_y", "sum_y2")
+
+    def __init__(self, trace_len):
+        self.n = np.zeros(2)
+        self.sum_y = np.zeros((2, trace_len))
+        self.sum_y2 = np.zeros((2, trace_len))
+
+    def update(self, groups, traces):
+        """groups: (B,) 0/1 group of every trace, traces: (B, trace_len)."""
+        groups = np.asarray(groups, dtype=int)
+        traces = np.asarray(traces, dtype=float)
+        for g in (0, 1):
+            part = traces[groups == g]
+            self.n[g] += part.shape[0]
+            self.sum_y[g] += part.sum(axis=0)
+            self.sum_y2[g] += np.sum(part**2, axis=0)
+
+    def t_statistic(self):
+        """(trace_len,) Welch t; 0 where a group has fewer than 2 traces."""
+        if min(self.n) < 2:
+            return np.zeros(self.sum_y.shape[1])
+        n = self.n[:, None]
+        mean = self.sum_y / n
+        var = (self.sum_y2 - n * mean**2) / (n - 1)
+        denom = np.sqrt(var[0] / self.n[0] + var[1] / self.n[1])
+        denom[denom == 0] = np.inf
+        return (mean[0] - mean[1]) / denom
+
+
+class ClassSumAccumulator(SumAccumulator):
+    """Per-class counts, sums and sums of squares of every sample."""
+
+    FIELDS = ("counts", "sums", "sums2")
+
+    def __init__(self, n_classes, trace_len, dtype=np.float64):
+        self.dtype = dtype
+        self.counts = np.zeros(n_classes)
+        self.sums = np.zeros((n_classes, trace_len))
+        self.sums2 = np.zeros((n_classes, trace_len))
+
+    def update(self, labels, traces):
+        """labels: (B,) class in 0..n_classes-1, traces: (B, trace_len)."""
+        labels = np.asarray(labels, dtype=int)
+        traces = np.asarray(traces)
+        onehot = np.zeros((len(self.counts), len(labels)), dtype=np.uint8)
+        onehot[labels, np.arange(len(labels))] = 1
+        self.counts += np.sum(onehot, axis=1, dtype=np.float64)
+        self.sums += self._product_sum(onehot, traces)
+        self.sums2 += onehot @ np.square(traces, dtype=np.float64)
+
+    def means(self):
+        return self.sums / np.maximum(self.counts, 1)[:, None]
+
+    def snr(self):
+        """Var(class means) / mean(class variances) over classes with >1 trace."""
+        used = self.counts > 1
+        means = self.means()[used]
+        variances = np.maximum(self.sums2[used] / self.counts[used, None] - means**2, 0)
+        noise = variances.mean(axis=0)
+        noise[noise == 0] = np.inf
+        return means.var(axis=0) / noise
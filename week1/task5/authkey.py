@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Shared secret of the multiprocessing.connection sockets (distribute.py,
+capture_server.py).
+
+Those sockets exchange pickled objects, so whoever knows the key can run
+code on the other side. There is no built-in key: it is read from the
+environment variable DES_SCA_AUTHKEY, or else from the file named by
+DES_SCA_AUTHKEY_FILE (default ~/.des-sca-authkey). Server and clients
+must see the same key.
+
+  python3 authkey.py [path]
+writes a new random key file (mode 600), to copy to every worker host.
+"""
+import os
+import sys
+import secrets
+
+
+# --------- config ---------
+AUTHKEY_ENV = "DES_SCA_AUTHKEY"
+AUTHKEY_FILE_ENV = "DES_SCA_AUTHKEY_FILE"
+AUTHKEY_FILE = os.path.expanduser("~/.des-sca-authkey")
+# --------------------------
+
+
+def load_authkey():
+    """The shared key as bytes; RuntimeError if none is configured."""
+    key = os.environ.get(AUTHKEY_ENV, "").strip()
+    if key:
+        return key.encode()
+    path = os.environ.get(AUTHKEY_FILE_ENV, AUTHKEY_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            key = f.read().strip()
+        if key:
+            return key.encode()
+    raise RuntimeError(f"no socket authkey: set {AUTHKEY_ENV} or create {path} "
+                       f"(python3 authkey.py)")
+
+
+def main():
+    if len(sys.argv) > 2:
+        print(f"Usage: {sys.argv[0]} [path]")
+        sys.exit(1)
+    path = sys.argv[1] if len(sys.argv) == 2 else AUTHKEY_FILE
+    if os.path.exists(path):
+        print(f"[ERROR] {path} already exists, not overwritten")
+        sys.exit(1)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(secrets.token_hex(32) + "\n")
+    print(f"[INFO] Written new authkey to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Multi-device capture campaign.
+
+One worker process per device (CW-Lite bench). The plaintext list is cut
+into chunks of CHUNK plaintexts in a shared queue; every worker pulls the
+next chunk as soon as its device is free, so faster benches take more
+work. The chunks come back to the parent and are merged in plaintext order
+into one trace store (same files as cpa.py, readable by load_trace_set()),
+with the device of every trace in devices_all_cpa.npy and the device list
+in devices.txt.
+
+Devices:
+  sn:SERIAL          ChipWhisperer with this serial number
+  server:HOST:PORT   a running capture_server.py
+  sim[:SEED]         simulated backend (capture_server.SimulatedBackend)
+
+A device that fails puts its current chunk back into the queue for the
+others; plaintexts that no device captured are reported at the end.
+
+Usage:
+  python3 campaign.py <n_traces> [--devices SPEC,SPEC,...] [--chunk C] [--out DIR]
+                      [--plaintexts uniform|balanced]
+"""
+import os
+import sys
+import time
+import queue
+import numpy as np
+from multiprocessing import Process, Queue
+
+import capture_server
+import plaintexts
+from telemetry import Telemetry
+
+
+# --------- config ---------
+DEVICES = [f"sn:{capture_server.CW_SERIAL}"]
+CHUNK = 100                 # plaintexts per work item
+OUT_DIR = "traces_campaign"
+# capture window, overridden by capture_window.txt (locate_window.py)
+SAMPLES = 200
+DECIMATE = 1
+OFFSET = 3800
+WINDOW_FILE = "capture_window.txt"
+# --------------------------
+
+
+# ========== devices ==========
+
+def open_device(spec):
+    """Backend (configure, reset, capture, close) for a device spec string."""
+    kind, _, arg = spec.partition(":")
+    if kind == "sn":
+        return capture_server.HardwareBackend(arg)
+    if kind == "server":
+        return capture_server.CaptureClient(capture_server.parse_address(arg))
+    if kind == "sim":
+        return capture_server.SimulatedBackend(seed=int(arg) if arg else None)
+    raise ValueError(f"unknown device {spec!r}")
+
+
+def load_window(path=WINDOW_FILE):
+    """adc settings of the campaign (capture_window.txt if present)."""
+    adc = {"samples": SAMPLES, "decimate": DECIMATE, "offset": OFFSET,
+           "presamples": 0, "timeout": 2}
+    if os.path.exists(path):
+        ns = {}
+        with open(path, "r") as f:
+            exec(f.read(), {}, ns)
+        adc["samples"] = ns.get("SAMPLES", adc["samples"])
+        adc["decimate"] = ns.get("DECIMATE", adc["decimate"])
+        adc["offset"] = ns.get("OFFSET", adc["offset"])
+        print(f"[INFO] Capture window from {path}: OFFSET={adc['offset']}, "
+              f"SAMPLES={adc['samples']}, DECIMATE={adc['decimate']}")
+    return adc
+
+
+# ========== worker ==========
+
+def device_worker(dev, spec, adc, tasks, results):
+    """Capture chunks from tasks until it is empty; one message per chunk."""
+    try:
+        device = open_device(spec)
+        device.configure(**adc)
+        device.reset()
+    except Exception as e:
+        results.put(("error", dev, f"open failed: {e}"))
+        results.put(("done", dev))
+        return
+
+    try:
+        while True:
+            try:
+                start, pts = tasks.get(timeout=1.0)
+            except queue.Empty:
+                break
+            t0 = time.time()
+            try:
+                captured = [device.capture(pt.to_bytes(8, "big")) for pt in pts]
+            except Exception as e:
+                tasks.put((start, pts))
+                results.put(("error", dev, f"{type(e).__name__}: {e}"))
+                return
+            keep = [i for i, (trace, _) in enumerate(captured) if trace is not None]
+            results.put(("chunk", dev, start,
+                         np.array([captured[i][0] for i in keep]),
+                         np.array([pts[i] for i in keep], dtype=np.uint64),
+                         np.array([int.from_bytes(captured[i][1], "big") for i in keep],
+                                  dtype=np.uint64),
+                         len(pts), time.time() - t0))
+    finally:
+        device.close()
+        results.put(("done", dev))
+
+
+# ========== campaign ==========
+
+def run_campaign(pts, devices, adc, chunk=CHUNK, tm=None):
+    """
+    Capture pts (list of ints) on all devices.
+    Returns (traces, plaintexts, ciphertexts, device_idx) in plaintext order.
+    """
+    tm = tm or Telemetry("campaign")
+    tasks = Queue()
+    results = Queue()
+    for start in range(0, len(pts), chunk):
+        tasks.put((start, pts[start:start + chunk]))
+
+    workers = [Process(target=device_worker, args=(dev, spec, adc, tasks, results))
+               for dev, spec in enumerate(devices)]
+    for w in workers:
+        w.start()
+
+    parts = {}
+    busy = np.zeros(len(devices))
+    done = 0
+    captured = 0
+    with tm.phase("capture"):
+        while done < len(workers):
+            msg = results.get()
+            if msg[0] == "done":
+                done += 1
+            elif msg[0] == "error":
+                print(f"[WARN] Device {msg[1]} ({devices[msg[1]]}): {msg[2]}")
+            else:
+                _, dev, start, traces, used, cts, n_sent, seconds = msg
+                parts[start] = (traces, used, cts, np.full(len(used), dev, dtype=np.uint8))
+                busy[dev] += seconds
+                captured += n_sent
+                tm.count(f"traces_dev{dev}", len(used))
+                tm.count("timeouts", n_sent - len(used))
+                tm.progress("capture", captured, len(pts), "plaintexts")
+    for w in workers:
+        w.join()
+
+    missing = len(pts) - captured
+    if missing:
+        print(f"[WARN] {missing} plaintexts were not captured (no device left)")
+    for dev, spec in enumerate(devices):
+        n = tm.counters.get(f"traces_dev{dev}", 0)
+        rate = n / busy[dev] if busy[dev] > 0 else 0.0
+        print(f"  device {dev} ({spec}): {n} traces, {rate:.1f} traces/s")
+        tm.set(f"rate_dev{dev}", rate)
+
+    if not parts:
+        return None
+    ordered = [parts[start] for start in sorted(parts)]
+    return tuple(np.concatenate([p[i] for p in ordered]) for i in range(4))
+
+
+def save_store(out_dir, devices, traces, pts, cts, device_idx):
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "traces_all_cpa.npy"), traces)
+    np.save(os.path.join(out_dir, "plaintexts_all_cpa.npy"), pts)
+    np.save(os.path.join(out_dir, "ciphertexts_all_cpa.npy"), cts)
+    np.save(os.path.join(out_dir, "devices_all_cpa.npy"), device_idx)
+    with open(os.path.join(out_dir, "devices.txt"), "w") as f:
+        for dev, spec in enumerate(devices):
+            f.write(f"{dev} {spec}\n")
+
+
+def main():
+    args = sys.argv[1:]
+    opts = {"devices": ",".join(DEVICES), "chunk": CHUNK, "out": OUT_DIR,
+            "plaintexts": "uniform"}
+    try:
+        for flag, conv in (("--devices", str), ("--chunk", int), ("--out", str),
+                           ("--plaintexts", str)):
+            if flag in args:
+                i = args.index(flag)
+                opts[flag[2:]] = conv(args[i + 1])
+                del args[i:i + 2]
+        if len(args) != 1 or opts["plaintexts"] not in ("uniform", "balanced"):
+            raise ValueError
+        n_traces = int(args[0])
+        if n_traces <= 0 or opts["chunk"] <= 0:
+            raise ValueError
+    except (ValueError, IndexError):
+        print(f"Usage: {sys.argv[0]} <n_traces> [--devices SPEC,SPEC,...] [--chunk C] "
+              f"[--out DIR] [--plaintexts uniform|balanced]")
+        print("  SPEC = sn:SERIAL | server:HOST:PORT | sim[:SEED]")
+        sys.exit(1)
+
+    devices = opts["devices"].split(",")
+    adc = load_window()
+    pts = plaintexts.generate(opts["plaintexts"], n_traces)
+    print(f"[INFO] {n_traces} plaintexts in chunks of {opts['chunk']} "
+          f"-> {len(devices)} devices")
+
+    tm = Telemetry("campaign")
+    tm.set("devices", devices)
+    merged = run_campaign(pts, devices, adc, opts["chunk"], tm)
+    if merged is None:
+        print("[ERROR] No traces captured.")
+        sys.exit(1)
+
+    traces, used, cts, device_idx = merged
+    with tm.phase("save"):
+        save_store(opts["out"], devices, traces, used, cts, device_idx)
+    tm.set("n_traces", len(traces))
+    print(f"[INFO] Saved {traces.shape} traces tagged by device to {opts['out']}/")
+    tm.write()
+
+
+if __name__ == "__main__":
+    main()
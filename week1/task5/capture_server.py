@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Long-running capture server that owns the ChipWhisperer scope and target.
+
+The USB enumeration, default_setup() and target reset happen once when
+the server starts; capture scripts then connect over a local socket
+(multiprocessing.connection, like distribute.py) and start at once on a
+warm device:
+
+  python3 capture_server.py [[HOST:]PORT] [--sim] [--sn SERIAL]
+
+  --sim  : simulated backend instead of the hardware (HW leakage of the
+           round-1 S-box outputs of the key in full_key.txt + noise),
+           so the capture scripts can be run and tested without a board
+
+RPC requests are (method, kwargs) tuples, answered with ("ok", result)
+or ("error", message):
+
+  configure      samples / decimate / offset / presamples / timeout
+  reset          toggle nRST
+  capture        pt -> (trace, ct), (None, None) on timeout
+  capture_batch  pts -> [(trace, ct), ...]
+  stream         pts -> one ("trace", i, trace, ct) message per capture,
+                 then ("ok", n)
+  bootloader     STM32 BOOT0 + reset + 0x7F/0x79 sync
+  write / read / flush   raw target UART (bootloader commands)
+  status         backend, captures served, uptime, current config
+  shutdown       release the device and stop the server
+
+Client side, connect() returns scope/target stand-ins with the subset of
+the ChipWhisperer API the capture scripts use (adc.*, io.nrst, arm,
+capture, get_last_trace, simpleserial_write/read, write/read, dis), so
+init_scope() only has to swap them in. CaptureClient also has
+capture_batch()/stream() for whole plaintext lists.
+
+The server binds to 127.0.0.1 unless HOST is given. Requests are pickled,
+so server and clients share a secret key (authkey.py: DES_SCA_AUTHKEY or a
+key file); there is no built-in one.
+"""
+import sys
+import time
+import types
+import numpy as np
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from authkey import load_authkey
+
+
+# --------- config ---------
+ADDRESS = ("127.0.0.1", 6010)
+CW_SERIAL = "442031204c5032433130333234313031"
+
+# simulated backend
+SIM_NOISE = 3.0             # Gaussian noise sigma per sample
+SIM_LEAK_START = 3810       # absolute sample of the S-box 1 leakage
+SIM_LEAK_STEP = 20          # samples between the 8 S-box leakages
+# --------------------------
+
+
+ADC_FIELDS = ("samples", "decimate", "offset", "presamples", "timeout")
+
+
+# ========== backends ==========
+
+class HardwareBackend:
+    """The real CW-Lite + STM32 target."""
+
+    name = "hardware"
+
+    def __init__(self, sn=CW_SERIAL):
+        import chipwhisperer as cw
+        self.cw = cw
+        self.scope = cw.scope(sn=sn)
+        self.target = cw.target(self.scope)
+        self.scope.default_setup()
+        self.stm32 = None
+
+    def configure(self, **adc):
+        for name, value in adc.items():
+            setattr(self.scope.adc, name, value)
+
+    def reset(self):
+        self.scope.io.nrst = "low"
+        time.sleep(0.05)
+        self.scope.io.nrst = "high_z"
+        time.sleep(0.05)
+
+    def capture(self, pt):
+        self.scope.arm()
+        self.target.simpleserial_write('d', pt)
+        if self.scope.capture():
+            return None, None
+        ct = bytes(self.target.simpleserial_read('r', 8))
+        return np.array(self.scope.get_last_trace(), dtype=float), ct
+
+    def bootloader(self, baud=9600):
+        """BOOT0=1 + reset + 0x7F/0x79 sync (as in week2 dump_bootloader.py)."""
+        if self.stm32 is None:
+            prog = self.cw.programmers.STM32FProgrammer()
+            prog.scope = self.scope
+            self.stm32 = prog.stm32prog()
+            self.stm32.scope = self.scope
+        self.stm32.set_boot(True)
+        self.stm32.reset()
+        self.stm32.open_port(baud=baud)
+        self.target.flush()
+        self.target.write('\x7F')
+        resp = self.target.read(1)
+        if resp != '\x79':
+            raise RuntimeError(f"Bootloader sync failed, got {repr(resp)}")
+
+    def write(self, data):
+        self.target.write(data)
+
+    def read(self, n):
+        return self.target.read(n)
+
+    def flush(self):
+        self.target.flush()
+
+    def close(self):
+        self.scope.dis()
+        self.target.dis()
+
+
+class SimulatedBackend:
+    """
+    Stand-in for the hardware: DES with the key in full_key.txt, one
+    leaking sample per round-1 S-box (HW of its output) at
+    SIM_LEAK_START + s * SIM_LEAK_STEP, Gaussian noise everywhere.
+    """
+
+    name = "simulated"
+
+    def __init__(self, key=None, noise=SIM_NOISE, seed=None):
+        from cpa_engine import HW_TABLE, sbox_outputs, KEY_FILE
+        from key_schedule import round_subkey
+        import des_bitslice
+        if key is None:
+            with open(KEY_FILE, "r") as f:
+                key = int(f.read().strip(), 16)
+        self.key = key
+        self.k1 = round_subkey(key, 1)
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.adc = {"samples": 5000, "decimate": 1, "offset": 0, "presamples": 0, "timeout": 2}
+        self._hw, self._sbox_outputs, self._des = HW_TABLE, sbox_outputs, des_bitslice
+        self._uart = []
+
+    def configure(self, **adc):
+        self.adc.update(adc)
+
+    def reset(self):
+        pass
+
+    def capture(self, pt):
+        pt_int = np.array([int.from_bytes(bytes(pt), "big")], dtype=np.uint64)
+        n, dec, off = self.adc["samples"], self.adc["decimate"], self.adc["offset"]
+        trace = self.rng.normal(0, self.noise, n)
+        for s in range(1, 9):
+            i = (SIM_LEAK_START + (s - 1) * SIM_LEAK_STEP - off) // dec
+            if 0 <= i < n:
+                guess = (self.k1 >> ((8 - s) * 6)) & 0x3F
+                trace[i] += self._hw[self._sbox_outputs(pt_int, s)[guess, 0]]
+        ct = int(self._des.encrypt(np.uint64(self.key), pt_int)[0]).to_bytes(8, "big")
+        return trace, ct
+
+    def bootloader(self, baud=9600):
+        self._uart = []
+
+    def write(self, data):
+        self._uart.append(data)
+
+    def read(self, n):
+        return '\x79' * n          # every bootloader command is ACKed
+
+    def flush(self):
+        self._uart = []
+
+    def close(self):
+        pass
+
+
+# ========== server ==========
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or ADDRESS[0], int(port)
+
+
+def handle(conn, backend, stats):
+    """Serve the requests of one client until it disconnects; True on shutdown."""
+    while True:
+        try:
+            method, kwargs = conn.recv()
+        except (EOFError, OSError):
+            return False
+        try:
+            if method == "shutdown":
+                conn.send(("ok", None))
+                return True
+            if method == "stream":
+                for i, pt in enumerate(kwargs["pts"]):
+                    conn.send(("trace", i) + backend.capture(pt))
+                stats["captures"] += len(kwargs["pts"])
+                conn.send(("ok", len(kwargs["pts"])))
+            elif method == "capture_batch":
+                result = [backend.capture(pt) for pt in kwargs["pts"]]
+                stats["captures"] += len(result)
+                conn.send(("ok", result))
+            elif method == "status":
+                conn.send(("ok", {"backend": backend.name, **stats,
+                                  "uptime_s": time.time() - stats["started"],
+                                  "adc": stats["adc"]}))
+            elif method in ("configure", "reset", "capture", "bootloader",
+                            "write", "read", "flush"):
+                result = getattr(backend, method)(**kwargs)
+                if method == "capture":
+                    stats["captures"] += 1
+                elif method == "configure":
+                    stats["adc"].update(kwargs)
+                conn.send(("ok", result))
+            else:
+                conn.send(("error", f"unknown method {method!r}"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def serve(address, backend, authkey):
+    stats = {"captures": 0, "clients": 0, "started": time.time(), "adc": {}}
+    backend.reset()
+    with Listener(address, authkey=authkey) as listener:
+        print(f"[INFO] Capture server ({backend.name}) listening on {address[0]}:{address[1]}")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, OSError, EOFError) as e:
+                    print(f"[WARN] Rejected connection: {type(e).__name__}: {e}")
+                    continue
+                with conn:
+                    stats["clients"] += 1
+                    print(f"[INFO] Client {stats['clients']} from {listener.last_accepted}")
+                    try:
+                        done = handle(conn, backend, stats)
+                    except OSError as e:
+                        print(f"[WARN] Client {stats['clients']} lost: {e}")
+                        continue
+                    if done:
+                        print("[INFO] Shutdown requested")
+                        break
+        except KeyboardInterrupt:
+            print("\n[INFO] Interrupted")
+        finally:
+            backend.close()
+    print(f"[INFO] Served {stats['captures']} captures to {stats['clients']} clients")
+
+
+# ========== client ==========
+
+class CaptureClient:
+    """
+    One connection to the capture server. Has the backend interface
+    (configure, reset, capture, close), so a server can stand in for a
+    local device (campaign.py).
+    """
+
+    def __init__(self, address=ADDRESS, authkey=None):
+        self.conn = Client(address, authkey=authkey or load_authkey())
+
+    def call(self, method, **kwargs):
+        self.conn.send((method, kwargs))
+        status, result = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"capture server: {result}")
+        return result
+
+    def configure(self, **adc):
+        return self.call("configure", **adc)
+
+    def reset(self):
+        return self.call("reset")
+
+    def capture(self, pt):
+        return self.call("capture", pt=bytes(pt))
+
+    def capture_batch(self, pts):
+        return self.call("capture_batch", pts=[bytes(p) for p in pts])
+
+    def stream(self, pts):
+        """Yields (i, trace, ct) as the server captures them."""
+        self.conn.send(("stream", {"pts": [bytes(p) for p in pts]}))
+        while True:
+            msg = self.conn.recv()
+            if msg[0] == "trace":
+                yield msg[1:]
+            elif msg[0] == "ok":
+                return
+            else:
+                raise RuntimeError(f"capture server: {msg[1]}")
+
+    def close(self):
+        self.conn.close()
+
+
+class RemoteScope:
+    """scope stand-in: adc settings are sent with the next capture."""
+
+    def __init__(self, client):
+        self.client = client
+        self.adc = types.SimpleNamespace(samples=5000, decimate=1, offset=0,
+                                         presamples=0, timeout=2)
+        self.io = RemoteIO(client)
+        self._sent = {}
+        self._pt = None
+        self._trace = None
+        self._ct = None
+
+    def arm(self):
+        pass
+
+    def capture(self):
+        """True on timeout, like scope.capture()."""
+        adc = {name: getattr(self.adc, name) for name in ADC_FIELDS}
+        if adc != self._sent:
+            self.client.configure(**adc)
+            self._sent = adc
+        self._trace, self._ct = self.client.capture(self._pt)
+        return self._trace is None
+
+    def get_last_trace(self):
+        return self._trace
+
+    def dis(self):
+        self.client.close()
+
+
+class RemoteIO:
+    def __init__(self, client):
+        self._client = client
+
+    @property
+    def nrst(self):
+        return None
+
+    @nrst.setter
+    def nrst(self, value):
+        # the server toggles nRST itself; act on the release
+        if value == "high_z":
+            self._client.call("reset")
+
+
+class RemoteTarget:
+    """target stand-in for simpleserial 'd'/'r' and raw bootloader UART."""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.client = scope.client
+
+    def simpleserial_write(self, cmd, data):
+        self.scope._pt = bytes(data)
+
+    def simpleserial_read(self, cmd, n):
+        return bytearray(self.scope._ct[:n])
+
+    def bootloader(self, baud=9600):
+        self.client.call("bootloader", baud=baud)
+
+    def write(self, data):
+        self.client.call("write", data=data)
+
+    def read(self, n):
+        return self.client.call("read", n=n)
+
+    def flush(self):
+        self.client.call("flush")
+
+    def dis(self):
+        pass
+
+
+def connect(address=ADDRESS):
+    """(scope, target) stand-ins on a running capture server."""
+    scope = RemoteScope(CaptureClient(address))
+    return scope, RemoteTarget(scope)
+
+
+def main():
+    args = sys.argv[1:]
+    use_sim = "--sim" in args
+    args = [a for a in args if a != "--sim"]
+    sn = CW_SERIAL
+    try:
+        if "--sn" in args:
+            i = args.index("--sn")
+            sn = args[i + 1]
+            del args[i:i + 2]
+        if len(args) > 1:
+            raise ValueError
+        address = parse_address(args[0]) if args else ADDRESS
+    except (ValueError, IndexError):
+        print(f"Usage: {sys.argv[0]} [[HOST:]PORT] [--sim] [--sn SERIAL]")
+        sys.exit(1)
+
+    try:
+        authkey = load_authkey()
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    t0 = time.time()
+    backend = SimulatedBackend() if use_sim else HardwareBackend(sn)
+    print(f"[INFO] {backend.name} backend ready in {time.time() - t0:.2f} s")
+    serve(address, backend, authkey)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,14 @@ import sys
 import time
 import numpy as np
 import chipwhisperer as cw
+from multiprocessing import AuthenticationError
 
-from sbox_out import sbox_out
+from cpa_engine import run_cpa, center_traces, write_candidates_file, EarlyStopMonitor, DTYPES
+from quality_gate import TraceQualityGate, RunningStat
+from sbox_pool import run_sboxes, print_timings
+from telemetry import Telemetry
+import plaintexts
+import capture_server
 
 
 # --------- config ---------
@@ -15,20 +21,54 @@ TRACES_DIR = "traces_cpa"
 SAMPLES = 200        # number of ADC samples per trace
 DECIMATE = 1
 OFFSET = 3800        # start sample index
+
+# written by locate_window.py; overrides SAMPLES/DECIMATE/OFFSET if present
+WINDOW_FILE = "capture_window.txt"
+
+# adaptive capture (--adaptive K): default confidence and stability
+EARLY_STOP_Z = 3.0       # lead of top guess in Fisher-z units
+EARLY_STOP_CHECKS = 3    # consecutive checks the lead must hold
+
+# quality gate (disable with --no-gate): re-captures of a rejected plaintext
+MAX_RECAPTURES = 3
+
+# worker processes for the 8 S-box CPAs (--jobs J, 1 = serial)
+JOBS = os.cpu_count() or 1
+
+# analysis precision (--float32): float32 traces/GEMM, uint8 hypotheses
+PRECISION = "float64"
+
+# plaintext strategy (--plaintexts): uniform | balanced | adaptive (needs --adaptive K)
+PLAINTEXT_MODE = "uniform"
+
+# "HOST:PORT" of a running capture_server.py (--server); None = open the USB device
+CAPTURE_SERVER = None
 # --------------------------
 
 
 scope = None
 target = None
 
+# per-phase timers/counters; per-trace and per-guess lines only with --verbose
+tm = Telemetry("cpa")
+
 
 # ========== ChipWhisperer setup ==========
 
 def init_scope():
     global scope, target
+    if CAPTURE_SERVER:
+        # warm device owned by capture_server.py: no enumeration/setup here
+        try:
+            scope, target = capture_server.connect(capture_server.parse_address(CAPTURE_SERVER))
+        except (OSError, EOFError, RuntimeError, AuthenticationError) as e:
+            print(f"[ERROR] Could not connect to capture server {CAPTURE_SERVER}:", e)
+            raise
+        print(f"[INFO] Using capture server {CAPTURE_SERVER} ✅")
+        return
     try:
         # use your board serial number if needed, or remove sn=... for auto-detect
-        scope = cw.scope(sn="442031204c5032433130333234313031")
+        scope = cw.scope(sn=capture_server.CW_SERIAL)
         target = cw.target(scope)
         scope.default_setup()
         print("[INFO] Found ChipWhisperer ✅")
@@ -37,6 +77,21 @@ def init_scope():
         raise
 
 
+def load_capture_window(path=WINDOW_FILE):
+    """Use the OFFSET/SAMPLES/DECIMATE found by locate_window.py, if any."""
+    global OFFSET, SAMPLES, DECIMATE
+    if not os.path.exists(path):
+        return
+    ns = {}
+    with open(path, "r") as f:
+        exec(f.read(), {}, ns)
+    OFFSET = ns.get("OFFSET", OFFSET)
+    SAMPLES = ns.get("SAMPLES", SAMPLES)
+    DECIMATE = ns.get("DECIMATE", DECIMATE)
+    print(f"[INFO] Capture window from {path}: "
+          f"OFFSET={OFFSET}, SAMPLES={SAMPLES}, DECIMATE={DECIMATE}")
+
+
 def reset_target():
     global scope
     scope.io.nrst = "low"
@@ -45,13 +100,15 @@ def reset_target():
     time.sleep(0.05)
 
 
-def capture_one_trace(pt_bytes, idx):
+def capture_one_trace(pt_bytes, idx, save=True):
     """
     Capture ONE trace for 8-byte plaintext pt_bytes with:
       - samples = SAMPLES
       - decimate = DECIMATE
       - offset   = OFFSET
-    Returns the trace as a 1D NumPy array or None on timeout.
+    Returns (trace, ciphertext) with the trace as a 1D NumPy array
+    and the 8-byte ciphertext, or (None, None) on timeout.
+    save=False skips the per-trace .npy file.
     """
     global scope, target
 
@@ -61,92 +118,116 @@ def capture_one_trace(pt_bytes, idx):
     scope.adc.presamples = 0
     scope.adc.timeout = 2
 
-    print(f"\n[INFO] Capturing trace {idx}")
-    print("  pt      =", pt_bytes.hex())
-    print("  samples =", scope.adc.samples)
-    print("  decim   =", scope.adc.decimate)
-    print("  offset  =", scope.adc.offset)
+    tm.log(f"\n[INFO] Capturing trace {idx}")
+    tm.log("  pt      =", pt_bytes.hex())
+    tm.log("  samples =", scope.adc.samples)
+    tm.log("  decim   =", scope.adc.decimate)
+    tm.log("  offset  =", scope.adc.offset)
 
     scope.arm()
     target.simpleserial_write('d', pt_bytes)
-    # ct = target.simpleserial_read('r', 8)
-    # print("  ct      =", ct.hex())
+    tm.count("captures")
 
     if scope.capture():
-        print("[ERROR] Capture timed out")
-        return None
+        tm.count("timeouts")
+        tm.log("[ERROR] Capture timed out")
+        return None, None
+
+    ct = target.simpleserial_read('r', 8)
+    tm.log("  ct      =", ct.hex())
 
     trace = np.array(scope.get_last_trace(), dtype=float)
-    print("  trace length =", len(trace))
+    tm.log("  trace length =", len(trace))
 
     # optionally save per-trace
-    os.makedirs(TRACES_DIR, exist_ok=True)
-    np.save(os.path.join(TRACES_DIR, f"trace_{idx:04d}.npy"), trace)
+    if save:
+        save_trace(idx, trace)
 
-    return trace
+    return trace, ct
 
 
-# ========== helper functions ==========
+def save_trace(idx, trace):
+    """Per-trace .npy file in TRACES_DIR (bytes are counted in the telemetry)."""
+    os.makedirs(TRACES_DIR, exist_ok=True)
+    np.save(os.path.join(TRACES_DIR, f"trace_{idx:04d}.npy"), trace)
+    tm.count("bytes_written", trace.nbytes)
 
-def generate_random_plaintexts(n):
+
+def capture_good_trace(pt_bytes, idx, gate, save=True):
     """
-    Generate n random 64-bit plaintexts using os.urandom.
-    Returns a list of integers.
+    capture_one_trace() behind the quality gate: a timed-out or rejected
+    trace is re-captured with the same plaintext, up to MAX_RECAPTURES
+    times. Returns (trace, ciphertext) or (None, None).
     """
-    pts = []
-    for _ in range(n):
-        val = int.from_bytes(os.urandom(8), "big")  # 64-bit
-        pts.append(val)
-    print(f"[INFO] Generated {n} random plaintexts in memory")
-    return pts
+    for attempt in range(MAX_RECAPTURES + 1):
+        trace, ct = capture_one_trace(pt_bytes, idx, save=False)
+        reason = gate.check(trace)
+        if reason is None:
+            if save:
+                save_trace(idx, trace)
+            return trace, ct
+        if attempt < MAX_RECAPTURES:
+            print(f"[WARN] Trace {idx} rejected ({reason}), "
+                  f"re-capture {attempt + 1}/{MAX_RECAPTURES}")
+    print(f"[WARN] Trace {idx} rejected {MAX_RECAPTURES + 1} times, giving up.")
+    return None, None
+
+
+def capture_averaged_trace(pt_bytes, idx, repeats, gate=None):
+    """
+    Capture `repeats` traces of the same plaintext and average them on the
+    fly (quality_gate.RunningStat, Welford), so only one buffer is kept.
+    Timed-out repetitions are skipped; with a gate every repetition goes
+    through capture_good_trace().
 
+    Returns (mean, variance, ciphertext), or (None, None, None) if every
+    repetition timed out.
+    """
+    stat = RunningStat()
+    ct = None
+
+    for _ in range(repeats):
+        if gate is not None:
+            trace, ct_r = capture_good_trace(pt_bytes, idx, gate, save=False)
+        else:
+            trace, ct_r = capture_one_trace(pt_bytes, idx, save=False)
+        if trace is None:
+            continue
+        stat.add(trace)
+        ct = ct_r
 
-def plaintext_int_to_bytes(pt_int):
-    """Convert 64-bit integer plaintext to 8-byte big-endian for serial send."""
-    return pt_int.to_bytes(8, "big")
+    if stat.n == 0:
+        return None, None, None
 
+    tm.log(f"  averaged {stat.n}/{repeats} repetitions")
 
-def hamming_weight(x):
-    """Hamming weight of an integer (number of '1' bits)."""
-    return bin(x).count("1")
+    save_trace(idx, stat.mean)
+    return stat.mean, stat.variance(), ct
 
 
-# ========== CPA helper: precompute hypothetical power (N x 64) for any S-box ==========
+# ========== helper functions ==========
 
-def precompute_hypothetical_hw_for_sbox(sbox_num, plaintexts_int):
+def generate_random_plaintexts(n, mode="uniform"):
     """
-    For a given S-box (1..8):
-    Build a matrix HW[guess_k][trace_index] = HW( sbox_out(sbox_num, PT[trace_index], guess_k) )
-
-    This matches your structure:
-
-    (P0, k0)   -> HW(...)
-    (P1, k0)   -> HW(...)
-    ...
-    (P(N-1), k0)
-    ...
-    (P(N-1), k63)
+    Generate n 64-bit plaintexts with a plaintexts.py strategy
+    ("adaptive" starts with balanced blocks). Returns a list of integers.
     """
-    num_traces = len(plaintexts_int)
-    hw_table = np.array([hamming_weight(v) for v in range(16)], dtype=float)
-
-    hyp_hw = np.zeros((64, num_traces), dtype=float)
+    pts = plaintexts.generate("balanced" if mode == "adaptive" else mode, n)
+    print(f"[INFO] Generated {n} {mode} plaintexts in memory")
+    return pts
 
-    print(f"\n[INFO] Precomputing hypothetical HW for S-box {sbox_num}...")
-    for guess_k in range(64):
-        for i, pt_int in enumerate(plaintexts_int):
-            sbox_val = sbox_out(sbox_num, pt_int, guess_k)  # 0..15
-            hyp_hw[guess_k, i] = hw_table[sbox_val]
-        print(f"  S{sbox_num} key={guess_k:02d} done")
 
-    return hyp_hw
+def plaintext_int_to_bytes(pt_int):
+    """Convert 64-bit integer plaintext to 8-byte big-endian for serial send."""
+    return pt_int.to_bytes(8, "big")
 
 
 # ========== CPA on a single S-box ==========
 
-def run_cpa_for_sbox(traces, plaintexts_int, sbox_num):
+def run_cpa_for_sbox(traces, plaintexts_int, sbox_num, centered=False, dtype=np.float64):
     """
-    traces: NumPy array of shape (num_traces, trace_len)
+    traces: NumPy array of shape (num_traces, trace_len), or the
+            center_traces() of it with centered=True
     plaintexts_int: list of 64-bit int plaintexts (same order as traces)
     sbox_num: which S-box (1..8)
 
@@ -155,118 +236,128 @@ def run_cpa_for_sbox(traces, plaintexts_int, sbox_num):
       - for each sample j, correlate X with Y_j = traces[:, j]
       - keep the max |correlation| over j as the score of key k
 
+    All 64 guesses are correlated at once in cpa_engine (one matrix product).
+
     Returns:
       results: list of (key, max_abs_corr, best_sample_index), sorted by corr desc
     """
     num_traces, trace_len = traces.shape
     print(f"\n[INFO] CPA on S-box {sbox_num} with {num_traces} traces, trace_len={trace_len}")
 
-    # 1) Precompute hypothetical HW matrix for this S-box (shape: 64 x num_traces)
-    hyp_hw = precompute_hypothetical_hw_for_sbox(sbox_num, plaintexts_int)
-
-    # 2) Prepare trace matrix Y and center it once
-    Y = traces.astype(float)
-    Y_mean = np.mean(Y, axis=0)           # per-sample mean
-    Yc = Y - Y_mean                       # centered traces
-    denom_y = np.sqrt(np.sum(Yc**2, axis=0))  # per-sample norm
-    denom_y[denom_y == 0] = np.inf        # avoid division by zero
-
-    results = []
-
-    print(f"\n[INFO] Computing correlations for each key guess on S-box {sbox_num}...")
-    for guess_k in range(64):
-        X = hyp_hw[guess_k]               # length num_traces
-        X_mean = np.mean(X)
-        Xc = X - X_mean
-        denom_x = np.sqrt(np.sum(Xc**2))
-        if denom_x == 0:
-            print(f"  S{sbox_num} key={guess_k:02d}: zero variance in X, skipping")
-            continue
-
-        # numerator for each sample j: sum_i Xc[i] * Yc[i, j]
-        numer = Yc.T @ Xc                 # shape (trace_len,)
-
-        corr_vec = numer / (denom_x * denom_y)  # Pearson correlation per sample
-        abs_corr = np.abs(corr_vec)
-
-        best_idx = int(np.argmax(abs_corr))
-        best_val = float(abs_corr[best_idx])
-        sign_corr = float(corr_vec[best_idx])
+    results = run_cpa(traces, np.array(plaintexts_int, dtype=np.uint64), sbox_num,
+                      centered, dtype)
 
-        print(f"  S{sbox_num} key={guess_k:02d}: "
-              f"max |corr|={best_val:.6f} at sample {best_idx} "
-              f"(corr={sign_corr:.6f})")
+    for guess_k, best_val, best_idx in sorted(results):
+        tm.log(f"  S{sbox_num} key={guess_k:02d}: "
+               f"max |corr|={best_val:.6f} at sample {best_idx}")
 
-        results.append((guess_k, best_val, best_idx))
-
-    # sort keys by correlation score (descending)
-    results.sort(key=lambda x: x[1], reverse=True)
     return results
 
 
-# ========== main: capture phase + CPA phase ==========
+def run_cpa_centered(centered_traces, plaintexts_int, sbox_num):
+    """
+    run_cpa_for_sbox() on the shared centered traces (sbox_pool worker);
+    the precision is the dtype of the centered matrix.
+    """
+    return run_cpa_for_sbox(centered_traces, plaintexts_int, sbox_num, centered=True,
+                            dtype=centered_traces.dtype.type)
 
-def main():
-    # ----- parse command line: ./cpa.py <n_traces> -----
-    if len(sys.argv) != 2:
-        print(f"Usage: {sys.argv[0]} <n_traces>")
-        sys.exit(1)
 
-    try:
-        n_traces = int(sys.argv[1])
-        if n_traces <= 0:
-            raise ValueError
-    except ValueError:
-        print("[ERROR] <n_traces> must be a positive integer")
-        sys.exit(1)
+def run_cpa_all_sboxes(traces, plaintexts_int, jobs=JOBS, dtype=np.float64):
+    """
+    CPA on S-boxes 1..8. The traces are centered once (in dtype); with
+    jobs > 1 the centered matrix goes to shared memory and the S-boxes run
+    in worker processes (same function, same results as the serial loop).
+    """
+    centered = center_traces(traces, dtype)
+    tm.count("correlations", 8 * 64 * centered.shape[1])
+    if jobs <= 1:
+        return {sbox_num: run_cpa_centered(centered, plaintexts_int, sbox_num)
+                for sbox_num in range(1, 9)}
 
-    print(f"[INFO] Requested {n_traces} traces")
+    t0 = time.time()
+    all_results, timings = run_sboxes(run_cpa_centered, centered, plaintexts_int, jobs)
+    print(f"\n[INFO] CPA timings ({jobs} workers):")
+    print_timings(timings, time.time() - t0)
+    return all_results
 
-    # ----- generate plaintexts in memory -----
-    plaintexts_int_all = generate_random_plaintexts(n_traces)
 
-    # ----- Capture phase -----
-    init_scope()
-    reset_target()
+# ========== capture loop ==========
 
+def capture_traces(plaintexts_int_all, monitor=None, check_every=None, repeats=1,
+                   gate=None, choose=False):
+    """
+    Capture one trace per plaintext (the mean of `repeats` captures if
+    repeats > 1; the per-sample variances are then collected as well).
+    With a gate (quality_gate.TraceQualityGate) bad captures are rejected
+    and re-captured before they reach traces_list.
+    With a monitor (cpa_engine.EarlyStopMonitor) the online key ranking is
+    checked every check_every captured traces, and capture stops as soon
+    as the monitor reports a stable ranking. With choose=True the next
+    check_every plaintexts are then replaced by plaintexts.adaptive() on
+    the monitor's running CPA.
+
+    Returns (traces_list, used_plaintexts_int, used_ciphertexts_int,
+    variances_list); variances_list is empty when repeats == 1.
+    """
     traces_list = []
+    variances_list = []
     used_plaintexts_int = []
+    used_ciphertexts_int = []
+    last_check = 0
 
-    for idx, pt_int in enumerate(plaintexts_int_all):
+    for idx in range(len(plaintexts_int_all)):
+        pt_int = plaintexts_int_all[idx]
         pt_bytes = plaintext_int_to_bytes(pt_int)
-        trace = capture_one_trace(pt_bytes, idx)
-
+        if repeats > 1:
+            trace, variance, ct = capture_averaged_trace(pt_bytes, idx, repeats, gate)
+        elif gate is not None:
+            trace, ct = capture_good_trace(pt_bytes, idx, gate)
+            variance = None
+        else:
+            trace, ct = capture_one_trace(pt_bytes, idx)
+            variance = None
+
+        tm.progress("capture", idx + 1, len(plaintexts_int_all), "plaintexts")
         if trace is None:
             print(f"[WARN] Skipping plaintext index {idx} due to capture error.")
             continue
 
         traces_list.append(trace)
+        if variance is not None:
+            variances_list.append(variance)
         used_plaintexts_int.append(pt_int)
+        used_ciphertexts_int.append(int.from_bytes(ct, "big"))
 
-    if len(traces_list) == 0:
-        print("[ERROR] No traces captured, aborting CPA.")
-        scope.dis()
-        target.dis()
-        return
+        if monitor is not None and len(traces_list) - last_check >= check_every:
+            monitor.update(np.array(used_plaintexts_int[last_check:], dtype=np.uint64),
+                           np.vstack(traces_list[last_check:]))
+            last_check = len(traces_list)
+            if monitor.check():
+                print(f"[INFO] Key ranking stable after {last_check} traces, stopping capture.")
+                break
+            if choose:
+                nxt = slice(idx + 1, min(idx + 1 + check_every, len(plaintexts_int_all)))
+                plaintexts_int_all[nxt] = [int(p) for p in plaintexts.adaptive(
+                    nxt.stop - nxt.start, monitor.acc)]
 
-    traces = np.vstack(traces_list)
-    plaintexts_int = used_plaintexts_int
+    return traces_list, used_plaintexts_int, used_ciphertexts_int, variances_list
 
-    # (optional) save combined arrays
-    os.makedirs(TRACES_DIR, exist_ok=True)
-    np.save(os.path.join(TRACES_DIR, "traces_all_cpa.npy"), traces)
-    np.save(os.path.join(TRACES_DIR, "plaintexts_all_cpa.npy"),
-            np.array(plaintexts_int, dtype=np.uint64))
 
-    print(f"\n[INFO] Capture done. Traces shape = {traces.shape}")
-    print(f"[INFO] Starting CPA phase on all 8 S-boxes.")
+# ========== results ==========
 
-    # ----- CPA phase for S-boxes 1..8 -----
-    all_results = {}
-
-    for sbox_num in range(1, 9):
-        sbox_results = run_cpa_for_sbox(traces, plaintexts_int, sbox_num)
-        all_results[sbox_num] = sbox_results
+def write_results(all_results):
+    """
+    Save the 8 x 64 score table, print the top 5 candidates per S-box and
+    write them to sbox_out.txt.
+    """
+    # full score table (8 x 64 max |corr|) for key_rank.py
+    scores = np.zeros((8, 64))
+    for sbox_num, sbox_results in all_results.items():
+        for key, max_corr, _ in sbox_results:
+            scores[sbox_num - 1, key] = max_corr
+    os.makedirs(TRACES_DIR, exist_ok=True)
+    np.save(os.path.join(TRACES_DIR, "cpa_scores.npy"), scores)
 
     # print top 5 candidates for each S-box
     print("\n=== CPA top 5 keys per S-box ===")
@@ -292,15 +383,160 @@ def main():
 
     # ----- NEW PART: write Python array of candidates to sbox_out.txt -----
     out_filename = "sbox_out.txt"
-    with open(out_filename, "w") as f:
-        f.write("CANDIDATES_HEX = [\n")
-        for row in candidates_hex:
-            # format like ["0x27", "0x2C", ...]
-            row_str = ", ".join(f'"{x}"' for x in row)
-            f.write(f"    [{row_str}],\n")
-        f.write("]\n")
+    write_candidates_file(out_filename, candidates_hex)
     print(f"\n[INFO] Written S-box key candidates to {out_filename}")
 
+
+# ========== main: capture phase + CPA phase ==========
+
+def parse_args(argv):
+    """
+    ./cpa.py <n_traces> [--adaptive K] [--margin M] [--z Z] [--stable C] [--repeat R]
+             [--no-gate] [--jobs J] [--float32] [--verbose]
+             [--plaintexts uniform|balanced|adaptive] [--server [HOST:]PORT]
+
+    --adaptive K : check the online key ranking every K traces and stop
+                   early (n_traces is then the maximum)
+    --margin M   : required lead of the top guess in max |corr|
+    --z Z        : required lead in Fisher-z units (default EARLY_STOP_Z
+                   if neither --margin nor --z is given)
+    --stable C   : number of consecutive checks the lead must hold
+    --repeat R   : capture each plaintext R times and keep mean + variance
+    --no-gate    : store every trace without the quality gate
+    --jobs J     : worker processes for the 8 S-box CPAs (1 = serial)
+    --float32    : float32 traces and products, uint8 hypotheses (half the
+                   memory; sums/norms stay float64)
+    --verbose    : per-trace and per-guess lines (default: rate-limited
+                   progress and a metrics record in metrics.jsonl)
+    --plaintexts : plaintext strategy (plaintexts.py); "adaptive" picks the
+                   plaintexts of every check period from the running CPA
+                   and needs --adaptive K (a few % fewer traces, and only
+                   at high noise: see plaintexts.py)
+    --server     : capture through a running capture_server.py
+    """
+    opts = {"adaptive": None, "margin": None, "z": None, "stable": EARLY_STOP_CHECKS,
+            "repeat": 1, "jobs": JOBS, "plaintexts": PLAINTEXT_MODE,
+            "server": CAPTURE_SERVER}
+    args = list(argv[1:])
+    opts["gate"] = "--no-gate" not in args
+    opts["dtype"] = DTYPES["float32" if "--float32" in args else PRECISION]
+    opts["verbose"] = "--verbose" in args
+    args = [a for a in args if a not in ("--no-gate", "--float32", "--verbose")]
+    for name, conv in (("adaptive", int), ("margin", float), ("z", float), ("stable", int),
+                       ("repeat", int), ("jobs", int), ("plaintexts", str),
+                       ("server", str)):
+        flag = "--" + name
+        if flag in args:
+            i = args.index(flag)
+            opts[name] = conv(args[i + 1])
+            del args[i:i + 2]
+
+    if len(args) != 1:
+        raise ValueError
+    n_traces = int(args[0])
+    if n_traces <= 0 or opts["repeat"] <= 0 or opts["jobs"] <= 0:
+        raise ValueError
+    if opts["adaptive"] is not None and opts["adaptive"] <= 0:
+        raise ValueError
+    if opts["plaintexts"] not in plaintexts.MODES:
+        raise ValueError
+    if opts["plaintexts"] == "adaptive" and opts["adaptive"] is None:
+        raise ValueError
+    if opts["margin"] is None and opts["z"] is None:
+        opts["z"] = EARLY_STOP_Z
+    return n_traces, opts
+
+
+def main():
+    global CAPTURE_SERVER
+    # ----- parse command line -----
+    try:
+        n_traces, opts = parse_args(sys.argv)
+    except (ValueError, IndexError):
+        print(f"Usage: {sys.argv[0]} <n_traces> [--adaptive K] [--margin M] [--z Z] "
+              f"[--stable C] [--repeat R] [--no-gate] [--jobs J] [--float32] [--verbose] "
+              f"[--plaintexts uniform|balanced|adaptive] [--server [HOST:]PORT]")
+        print("[ERROR] <n_traces>, K and R must be positive integers")
+        sys.exit(1)
+
+    print(f"[INFO] Requested {n_traces} traces")
+    tm.verbose = opts["verbose"]
+    CAPTURE_SERVER = opts["server"]
+    load_capture_window()
+
+    # ----- generate plaintexts in memory -----
+    plaintexts_int_all = generate_random_plaintexts(n_traces, opts["plaintexts"])
+
+    # ----- Capture phase -----
+    init_scope()
+    reset_target()
+
+    monitor = None
+    if opts["adaptive"] is not None:
+        monitor = EarlyStopMonitor(SAMPLES, margin=opts["margin"], z=opts["z"],
+                                   stable_checks=opts["stable"], dtype=opts["dtype"])
+        print(f"[INFO] Adaptive capture: check every {opts['adaptive']} traces, "
+              f"margin={opts['margin']}, z={opts['z']}, stable={opts['stable']}")
+
+    if opts["repeat"] > 1:
+        print(f"[INFO] Averaging {opts['repeat']} captures per plaintext")
+    gate = TraceQualityGate() if opts["gate"] else None
+    with tm.phase("capture"):
+        traces_list, plaintexts_int, used_ciphertexts_int, variances_list = capture_traces(
+            plaintexts_int_all, monitor, opts["adaptive"], opts["repeat"], gate,
+            choose=opts["plaintexts"] == "adaptive")
+    if gate is not None:
+        print(gate.report())
+
+    if len(traces_list) == 0:
+        print("[ERROR] No traces captured, aborting CPA.")
+        scope.dis()
+        target.dis()
+        tm.set("n_traces", 0)
+        tm.write()
+        return
+
+    traces = np.vstack(traces_list)
+
+    # in adaptive mode the ranking is already there: write sbox_out.txt first
+    # (unless fewer than one check period was captured)
+    ranked = monitor is not None and monitor.acc.n > 0
+    if ranked:
+        if monitor.acc.n < len(traces_list):
+            monitor.update(np.array(plaintexts_int[monitor.acc.n:], dtype=np.uint64),
+                           traces[monitor.acc.n:])
+        write_results(monitor.results())
+
+    # (optional) save combined arrays
+    os.makedirs(TRACES_DIR, exist_ok=True)
+    arrays = {
+        "traces_all_cpa.npy": traces,
+        "plaintexts_all_cpa.npy": np.array(plaintexts_int, dtype=np.uint64),
+        # ciphertexts are kept for the round-16 attack (cpa_k16.py)
+        "ciphertexts_all_cpa.npy": np.array(used_ciphertexts_int, dtype=np.uint64),
+    }
+    if variances_list:
+        # per-sample variance over the repetitions of each plaintext
+        arrays["traces_var_cpa.npy"] = np.vstack(variances_list)
+    with tm.phase("save"):
+        for name, arr in arrays.items():
+            np.save(os.path.join(TRACES_DIR, name), arr)
+            tm.count("bytes_saved", arr.nbytes)
+
+    print(f"\n[INFO] Capture done. Traces shape = {traces.shape}")
+    tm.set("n_traces", traces.shape[0])
+    tm.set("trace_len", traces.shape[1])
+
+    if not ranked:
+        print(f"[INFO] Starting CPA phase on all 8 S-boxes.")
+
+        # ----- CPA phase for S-boxes 1..8 -----
+        with tm.phase("cpa"):
+            all_results = run_cpa_all_sboxes(traces, plaintexts_int, opts["jobs"],
+                                             opts["dtype"])
+        write_results(all_results)
+    tm.write()
+
     # cleanup
     scope.dis()
     target.dis()
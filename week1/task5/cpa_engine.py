@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Vectorized CPA engine shared by cpa.py (round 1, plaintexts) and
+cpa_k16.py (round 16, ciphertexts).
+
+No ChipWhisperer import here, so the analysis can run on any machine that
+has the saved trace arrays.
+"""
+import os
+import numpy as np
+
+from sbox_out import SBOXES, IP_E_PERM
+from key_schedule import round_subkey
+from accumulators import CpaAccumulator
+
+KEY_FILE = os.path.join(os.path.dirname(__file__), ".", "full_key.txt")
+
+# compute precisions (--float32 in the scripts): traces / GEMM operands
+DTYPES = {"float64": np.float64, "float32": np.float32}
+
+
+# ========== tables ==========
+
+# HW of every 4-bit S-box output
+HW_TABLE = np.array([bin(v).count("1") for v in range(16)], dtype=np.uint8)
+
+# SBOX_LUT[s][x] = S-box (s+1) output for the 6-bit input x (b0 = MSB)
+# row = b0 b5, col = b1..b4, exactly like sbox_out()
+SBOX_LUT = np.array([
+    [sbox[(((x >> 5) & 1) << 1 | (x & 1)) * 16 + ((x >> 1) & 0xF)]
+     for x in range(64)]
+    for sbox in SBOXES
+], dtype=np.uint8)
+
+# block -> IP -> R half (bits 33..64) -> E: all 8 S-box chunks (48 bits)
+CHUNK_SRC = IP_E_PERM
+
+# ========== hypothesis builders ==========
+
+def sbox_inputs(blocks, sbox_num, src=CHUNK_SRC):
+    """
+    blocks: array-like of 64-bit integers (plaintexts for round 1,
+            ciphertexts for round 16)
+    Returns the 6-bit E(R) chunk of S-box sbox_num for every block
+    (before the key XOR) as a uint8 array.
+    """
+    e48 = src.array(blocks)
+    return ((e48 >> np.uint64((8 - sbox_num) * 6)) & np.uint64(0x3F)).astype(np.uint8)
+
+
+def sbox_outputs(blocks, sbox_num, src=CHUNK_SRC):
+    """
+    Returns a (64, N) uint8 matrix OUT[guess, i] = S-box output for
+    block i and 6-bit subkey guess (same as sbox_out() for every pair).
+    """
+    chunk = sbox_inputs(blocks, sbox_num, src)
+    guesses = np.arange(64, dtype=np.uint8)[:, None]
+    return SBOX_LUT[sbox_num - 1][chunk[None, :] ^ guesses]
+
+
+def hypothetical_hw(blocks, sbox_num, dtype=float):
+    """(64, N) matrix HW[guess, i] = HW(S-box output) (0..4, exact in np.uint8)."""
+    return HW_TABLE[sbox_outputs(blocks, sbox_num)].astype(dtype)
+
+
+# ========== correlation ==========
+
+def center_traces(traces, dtype=np.float64):
+    """
+    (N, trace_len) traces minus their per-sample mean, stored as dtype.
+    The mean is always accumulated in float64, so float32 traces lose
+    nothing to the sum over N.
+    """
+    Y = np.asarray(traces, dtype=dtype)
+    return Y - Y.mean(axis=0, dtype=np.float64).astype(dtype)
+
+
+def correlate(traces, hyp, centered=False, dtype=np.float64):
+    """
+    traces: (N, trace_len) array (already center_traces()-ed if centered=True)
+    hyp:    (G, N) hypothesis matrix (one row per key guess), e.g. uint8
+    dtype:  precision of the centered operands and of the matrix product;
+            with float32 only the GEMM runs in float32 (on centered data),
+            the norms are accumulated in float64.
+
+    Returns a (G, trace_len) matrix of Pearson correlations.
+    Rows with zero variance come back as 0.
+    """
+    Yc = np.asarray(traces, dtype=dtype) if centered else center_traces(traces, dtype)
+    denom_y = np.sqrt(np.sum(Yc**2, axis=0, dtype=np.float64))
+    denom_y[denom_y == 0] = np.inf
+
+    X = np.asarray(hyp)
+    Xc = (X - X.mean(axis=1, keepdims=True, dtype=np.float64)).astype(dtype)
+    denom_x = np.sqrt(np.sum(Xc**2, axis=1, dtype=np.float64))
+    denom_x[denom_x == 0] = np.inf
+
+    return (Xc @ Yc) / (denom_x[:, None] * denom_y[None, :])
+
+
+def all_sbox_hypotheses(blocks, dtype=float):
+    """(8*64, N) stack of hypothetical_hw() for S-box 1..8 (row = 64*(s-1)+guess)."""
+    return np.vstack([hypothetical_hw(blocks, s, dtype) for s in range(1, 9)])
+
+
+def rank_guesses(corr):
+    """
+    corr: (G, trace_len) correlation matrix
+    Returns a list of (key, max_abs_corr, best_sample_index),
+    sorted by max |corr| descending.
+    """
+    abs_corr = np.abs(corr)
+    best_idx = np.argmax(abs_corr, axis=1)
+    best_val = abs_corr[np.arange(abs_corr.shape[0]), best_idx]
+
+    results = [(k, float(best_val[k]), int(best_idx[k]))
+               for k in range(abs_corr.shape[0])]
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results
+
+
+def run_cpa(traces, blocks, sbox_num, centered=False, dtype=np.float64):
+    """CPA on one S-box: returns rank_guesses() of HW(S-box out) vs. traces."""
+    hyp_hw = hypothetical_hw(blocks, sbox_num, np.uint8)
+    return rank_guesses(correlate(traces, hyp_hw, centered, dtype))
+
+
+def results_from_correlation(corr):
+    """(8*64, trace_len) correlation -> {sbox_num: rank_guesses(...)}."""
+    return {s: rank_guesses(corr[64 * (s - 1):64 * s]) for s in range(1, 9)}
+
+
+class EarlyStopMonitor:
+    """
+    Online key ranking during capture.
+
+    Traces are added in blocks to a CpaAccumulator for all 8 S-boxes.
+    check() looks at the top two guesses of every S-box; a check counts as
+    "held" when the top guess is the same as at the previous check and its
+    lead is at least `margin` in max |corr| and/or `z` in Fisher-z units:
+        z = (atanh(r1) - atanh(r2)) * sqrt((N - 3) / 2)
+    Capture can stop once every S-box has held for `stable_checks` checks.
+    """
+
+    def __init__(self, trace_len, margin=None, z=None, stable_checks=3, dtype=np.float64):
+        self.acc = CpaAccumulator(8 * 64, trace_len, dtype)
+        self.margin = margin
+        self.z = z
+        self.stable_checks = stable_checks
+        self.last_top = [None] * 8
+        self.streak = [0] * 8
+
+    def update(self, plaintexts, traces):
+        self.acc.update(all_sbox_hypotheses(plaintexts, np.uint8), traces)
+
+    def check(self):
+        """Returns True once every S-box top guess has been stable long enough."""
+        n = self.acc.n
+        results = results_from_correlation(self.acc.correlation())
+        for s in range(8):
+            (k1, r1, _), (_, r2, _) = results[s + 1][:2]
+            ok = True
+            if self.margin is not None:
+                ok &= (r1 - r2) >= self.margin
+            if self.z is not None:
+                z = (np.arctanh(min(r1, 1 - 1e-12)) - np.arctanh(r2)) * np.sqrt(max(n - 3, 1) / 2)
+                ok &= z >= self.z
+
+            if ok and k1 == self.last_top[s]:
+                self.streak[s] += 1
+            else:
+                self.streak[s] = 1 if ok else 0
+            self.last_top[s] = k1
+
+        print(f"[INFO] N={n}: top={[f'0x{k:02X}' for k in self.last_top]} "
+              f"streak={self.streak}")
+        return min(self.streak) >= self.stable_checks
+
+    def results(self):
+        return results_from_correlation(self.acc.correlation())
+
+
+# ========== DPA ==========
+
+def dpa_difference(traces, sel, dtype=np.float64):
+    """
+    traces: (N, trace_len) array
+    sel:    (G, N) 0/1 selection matrix (one row per key guess)
+    dtype:  precision of the matrix product; with float32 the traces are
+            centered first (the difference of means does not change), so
+            the float32 sums never hold the large DC part of the traces.
+
+    Returns a (G, trace_len) matrix |mean(traces | sel=1) - mean(traces | sel=0)|
+    for all guesses at once. Rows with an empty group come back as 0.
+    """
+    if dtype == np.float64:
+        Y = np.asarray(traces, dtype=float)
+    else:
+        Y = center_traces(traces, dtype)
+    S = np.asarray(sel, dtype=dtype)
+    n_one = S.sum(axis=1, dtype=np.float64)
+    n_zero = S.shape[1] - n_one
+
+    sum_one = S @ Y
+    sum_zero = Y.sum(axis=0, dtype=np.float64)[None, :] - sum_one
+
+    valid = (n_one > 0) & (n_zero > 0)
+    n_one[~valid] = 1
+    n_zero[~valid] = 1
+    diff = np.abs(sum_one / n_one[:, None] - sum_zero / n_zero[:, None])
+    diff[~valid] = 0
+    return diff
+
+
+def lsb_selection(blocks, sbox_num):
+    """(64, N) matrix LSB(S-box out), the selection bit used by dpa.py."""
+    return sbox_outputs(blocks, sbox_num) & 1
+
+
+def run_dpa(traces, blocks, sbox_num, dtype=np.float64):
+    """DPA on one S-box: returns rank_guesses() of the difference of means."""
+    return rank_guesses(dpa_difference(traces, lsb_selection(blocks, sbox_num), dtype))
+
+
+# ========== evaluation against a known key ==========
+
+def load_known_k1(path=KEY_FILE):
+    """Read the 64-bit key from full_key.txt and return the 8 K1 chunks."""
+    with open(path, "r") as f:
+        key64 = int(f.read().strip(), 16)
+    k1 = round_subkey(key64, 1)
+    return [(k1 >> ((7 - s) * 6)) & 0x3F for s in range(8)]
+
+
+def rank_and_margin(corr, correct_keys):
+    """
+    corr: (8*64, trace_len) correlation of all S-box hypotheses
+    Returns (ranks, margins), one entry per S-box:
+      rank   = 1 + number of guesses with higher max |corr| than the correct one
+      margin = max |corr| of correct key - best max |corr| of the other keys
+    """
+    scores = np.max(np.abs(corr), axis=1).reshape(8, 64)
+    ranks = []
+    margins = []
+    for s in range(8):
+        correct = scores[s, correct_keys[s]]
+        others = np.delete(scores[s], correct_keys[s])
+        ranks.append(1 + int(np.sum(others > correct)))
+        margins.append(float(correct - others.max()))
+    return ranks, margins
+
+
+# ========== trace set I/O ==========
+
+def load_trace_set(traces_dir):
+    """
+    Load the combined arrays written by cpa.py:
+      traces_all_cpa.npy, plaintexts_all_cpa.npy, ciphertexts_all_cpa.npy
+    The ciphertext array is optional (older captures did not store it);
+    it is returned as None when missing.
+    """
+    traces = np.load(os.path.join(traces_dir, "traces_all_cpa.npy"))
+    plaintexts = np.load(os.path.join(traces_dir, "plaintexts_all_cpa.npy"))
+
+    ct_path = os.path.join(traces_dir, "ciphertexts_all_cpa.npy")
+    ciphertexts = np.load(ct_path) if os.path.exists(ct_path) else None
+    return traces, plaintexts, ciphertexts
+
+
+def write_candidates_file(path, candidates_hex, name="CANDIDATES_HEX"):
+    """Write a Python array of hex candidates (one row per S-box)."""
+    with open(path, "w") as f:
+        f.write(f"{name} = [\n")
+        for row in candidates_hex:
+            # format like ["0x27", "0x2C", ...]
+            row_str = ", ".join(f'"{x}"' for x in row)
+            f.write(f"    [{row_str}],\n")
+        f.write("]\n")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Correct-key rank and correlation margin versus number of traces.
+
+One pass over a saved trace set (cpa.py output): the CPA sums are
+accumulated block by block, and at every checkpoint N = k, 2k, ... the
+correlation is computed from the running (prefix) sums, so no CPA is
+re-run from scratch.
+
+Usage:
+  python3 cpa_evolution.py <step_k> [traces_dir]
+
+The known key is read from full_key.txt (0x... 64-bit key).
+Writes rank_evolution.txt (table) and rank_evolution.png (plot).
+"""
+import sys
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from cpa_engine import (CpaAccumulator, all_sbox_hypotheses, load_trace_set,
+                        load_known_k1, rank_and_margin)
+
+
+# --------- config ---------
+TRACES_DIR = "traces_cpa"
+OUT_TABLE = "rank_evolution.txt"
+OUT_PLOT = "rank_evolution.png"
+# --------------------------
+
+
+def rank_evolution(traces, plaintexts, correct_keys, step):
+    """
+    Returns (checkpoints, ranks, margins) with ranks/margins of shape
+    (n_checkpoints, 8).
+    """
+    num_traces, trace_len = traces.shape
+    acc = CpaAccumulator(8 * 64, trace_len)
+
+    checkpoints, ranks, margins = [], [], []
+    for start in range(0, num_traces, step):
+        stop = min(start + step, num_traces)
+        hyp = all_sbox_hypotheses(plaintexts[start:stop])
+        acc.update(hyp, traces[start:stop])
+
+        r, m = rank_and_margin(acc.correlation(), correct_keys)
+        checkpoints.append(stop)
+        ranks.append(r)
+        margins.append(m)
+        print(f"  N={stop:6d}: ranks={r}")
+
+    return np.array(checkpoints), np.array(ranks), np.array(margins)
+
+
+def write_table(path, checkpoints, ranks, margins):
+    with open(path, "w") as f:
+        header = "N".rjust(7) + "".join(f"   S{s}rank  S{s}margin" for s in range(1, 9))
+        f.write(header + "\n")
+        for n, r, m in zip(checkpoints, ranks, margins):
+            row = f"{n:7d}" + "".join(f"  {r[s]:7d}  {m[s]:+9.5f}" for s in range(8))
+            f.write(row + "\n")
+
+
+def plot_evolution(path, checkpoints, ranks, margins):
+    fig, (ax_r, ax_m) = plt.subplots(2, 1, figsize=(12, 7), sharex=True)
+    for s in range(8):
+        ax_r.plot(checkpoints, ranks[:, s], marker=".", label=f"S{s + 1}")
+        ax_m.plot(checkpoints, margins[:, s], marker=".", label=f"S{s + 1}")
+
+    ax_r.set_yscale("log")
+    ax_r.set_ylabel("Correct-key rank")
+    ax_r.set_title("CPA rank and margin vs. number of traces")
+    ax_r.grid(alpha=0.3)
+    ax_r.legend(ncol=8, fontsize=8)
+
+    ax_m.axhline(0, color="black", linewidth=0.8)
+    ax_m.set_xlabel("Number of traces N")
+    ax_m.set_ylabel("max|corr| margin")
+    ax_m.grid(alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.close()
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print(f"Usage: {sys.argv[0]} <step_k> [traces_dir]")
+        sys.exit(1)
+
+    try:
+        step = int(sys.argv[1])
+        if step <= 0:
+            raise ValueError
+    except ValueError:
+        print("[ERROR] <step_k> must be a positive integer")
+        sys.exit(1)
+    traces_dir = sys.argv[2] if len(sys.argv) == 3 else TRACES_DIR
+
+    traces, plaintexts, _ = load_trace_set(traces_dir)
+    correct_keys = load_known_k1()
+    print(f"[INFO] Loaded traces {traces.shape} from {traces_dir}")
+    print(f"[INFO] Known K1 chunks: {[f'0x{k:02X}' for k in correct_keys]}")
+
+    checkpoints, ranks, margins = rank_evolution(traces, plaintexts, correct_keys, step)
+
+    write_table(OUT_TABLE, checkpoints, ranks, margins)
+    print(f"[INFO] Written table to {OUT_TABLE}")
+    plot_evolution(OUT_PLOT, checkpoints, ranks, margins)
+    print(f"[INFO] Saved plot to {OUT_PLOT}")
+
+
+if __name__ == "__main__":
+    main()
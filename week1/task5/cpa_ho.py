@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Second-order CPA on a trace set saved by cpa.py (for masked firmware).
+
+With a Boolean mask m, one sample leaks HW(m) and another HW(S-box out ^ m),
+so no single sample correlates with the hypothesis. Pairs of samples (i, j)
+are combined into one value that does:
+  prod    : (x_i - mean_i) * (x_j - mean_j)     centered product
+  absdiff : |(x_i - mean_i) - (x_j - mean_j)|   absolute difference
+and the combined "traces" are correlated against the usual round-1
+HW(S-box out) hypotheses of all 8 S-boxes.
+
+The pairs are restricted to a POI set (the n_poi highest-variance samples
+inside --window) and generated block by block (BLOCK_PAIRS pairs at a
+time), keeping only the best |corr| and its pair per guess, so memory is
+N x BLOCK_PAIRS regardless of the number of pairs.
+
+Usage:
+  python3 cpa_ho.py [traces_dir] [--window START:STOP] [--poi N]
+                    [--combine prod|absdiff] [--block B]
+
+Writes the candidates to sbox_out_ho.txt in the same format as sbox_out.txt.
+"""
+import sys
+import time
+import numpy as np
+
+from cpa_engine import all_sbox_hypotheses, load_trace_set, write_candidates_file
+
+
+# --------- config ---------
+TRACES_DIR = "traces_cpa"
+OUT_FILE = "sbox_out_ho.txt"
+N_POI = 200             # 200 POIs -> 19900 pairs
+BLOCK_PAIRS = 4096      # pairs combined per block
+COMBINE = "prod"
+TOP_N = 5
+# --------------------------
+
+
+# ========== POIs and pairs ==========
+
+def select_pois(traces, window, n_poi):
+    """Indices of the n_poi highest-variance samples in window (sorted)."""
+    start, stop = window
+    var = traces[:, start:stop].var(axis=0)
+    n_poi = min(n_poi, stop - start)
+    return start + np.sort(np.argsort(var)[::-1][:n_poi])
+
+
+def pair_blocks(n, block_pairs):
+    """
+    Yields (i, j) index arrays of at most block_pairs pairs each, covering
+    all pairs i < j of range(n) row by row (never all pairs at once).
+    """
+    bi, bj, size = [], [], 0
+    for i in range(n - 1):
+        j = np.arange(i + 1, n)
+        while len(j):
+            take = j[:block_pairs - size]
+            j = j[len(take):]
+            bi.append(np.full(len(take), i))
+            bj.append(take)
+            size += len(take)
+            if size == block_pairs:
+                yield np.concatenate(bi), np.concatenate(bj)
+                bi, bj, size = [], [], 0
+    if size:
+        yield np.concatenate(bi), np.concatenate(bj)
+
+
+def combine_pairs(centered, i, j, mode):
+    """centered: (N, n_poi) centered POI samples -> (N, len(i)) combined."""
+    if mode == "prod":
+        return centered[:, i] * centered[:, j]
+    if mode == "absdiff":
+        return np.abs(centered[:, i] - centered[:, j])
+    raise ValueError(f"unknown combination {mode!r}")
+
+
+# ========== second-order CPA ==========
+
+def normalize_rows(X):
+    """Center and scale every row to unit norm (zero rows stay 0)."""
+    Xc = X - X.mean(axis=1, keepdims=True)
+    norm = np.sqrt(np.sum(Xc**2, axis=1, keepdims=True))
+    norm[norm == 0] = np.inf
+    return Xc / norm
+
+
+def second_order_cpa(traces, plaintexts, pois, mode=COMBINE, block_pairs=BLOCK_PAIRS):
+    """
+    Returns (best_corr, best_i, best_j): for all 8*64 guesses the best
+    |corr| over all POI pairs and the sample indices of that pair.
+    """
+    hyp = normalize_rows(all_sbox_hypotheses(plaintexts).astype(float))   # (512, N)
+    x = traces[:, pois].astype(float)
+    centered = x - x.mean(axis=0)
+
+    n_guesses = hyp.shape[0]
+    best_corr = np.zeros(n_guesses)
+    best_i = np.zeros(n_guesses, dtype=int)
+    best_j = np.zeros(n_guesses, dtype=int)
+
+    for i, j in pair_blocks(len(pois), block_pairs):
+        comb = normalize_rows(combine_pairs(centered, i, j, mode).T)        # (B, N)
+        corr = np.abs(hyp @ comb.T)                                         # (512, B)
+        idx = np.argmax(corr, axis=1)
+        val = corr[np.arange(n_guesses), idx]
+        better = val > best_corr
+        best_corr[better] = val[better]
+        best_i[better] = pois[i[idx[better]]]
+        best_j[better] = pois[j[idx[better]]]
+
+    return best_corr, best_i, best_j
+
+
+def rank_pairs(best_corr, best_i, best_j, sbox_num):
+    """List of (key, max_abs_corr, (i, j)) for one S-box, best first."""
+    base = 64 * (sbox_num - 1)
+    results = [(k, float(best_corr[base + k]), (int(best_i[base + k]), int(best_j[base + k])))
+               for k in range(64)]
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results
+
+
+# ========== main ==========
+
+def parse_args(argv):
+    opts = {"window": None, "poi": N_POI, "combine": COMBINE, "block": BLOCK_PAIRS}
+    args = list(argv)
+    for flag, conv in (("--window", str), ("--poi", int), ("--combine", str), ("--block", int)):
+        if flag in args:
+            i = args.index(flag)
+            opts[flag[2:]] = conv(args[i + 1])
+            del args[i:i + 2]
+    if len(args) > 1 or opts["combine"] not in ("prod", "absdiff"):
+        raise ValueError
+    if opts["block"] <= 0 or opts["poi"] <= 0:
+        raise ValueError
+    if opts["window"] is not None:
+        start, stop = opts["window"].split(":")
+        opts["window"] = (int(start), int(stop))
+    opts["traces_dir"] = args[0] if args else TRACES_DIR
+    return opts
+
+
+def main():
+    try:
+        opts = parse_args(sys.argv[1:])
+    except (ValueError, IndexError):
+        print(f"Usage: {sys.argv[0]} [traces_dir] [--window START:STOP] [--poi N] "
+              f"[--combine prod|absdiff] [--block B]")
+        print("[ERROR] N and B must be positive integers")
+        sys.exit(1)
+
+    traces, plaintexts, _ = load_trace_set(opts["traces_dir"])
+    print(f"[INFO] Loaded traces {traces.shape} from {opts['traces_dir']}")
+
+    window = opts["window"] or (0, traces.shape[1])
+    pois = select_pois(traces, window, opts["poi"])
+    n_pairs = len(pois) * (len(pois) - 1) // 2
+    print(f"[INFO] {len(pois)} POIs in samples {window[0]}:{window[1]} -> "
+          f"{n_pairs} pairs, combine={opts['combine']}, block={opts['block']}")
+
+    t0 = time.time()
+    best_corr, best_i, best_j = second_order_cpa(traces, plaintexts, pois,
+                                                 opts["combine"], opts["block"])
+    print(f"[INFO] Second-order CPA done in {time.time() - t0:.1f} s")
+
+    candidates_hex = []
+    print("\n=== Second-order CPA top keys per S-box ===")
+    for sbox_num in range(1, 9):
+        results = rank_pairs(best_corr, best_i, best_j, sbox_num)
+        print(f"\n[S-box {sbox_num}]")
+        row_hex = []
+        for rank, (key, max_corr, (i, j)) in enumerate(results[:TOP_N], start=1):
+            print(f"  #{rank}: key=0x{key:02X} (dec={key:2d}), "
+                  f"max_abs_corr={max_corr:.6f}, samples=({i}, {j})")
+            row_hex.append(f"0x{key:02X}")
+        candidates_hex.append(row_hex)
+
+    write_candidates_file(OUT_FILE, candidates_hex)
+    print(f"\n[INFO] Written S-box key candidates to {OUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
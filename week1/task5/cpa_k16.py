@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Round-16 CPA on a trace set saved by cpa.py.
+
+Uses the stored ciphertexts instead of the plaintexts:
+  IP(ct) = R16 || L16 and L16 = R15, so the round-16 S-box input is
+  E(L16) ^ K16, and the hypothesis is HW(S-box out) like in round 1.
+
+Writes the K16 candidates to sbox_out_k16.txt in the same format as
+sbox_out.txt, so find_full_key.py can combine K1 and K16.
+
+Note: the capture window has to cover round 16 (OFFSET/SAMPLES in cpa.py
+are set for round 1).
+"""
+import sys
+
+from cpa_engine import (hypothetical_hw, correlate, rank_guesses,
+                        load_trace_set, write_candidates_file)
+
+
+# --------- config ---------
+TRACES_DIR = "traces_cpa"
+OUT_FILE = "sbox_out_k16.txt"
+TOP_N = 5
+# --------------------------
+
+
+def run_cpa_k16_for_sbox(traces, ciphertexts, sbox_num):
+    """
+    Same as run_cpa_for_sbox in cpa.py, but with the round-16 hypothesis:
+    HW( S-box_out(E(L16) ^ K16_guess) ) computed from the ciphertexts.
+    """
+    num_traces, trace_len = traces.shape
+    print(f"\n[INFO] K16 CPA on S-box {sbox_num} with {num_traces} traces, "
+          f"trace_len={trace_len}")
+
+    hyp_hw = hypothetical_hw(ciphertexts, sbox_num)
+    return rank_guesses(correlate(traces, hyp_hw))
+
+
+def main():
+    # ----- parse command line: ./cpa_k16.py [traces_dir] -----
+    if len(sys.argv) > 2:
+        print(f"Usage: {sys.argv[0]} [traces_dir]")
+        sys.exit(1)
+    traces_dir = sys.argv[1] if len(sys.argv) == 2 else TRACES_DIR
+
+    traces, _, ciphertexts = load_trace_set(traces_dir)
+    if ciphertexts is None:
+        print(f"[ERROR] No ciphertexts_all_cpa.npy in {traces_dir}; "
+              f"re-capture with the current cpa.py.")
+        sys.exit(1)
+    print(f"[INFO] Loaded traces {traces.shape} from {traces_dir}")
+
+    candidates_hex = []
+    print("\n=== K16 CPA top keys per S-box ===")
+    for sbox_num in range(1, 9):
+        results = run_cpa_k16_for_sbox(traces, ciphertexts, sbox_num)
+
+        row_hex = []
+        for rank, (key, max_corr, idx) in enumerate(results[:TOP_N], start=1):
+            print(f"  #{rank}: key=0x{key:02X} (dec={key:2d}), "
+                  f"max_abs_corr={max_corr:.6f}, sample={idx}")
+            row_hex.append(f"0x{key:02X}")
+        candidates_hex.append(row_hex)
+
+    write_candidates_file(OUT_FILE, candidates_hex)
+    print(f"\n[INFO] Written K16 S-box key candidates to {OUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Bitsliced DES on NumPy uint64 lanes.
+
+A batch of N blocks is stored as a (64, W) uint64 array with W = ceil(N/64):
+row i holds bit i (MSB first) of every block, one block per bit lane.
+Permutations are then plain row gathers, XOR with the key is a row-wise
+XOR, and the eight S-boxes are evaluated together from their algebraic
+normal form (AND of inputs, XOR of monomials).
+
+Every key/plaintext pair may differ, so the same engine serves the full
+key search (many keys, one plaintext), batch verification and the
+simulated capture backend (capture_server.SimulatedBackend).
+"""
+import numpy as np
+
+from sbox_out import IP, E_TABLE, P_TABLE, PC1, SBOXES
+from key_schedule import SUBKEY_SRC
+
+
+# ===== tables (0-based row indices) =====
+
+IP_IDX = np.array(IP) - 1
+FP_IDX = np.argsort(IP_IDX)                  # IP^-1
+E_IDX = np.array(E_TABLE) - 1
+P_IDX = np.array(P_TABLE) - 1
+
+# SUBKEY_KEY_IDX[r]: for each bit of K_r, the row (0..63) of the 64-bit key
+SUBKEY_KEY_IDX = [None] + [
+    np.array([PC1[p - 1] - 1 for p in SUBKEY_SRC[r]]) for r in range(1, 17)
+]
+
+ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _anf(truth):
+    """Moebius transform: truth table (64 entries, 0/1) -> ANF coefficients."""
+    a = list(truth)
+    for i in range(6):
+        for m in range(64):
+            if m & (1 << i):
+                a[m] ^= a[m ^ (1 << i)]
+    return a
+
+
+# ANF_MASK[s, j, m] = all-ones if monomial m appears in output bit j of S-box s.
+# Monomial m is the AND of the chunk bits b with bit (5 - b) set in m,
+# i.e. m uses the same bit order as the 6-bit S-box input value.
+def _build_anf_mask():
+    mask = np.zeros((8, 4, 64), dtype=np.uint64)
+    for s, sbox in enumerate(SBOXES):
+        truth_out = []
+        for x in range(64):
+            row = ((x >> 5) & 1) << 1 | (x & 1)
+            col = (x >> 1) & 0xF
+            truth_out.append(sbox[row * 16 + col])
+        for j in range(4):
+            coeffs = _anf([(v >> (3 - j)) & 1 for v in truth_out])
+            mask[s, j] = np.where(np.array(coeffs, dtype=bool), ONES, np.uint64(0))
+    return mask
+
+
+ANF_MASK = _build_anf_mask()
+
+# For monomial m > 0: m = rest | lowest set bit, which input row to AND in
+_MONO_REST = [m & (m - 1) for m in range(64)]
+_MONO_ROW = [6 - (m & -m).bit_length() for m in range(64)]
+
+
+# ===== slicing =====
+
+def to_slices(values, width=64):
+    """
+    values: array-like of unsigned ints (< 2^width)
+    Returns (width, W) uint64 slices; lane k of word w is block 64*w + k.
+    """
+    values = np.asarray(values, dtype=np.uint64).reshape(-1)
+    n = values.shape[0]
+    n_pad = -(-n // 64) * 64
+
+    raw = np.zeros(n_pad, dtype=">u8")
+    raw[:n] = values
+    bits = np.unpackbits(raw.view(np.uint8).reshape(n_pad, 8), axis=1)
+    bits = bits[:, 64 - width:]                          # (n_pad, width)
+
+    packed = np.packbits(np.ascontiguousarray(bits.T), axis=1)   # (width, n_pad/8)
+    return np.ascontiguousarray(packed).view(">u8").astype(np.uint64)
+
+
+def from_slices(slices, n):
+    """Inverse of to_slices: (width, W) slices -> n uint64 values."""
+    width = slices.shape[0]
+    raw = np.ascontiguousarray(slices.astype(">u8")).view(np.uint8)
+    bits = np.unpackbits(raw, axis=1)[:, :n]             # (width, n)
+
+    full = np.zeros((n, 64), dtype=np.uint8)
+    full[:, 64 - width:] = bits.T
+    return np.packbits(full, axis=1).view(">u8").reshape(n).astype(np.uint64)
+
+
+# ===== round function =====
+
+def sboxes(x):
+    """
+    x: (48, W) S-box input slices (after the key XOR)
+    Returns (32, W) S-box output slices (S1 in the top 4 rows).
+    """
+    x = x.reshape(8, 6, -1)
+    mono = np.empty((8, 64, x.shape[2]), dtype=np.uint64)
+    mono[:, 0] = ONES
+    for m in range(1, 64):
+        mono[:, m] = mono[:, _MONO_REST[m]] & x[:, _MONO_ROW[m]]
+
+    # out[s, j] = XOR of the monomials selected by ANF_MASK[s, j]
+    out = np.bitwise_xor.reduce(mono[:, None, :, :] & ANF_MASK[:, :, :, None], axis=2)
+    return out.reshape(32, -1)
+
+
+def feistel(r, subkey):
+    """f(R, K) on slices: r (32, W), subkey (48, W) -> (32, W)."""
+    return sboxes(r[E_IDX] ^ subkey)[P_IDX]
+
+
+def subkey_slices(key_sl, round_num):
+    """(48, W) slices of K_round_num from (64, W) key slices."""
+    return key_sl[SUBKEY_KEY_IDX[round_num]]
+
+
+# ===== encrypt / decrypt =====
+
+def crypt_slices(block_sl, subkeys, keep_states=False):
+    """
+    block_sl: (64, W) input block slices
+    subkeys:  list of (48, W) subkey slices, applied in order
+    Returns (out_sl, states): out_sl is the output after FP (only meaningful
+    for a full 16-round run); states[i] holds L_i||R_i after i rounds
+    (states[0] = IP(block)) when keep_states is True, else None.
+    """
+    lr = block_sl[IP_IDX]
+    left, right = lr[:32], lr[32:]
+    states = [lr] if keep_states else None
+
+    for k in subkeys:
+        left, right = right, left ^ feistel(right, k)
+        if keep_states:
+            states.append(np.concatenate([left, right]))
+
+    out_sl = np.concatenate([right, left])[FP_IDX]
+    return out_sl, states
+
+
+def _broadcast(keys, blocks):
+    keys = np.atleast_1d(np.asarray(keys, dtype=np.uint64))
+    blocks = np.atleast_1d(np.asarray(blocks, dtype=np.uint64))
+    return np.broadcast_arrays(keys, blocks)
+
+
+def encrypt(keys, plaintexts, rounds=16, return_states=False):
+    """
+    keys, plaintexts: uint64 arrays (or scalars) of 64-bit keys/blocks,
+                      broadcast against each other
+    rounds: number of rounds to run (16 = real DES)
+
+    Returns the ciphertexts as uint64 (after swap + FP, i.e. real DES for
+    rounds=16). With return_states=True also returns a (rounds+1, N)
+    uint64 array with L_i||R_i after every round (row 0 = IP(pt)).
+    """
+    keys, plaintexts = _broadcast(keys, plaintexts)
+    n = keys.shape[0]
+
+    key_sl = to_slices(keys)
+    subkeys = [subkey_slices(key_sl, r) for r in range(1, rounds + 1)]
+    out_sl, states = crypt_slices(to_slices(plaintexts), subkeys, return_states)
+
+    out = from_slices(out_sl, n)
+    if return_states:
+        return out, np.stack([from_slices(s, n) for s in states])
+    return out
+
+
+def decrypt(keys, ciphertexts):
+    """Full 16-round DES decryption (subkeys in reverse order)."""
+    keys, ciphertexts = _broadcast(keys, ciphertexts)
+    n = keys.shape[0]
+
+    key_sl = to_slices(keys)
+    subkeys = [subkey_slices(key_sl, r) for r in range(16, 0, -1)]
+    out_sl, _ = crypt_slices(to_slices(ciphertexts), subkeys)
+    return from_slices(out_sl, n)
+
+
+if __name__ == "__main__":
+    import time
+
+    # FIPS 46 example: K=133457799BBCDFF1, PT=0123456789ABCDEF
+    ct = encrypt(0x133457799BBCDFF1, 0x0123456789ABCDEF)[0]
+    print(f"ct = 0x{int(ct):016X}  (expected 0x85E813540F0AB405)")
+    pt = decrypt(0x133457799BBCDFF1, ct)[0]
+    print(f"pt = 0x{int(pt):016X}")
+
+    n = 1 << 16
+    keys = np.random.randint(0, 1 << 63, size=n, dtype=np.uint64)
+    t0 = time.time()
+    encrypt(keys, 0x4142434445464748)
+    dt = time.time() - t0
+    print(f"[INFO] {n} keys in {dt:.3f} s -> {n / dt:,.0f} keys/s")
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Distributed CPA/DPA/SNR analysis of a trace store (cpa.py output).
+
+The trace set is cut into blocks of BLOCK traces. Every block is analyzed
+into mergeable accumulators (accumulators.py):
+  cpa   CpaAccumulator    HW(S-box out) of all 8*64 guesses
+  dpa   DpaAccumulator    LSB(S-box out) selection of all 8*64 guesses
+  snr   ClassSumAccumulator per S-box, classes = 6-bit S-box input chunk
+and the partial results are reduced with merge(), which gives exactly the
+accumulators of the whole set. Blocks go either to a local process pool
+(workers memory-map the .npy files, nothing is copied) or to worker hosts
+started with `distribute.py serve` (blocks are sent over the socket).
+
+The merged accumulators are saved to <traces_dir>/acc_<name>.npz, so a
+later capture can be analyzed on its own and merged in.
+
+Usage:
+  python3 distribute.py <traces_dir> [--workers W] [--hosts HOST:PORT,...] [--block B]
+                        [--float32]
+  python3 distribute.py serve [HOST:]PORT
+
+A worker binds to 127.0.0.1 unless HOST is given (serve 0.0.0.0:PORT to
+accept other machines). The sockets carry pickled objects, so both sides
+need the same secret key (authkey.py: DES_SCA_AUTHKEY or a key file);
+there is no built-in one.
+"""
+import os
+import sys
+import time
+import threading
+import numpy as np
+from multiprocessing import Pool, AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from authkey import load_authkey
+from accumulators import CpaAccumulator, DpaAccumulator, ClassSumAccumulator, merge_all
+from cpa_engine import (all_sbox_hypotheses, sbox_inputs, sbox_outputs,
+                        results_from_correlation, write_candidates_file, DTYPES)
+
+
+# --------- config ---------
+BLOCK = 2000                # traces per work item
+OUT_FILE = "sbox_out.txt"
+TOP_N = 5
+# --------------------------
+
+
+# ========== analysis of one block ==========
+
+def analyze_block(traces, plaintexts, precision="float64"):
+    """Returns {name: accumulator} for one block of traces."""
+    dtype = DTYPES[precision]
+    traces = np.asarray(traces, dtype=dtype)
+    plaintexts = np.asarray(plaintexts, dtype=np.uint64)
+    trace_len = traces.shape[1]
+
+    accs = {"cpa": CpaAccumulator(8 * 64, trace_len, dtype),
+            "dpa": DpaAccumulator(8 * 64, trace_len, dtype)}
+    accs["cpa"].update(all_sbox_hypotheses(plaintexts, np.uint8), traces)
+    accs["dpa"].update(np.vstack([sbox_outputs(plaintexts, s) & 1 for s in range(1, 9)]),
+                       traces)
+    for s in range(1, 9):
+        accs[f"snr{s}"] = ClassSumAccumulator(64, trace_len, dtype)
+        accs[f"snr{s}"].update(sbox_inputs(plaintexts, s), traces)
+    return accs
+
+
+def analyze_range(task):
+    """Pool worker: analyze traces[start:stop] of the store (memory-mapped)."""
+    traces_dir, start, stop, precision = task
+    traces = np.load(os.path.join(traces_dir, "traces_all_cpa.npy"), mmap_mode="r")
+    plaintexts = np.load(os.path.join(traces_dir, "plaintexts_all_cpa.npy"), mmap_mode="r")
+    return analyze_block(traces[start:stop], plaintexts[start:stop], precision)
+
+
+def reduce_results(partials):
+    """Merge a list of {name: accumulator} dicts."""
+    return {name: merge_all(p[name] for p in partials) for name in partials[0]}
+
+
+# ========== worker hosts ==========
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def serve(address, authkey):
+    """Worker host: receive (traces, plaintexts) blocks, return accumulators."""
+    with Listener(address, authkey=authkey) as listener:
+        print(f"[INFO] Worker listening on {address[0]}:{address[1]}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError, EOFError) as e:
+                print(f"[WARN] Rejected connection: {type(e).__name__}: {e}")
+                continue
+            with conn:
+                print(f"[INFO] Connection from {listener.last_accepted}")
+                while True:
+                    try:
+                        traces, plaintexts, precision = conn.recv()
+                    except EOFError:
+                        break
+                    t0 = time.time()
+                    conn.send(analyze_block(traces, plaintexts, precision))
+                    print(f"  block of {len(traces)} traces in {time.time() - t0:.2f} s")
+
+
+def run_on_hosts(hosts, traces, plaintexts, ranges, precision, authkey):
+    """
+    One thread per host pulls ranges from a shared list until it is empty.
+    A host that fails puts its range back; the others wait for ranges in
+    flight until they are done or returned.
+    """
+    pending = list(ranges)
+    partials = []
+    cond = threading.Condition()
+    in_flight = [0]
+    errors = []
+
+    def host_loop(address):
+        task = None
+        try:
+            with Client(address, authkey=authkey) as conn:
+                while True:
+                    with cond:
+                        while not pending and in_flight[0]:
+                            cond.wait()
+                        if not pending:
+                            return
+                        task = pending.pop()
+                        in_flight[0] += 1
+                    start, stop = task
+                    conn.send((np.ascontiguousarray(traces[start:stop]),
+                               np.ascontiguousarray(plaintexts[start:stop]), precision))
+                    result = conn.recv()
+                    with cond:
+                        partials.append(result)
+                        task = None
+                        in_flight[0] -= 1
+                        cond.notify_all()
+        except (OSError, EOFError, AuthenticationError) as e:
+            errors.append(f"{address[0]}:{address[1]}: {type(e).__name__}: {e}")
+            with cond:
+                if task is not None:
+                    pending.append(task)
+                    in_flight[0] -= 1
+                cond.notify_all()
+
+    threads = [threading.Thread(target=host_loop, args=(a,)) for a in hosts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for e in errors:
+        print(f"[WARN] Worker {e}")
+    if pending or len(partials) != len(ranges):
+        raise RuntimeError("not all blocks were analyzed (no worker host left)")
+    return partials
+
+
+# ========== main ==========
+
+def print_results(accs):
+    corr = accs["cpa"].correlation()
+    cpa_results = results_from_correlation(corr)
+    dpa_results = results_from_correlation(accs["dpa"].difference())
+
+    candidates_hex = []
+    print("\n=== CPA / DPA top keys per S-box ===")
+    for s in range(1, 9):
+        top = cpa_results[s][:TOP_N]
+        snr = accs[f"snr{s}"].snr()
+        print(f"  S{s}: CPA " + "  ".join(f"0x{k:02X}({c:.3f})" for k, c, _ in top)
+              + f"   DPA #1 0x{dpa_results[s][0][0]:02X}"
+              + f"   max SNR {snr.max():.4f} @ {int(np.argmax(snr))}")
+        candidates_hex.append([f"0x{k:02X}" for k, _, _ in top])
+    write_candidates_file(OUT_FILE, candidates_hex)
+    print(f"\n[INFO] Written S-box key candidates to {OUT_FILE}")
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) == 2 and args[0] == "serve":
+        try:
+            authkey = load_authkey()
+        except RuntimeError as e:
+            print(f"[ERROR] {e}")
+            sys.exit(1)
+        serve(parse_address(args[1]), authkey)
+        return
+
+    opts = {"workers": os.cpu_count(), "hosts": None, "block": BLOCK,
+            "precision": "float32" if "--float32" in args else "float64"}
+    args = [a for a in args if a != "--float32"]
+    try:
+        for flag, conv in (("--workers", int), ("--hosts", str), ("--block", int)):
+            if flag in args:
+                i = args.index(flag)
+                opts[flag[2:]] = conv(args[i + 1])
+                del args[i:i + 2]
+        if len(args) != 1:
+            raise ValueError
+    except (ValueError, IndexError):
+        print(f"Usage: {sys.argv[0]} <traces_dir> [--workers W] [--hosts HOST:PORT,...] [--block B] "
+              f"[--float32]")
+        print(f"       {sys.argv[0]} serve [HOST:]PORT")
+        sys.exit(1)
+    traces_dir = args[0]
+
+    traces = np.load(os.path.join(traces_dir, "traces_all_cpa.npy"), mmap_mode="r")
+    plaintexts = np.load(os.path.join(traces_dir, "plaintexts_all_cpa.npy"), mmap_mode="r")
+    n = traces.shape[0]
+    ranges = [(start, min(start + opts["block"], n)) for start in range(0, n, opts["block"])]
+
+    t0 = time.time()
+    if opts["hosts"]:
+        try:
+            authkey = load_authkey()
+        except RuntimeError as e:
+            print(f"[ERROR] {e}")
+            sys.exit(1)
+        hosts = [parse_address(h) for h in opts["hosts"].split(",")]
+        print(f"[INFO] {n} traces in {len(ranges)} blocks -> {len(hosts)} worker hosts")
+        partials = run_on_hosts(hosts, traces, plaintexts, ranges, opts["precision"], authkey)
+    else:
+        print(f"[INFO] {n} traces in {len(ranges)} blocks -> {opts['workers']} local workers")
+        with Pool(opts["workers"]) as pool:
+            partials = pool.map(analyze_range, [(traces_dir, a, b, opts["precision"])
+                                                for a, b in ranges])
+    accs = reduce_results(partials)
+    print(f"[INFO] Analysis + reduce in {time.time() - t0:.1f} s")
+
+    for name, acc in accs.items():
+        acc.save(os.path.join(traces_dir, f"acc_{name}.npz"))
+    print(f"[INFO] Saved merged accumulators to {traces_dir}/acc_*.npz")
+
+    print_results(accs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Success rate and guessing entropy of CPA/DPA by bootstrap resampling.
+
+For every subset size N, n_trials random subsets (drawn with replacement)
+of a saved trace set are attacked with the vectorized CPA or DPA from
+cpa_engine, in a process pool. The trace and plaintext arrays are placed
+in multiprocessing.shared_memory once (sbox_pool.to_shared); workers map
+them instead of receiving pickled copies.
+
+Per S-box and size we report
+  SR       = P(correct key has rank 1)   with a 95% Wilson interval
+  GE       = mean rank of the correct key  with a 95% bootstrap interval
+             (1 = always first, 32.5 = no information)
+  log2(GE) = the same in bits, on the scale of the key_rank.py output
+
+Usage:
+  python3 evaluate.py <sizes> <n_trials> [traces_dir] [--dpa] [--workers W] [--float32]
+  e.g. python3 evaluate.py 50,100,200,400 200
+  python3 evaluate.py --self-test
+    (pure noise must not give SR ~ 1, simulated HW leakage must)
+"""
+import os
+import sys
+import numpy as np
+from multiprocessing import Pool
+
+from cpa_engine import (correlate, dpa_difference, all_sbox_hypotheses, sbox_outputs,
+                        load_trace_set, load_known_k1, rank_and_margin, HW_TABLE, DTYPES)
+from sbox_pool import to_shared, attach_shared
+from telemetry import Telemetry
+
+
+# --------- config ---------
+TRACES_DIR = "traces_cpa"
+OUT_FILE = "evaluation.txt"
+Z_95 = 1.96
+# --------------------------
+
+tm = Telemetry("evaluate")
+
+
+# ========== trial workers ==========
+
+_worker = {}
+
+
+def init_worker(traces_desc, pts_desc, correct_keys, method, dtype):
+    """Pool initializer: attach to the shared arrays (no copy)."""
+    for key, desc in (("traces", traces_desc), ("pts", pts_desc)):
+        # keep the mapping alive next to the view
+        _worker[key + "_shm"], _worker[key] = attach_shared(desc)
+    _worker["correct_keys"] = correct_keys
+    _worker["method"] = method
+    _worker["dtype"] = dtype
+
+
+def run_trial(task):
+    """One bootstrap trial: (size, seed) -> correct-key ranks of S-box 1..8."""
+    size, seed = task
+    traces, pts = _worker["traces"], _worker["pts"]
+
+    idx = np.random.default_rng(seed).integers(0, traces.shape[0], size=size)
+    sub_traces = traces[idx]
+    sub_pts = pts[idx]
+
+    if _worker["method"] == "dpa":
+        sel = np.vstack([sbox_outputs(sub_pts, s) & 1 for s in range(1, 9)])
+        scores = dpa_difference(sub_traces, sel, _worker["dtype"])
+    else:
+        scores = correlate(sub_traces, all_sbox_hypotheses(sub_pts, np.uint8),
+                           dtype=_worker["dtype"])
+
+    ranks, _ = rank_and_margin(scores, _worker["correct_keys"])
+    return size, ranks
+
+
+def run_trials(traces, plaintexts, correct_keys, sizes, n_trials, method, dtype, workers,
+               verbose=True):
+    """All bootstrap trials in a process pool; returns {size: [ranks, ...]}."""
+    shm_traces, traces_desc = to_shared(np.ascontiguousarray(traces, dtype=dtype))
+    shm_pts, pts_desc = to_shared(np.ascontiguousarray(plaintexts, dtype=np.uint64))
+
+    tasks = [(size, 1000003 * size + t) for size in sizes for t in range(n_trials)]
+    ranks_by_size = {size: [] for size in sizes}
+
+    try:
+        with tm.phase("trials"), Pool(workers, initializer=init_worker,
+                                      initargs=(traces_desc, pts_desc, correct_keys,
+                                                method, dtype)) as pool:
+            for done, (size, ranks) in enumerate(
+                    pool.imap_unordered(run_trial, tasks, chunksize=4), start=1):
+                ranks_by_size[size].append(ranks)
+                tm.count("trials")
+                if verbose:
+                    tm.progress("trials", done, len(tasks), "trials")
+    finally:
+        for shm in (shm_traces, shm_pts):
+            shm.close()
+            shm.unlink()
+    return ranks_by_size
+
+
+# ========== statistics ==========
+
+def wilson_interval(successes, n, z=Z_95):
+    """Wilson score interval for a binomial proportion."""
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    denom = 1 + z**2 / n
+    center = (p + z**2 / (2 * n)) / denom
+    half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def bootstrap_mean_interval(values, n_boot=1000, seed=0):
+    """95% percentile interval of the mean of values."""
+    values = np.asarray(values, dtype=float)
+    rng = np.random.default_rng(seed)
+    means = values[rng.integers(0, len(values), size=(n_boot, len(values)))].mean(axis=1)
+    return float(np.percentile(means, 2.5)), float(np.percentile(means, 97.5))
+
+
+def summarize(sizes, ranks_by_size):
+    """
+    Returns a list of rows (size, sbox, sr, sr_lo, sr_hi, ge, ge_lo, ge_hi),
+    GE = mean rank of the correct key.
+    """
+    rows = []
+    for size in sizes:
+        ranks = np.array(ranks_by_size[size])         # (n_trials, 8)
+        for s in range(8):
+            r = ranks[:, s]
+            succ = int(np.sum(r == 1))
+            sr_lo, sr_hi = wilson_interval(succ, len(r))
+            ge_lo, ge_hi = bootstrap_mean_interval(r, seed=size * 8 + s)
+            rows.append((size, s + 1, succ / len(r), sr_lo, sr_hi,
+                         float(r.mean()), ge_lo, ge_hi))
+    return rows
+
+
+def write_report(path, rows, method, n_trials):
+    with open(path, "w") as f:
+        f.write(f"# {method.upper()} bootstrap evaluation, {n_trials} trials per size\n")
+        f.write("# SR = P(rank 1); GE = mean rank of the correct key (1 = best, "
+                "32.5 = random);\n# log2(GE) in bits, as in key_rank.py\n")
+        f.write("#    N  sbox     SR  [ 95% CI ]           GE  [ 95% CI ]         log2(GE)\n")
+        for size, sbox, sr, sr_lo, sr_hi, ge, ge_lo, ge_hi in rows:
+            f.write(f"{size:6d}  S{sbox}   {sr:5.3f}  [{sr_lo:5.3f}, {sr_hi:5.3f}]"
+                    f"    {ge:6.2f}  [{ge_lo:6.2f}, {ge_hi:6.2f}]    {np.log2(ge):6.3f}\n")
+
+
+# ========== self-test ==========
+
+def self_test(workers, n=2000, trace_len=20, size=400, n_trials=16):
+    """
+    Noise-only traces must give SR near 1/64 (< 0.2), traces with a
+    simulated HW leak of every S-box output a clear majority of rank-1
+    trials (> 0.5; DPA's 1-bit selection needs more traces than CPA),
+    for CPA and DPA in both precisions.
+    """
+    rng = np.random.default_rng(1)
+    pts = rng.integers(0, 1 << 63, size=n, dtype=np.uint64)
+    keys = [int(k) for k in rng.integers(0, 64, 8)]
+    # ChipWhisperer scale: |trace| < 0.5, so an integer cast would give all zeros
+    noise = rng.normal(0, 0.05, (n, trace_len))
+    leaky = noise.copy()
+    for s in range(1, 9):
+        out = sbox_outputs(pts, s)[keys[s - 1]]
+        leaky[:, 2 * s] += 0.1 * HW_TABLE[out]
+
+    ok = True
+    for method in ("cpa", "dpa"):
+        for precision in DTYPES:
+            for name, traces, want_high in (("noise", noise, False), ("leak", leaky, True)):
+                ranks = run_trials(traces, pts, keys, [size], n_trials, method,
+                                   DTYPES[precision], workers, verbose=False)[size]
+                sr = float(np.mean(np.array(ranks) == 1))
+                passed = sr > 0.5 if want_high else sr < 0.2
+                ok &= passed
+                print(f"  {method} {precision} {name:5s}: mean SR {sr:5.3f} "
+                      f"{'ok' if passed else 'FAILED'}")
+    return ok
+
+
+# ========== main ==========
+
+def main():
+    args = sys.argv[1:]
+    method = "dpa" if "--dpa" in args else "cpa"
+    precision = "float32" if "--float32" in args else "float64"
+    args = [a for a in args if a not in ("--dpa", "--float32")]
+
+    workers = os.cpu_count()
+    try:
+        if "--workers" in args:
+            i = args.index("--workers")
+            workers = int(args[i + 1])
+            del args[i:i + 2]
+            if workers <= 0:
+                raise ValueError
+    except (ValueError, IndexError):
+        args = []          # -> usage below
+
+    if args == ["--self-test"]:
+        passed = self_test(workers)
+        print("[INFO] evaluate self-test passed ✅" if passed
+              else "[ERROR] evaluate self-test failed")
+        sys.exit(0 if passed else 1)
+
+    if len(args) not in (2, 3):
+        print(f"Usage: {sys.argv[0]} <sizes> <n_trials> [traces_dir] [--dpa] [--workers W] "
+              f"[--float32]")
+        print("  sizes: comma-separated subset sizes, e.g. 50,100,200; W a positive integer")
+        sys.exit(1)
+
+    try:
+        sizes = [int(x) for x in args[0].split(",")]
+        n_trials = int(args[1])
+        if n_trials <= 0 or min(sizes) <= 0:
+            raise ValueError
+    except ValueError:
+        print("[ERROR] sizes and n_trials must be positive integers")
+        sys.exit(1)
+    traces_dir = args[2] if len(args) == 3 else TRACES_DIR
+
+    traces, plaintexts, _ = load_trace_set(traces_dir)
+    correct_keys = load_known_k1()
+    print(f"[INFO] Loaded traces {traces.shape} from {traces_dir}")
+    print(f"[INFO] {method.upper()}, sizes={sizes}, {n_trials} trials each, "
+          f"{workers} workers, {precision}")
+
+    ranks_by_size = run_trials(traces, plaintexts, correct_keys, sizes, n_trials,
+                               method, DTYPES[precision], workers)
+
+    rows = summarize(sizes, ranks_by_size)
+    write_report(OUT_FILE, rows, method, n_trials)
+    with open(OUT_FILE) as f:
+        print(f.read())
+    print(f"[INFO] Written report to {OUT_FILE}")
+    tm.set("method", method)
+    tm.set("sizes", sizes)
+    tm.set("n_trials", n_trials)
+    tm.write()
+
+
+if __name__ == "__main__":
+    main()
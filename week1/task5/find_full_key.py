@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 import os
 import sys
-import itertools
-from Crypto.Cipher import DES
+import numpy as np
+
+import des_bitslice
+from telemetry import Telemetry
+from key_schedule import (combine_candidates, enumerate_cd0_array, free_positions,
+                          cd0_to_key64_array)
 
 # ----------------------------------------------------------------------
 # Config
 # ----------------------------------------------------------------------
 
 SBOX_OUT_FILE = os.path.join(os.path.dirname(__file__), ".", "sbox_out.txt")
+# K16 candidates written by cpa_k16.py (round-16 attack on ciphertexts)
+SBOX_OUT_K16_FILE = os.path.join(os.path.dirname(__file__), ".", "sbox_out_k16.txt")
 
 # Default: how many candidates per S-box row to use (1..5)
 DEFAULT_TOP_N = 3
@@ -17,46 +23,8 @@ DEFAULT_TOP_N = 3
 PLAINTEXT_HEX = "4142434445464748"
 CIPHERTEXT_HEX = "ef770c97ad062c75"
 
-# Inverse PC1: for each 64-bit position i (0..63),
-# PC1_INV[i] = position in 56-bit key (1..56) OR 0 if this is a parity bit.
-PC1_INV = [
- 8, 16, 24, 56, 52, 44, 36,  0,
- 7, 15, 23, 55, 51, 43, 35,  0,
- 6, 14, 22, 54, 50, 42, 34,  0,
- 5, 13, 21, 53, 49, 41, 33,  0,
- 4, 12, 20, 28, 48, 40, 32,  0,
- 3, 11, 19, 27, 47, 39, 31,  0,
- 2, 10, 18, 26, 46, 38, 30,  0,
- 1,  9, 17, 25, 45, 37, 29,  0,
-]
-
-# Inverse of PC2 (56 entries). 0 means "bit was dropped by PC2".
-PC2_INV = [
- 5, 24,  7, 16,  6, 10, 20, 18,
- 0, 12,  3, 15, 23,  1,  9, 19,
- 2,  0, 14, 22, 11,  0, 13,  4,
- 0, 17, 21,  8, 47, 31, 27, 48,
-35, 41,  0, 46, 28,  0, 39, 32,
-25, 44,  0, 37, 34, 43, 29, 36,
-38, 45, 33, 26, 42,  0, 30, 40,
-]
-
-
-# ----------------------------------------------------------------------
-# Bit helpers
-# ----------------------------------------------------------------------
-
-def int_to_bits(x, n):
-    """Convert integer x to list of n bits (MSB first)."""
-    return [(x >> (n - 1 - i)) & 1 for i in range(n)]
-
-
-def bits_to_int(bits):
-    """Convert list of bits (MSB first) to integer."""
-    v = 0
-    for b in bits:
-        v = (v << 1) | b
-    return v
+# keys per bitsliced DES call (multiple of 64)
+BATCH_SIZE = 1 << 16
 
 
 # ----------------------------------------------------------------------
@@ -86,153 +54,92 @@ def load_candidates_from_sbox_out(path=SBOX_OUT_FILE):
 
 
 # ----------------------------------------------------------------------
-# Step 2: generate 48-bit K1 candidates from S-box candidates
+# Step 2: S-box candidates of all rounds -> constraints on C0||D0
 # ----------------------------------------------------------------------
 
-def generate_k1_ints(candidates, top_n):
+def load_round_candidates(round_files, top_n):
     """
-    candidates: 2D list of ints [8 x 5] from sbox_out.txt
-    top_n: number of candidates per S-box row to use (1..5)
-
-    Yields 48-bit K1 integers.
-    K1 layout: [S1 (MSB 6 bits)] ... [S8 (LSB 6 bits)]
+    round_files: dict round_num -> path of a CANDIDATES_HEX file
+    Returns dict round_num -> 8 lists with the top_n candidates per S-box.
     """
     if not (1 <= top_n <= 5):
         raise ValueError("top_n must be between 1 and 5")
 
-    per_sbox_lists = [row[:top_n] for row in candidates]  # 8 rows
-
-    for combo in itertools.product(*per_sbox_lists):
-        k1 = 0
-        for sbox_index, subkey_6bit in enumerate(combo):
-            shift = (7 - sbox_index) * 6
-            k1 |= (subkey_6bit & 0x3F) << shift
-        yield k1
-
-
-# ----------------------------------------------------------------------
-# Step 3: expand 48-bit K1 to all possible 56-bit (C1||D1) using PC2_INV
-# ----------------------------------------------------------------------
-
-def expand_k1_to_56(k1_int):
-    """
-    From one 48-bit K1 candidate, build all possible 56-bit pre-PC2 values.
-
-    - Known bits (PC2_INV[i] != 0) are taken from K1.
-    - Unknown bits (PC2_INV[i] == 0) are filled with all 2^8 combinations.
-    """
-    k1_bits = int_to_bits(k1_int, 48)
-
-    template = []
-    for i in range(56):
-        out_pos = PC2_INV[i]
-        if out_pos == 0:
-            template.append(None)
-        else:
-            template.append(k1_bits[out_pos - 1])
-
-    unknown_positions = [i for i, b in enumerate(template) if b is None]
-    m = len(unknown_positions)
-    if m != 8:
-        print(f"[WARN] Expected 8 unknown bits, found {m}.")
-
-    for pattern in range(1 << m):
-        bits = template[:]
-        for idx, pos in enumerate(unknown_positions):
-            bit_val = (pattern >> (m - 1 - idx)) & 1
-            bits[pos] = bit_val
-        yield bits_to_int(bits)
-
-
-# ----------------------------------------------------------------------
-# Step 4: reverse round-1 shift (C1||D1 -> C0||D0)
-# ----------------------------------------------------------------------
-
-def reverse_round1_shift(k56_int):
-    """
-    k56_int: 56-bit candidate that represents C1||D1 (after round-1 left shift).
-    We reverse the shift to get C0||D0 by rotating each 28-bit half right by 1 bit.
-    """
-    bits = int_to_bits(k56_int, 56)
-    C1 = bits[:28]
-    D1 = bits[28:]
-
-    C0 = [C1[-1]] + C1[:-1]
-    D0 = [D1[-1]] + D1[:-1]
-
-    return C0 + D0  # list of 56 bits
+    round_candidates = {}
+    for round_num, path in sorted(round_files.items()):
+        cand_hex, candidates = load_candidates_from_sbox_out(path)
+        print(f"[INFO] Loaded K{round_num} CANDIDATES_HEX from {os.path.basename(path)}:")
+        for i, row in enumerate(cand_hex, start=1):
+            print(f"  S-box {i}: {row}")
+        round_candidates[round_num] = [row[:top_n] for row in candidates]
+    return round_candidates
 
 
 # ----------------------------------------------------------------------
-# Step 5: apply PC1_INV to go from 56-bit (C0||D0) to 64-bit key K
+# Step 3: full search pipeline and DES test
 # ----------------------------------------------------------------------
 
-def apply_pc1_inv(cd0_bits):
+def recover_key(round_files, top_n, tm):
     """
-    cd0_bits: list of 56 bits (C0||D0).
-
-    Use PC1_INV to reconstruct the 64-bit full key:
-      - PC1_INV[i] == 0 -> parity bit = 0
-      - else take bit from cd0_bits[PC1_INV[i] - 1]
+    For every consistent combination of S-box candidates (over all rounds
+    in round_files) enumerate only the C0||D0 bits no subkey fixes:
+      K1 alone       -> 2^8 keys per combination
+      K1 + K16       -> 1 key per combination (all 56 bits fixed)
+    Keys are collected into batches of BATCH_SIZE and tested together
+    with the bitsliced DES engine against the known plaintext/ciphertext.
+    The loop runs in the "search" phase of tm (Telemetry).
     """
-    if len(cd0_bits) != 56:
-        raise ValueError("cd0_bits must have length 56")
-
-    key64_bits = []
-    for i in range(64):
-        pos56 = PC1_INV[i]
-        if pos56 == 0:
-            key64_bits.append(0)
-        else:
-            key64_bits.append(cd0_bits[pos56 - 1])
-
-    return bits_to_int(key64_bits)
+    plaintext = int(PLAINTEXT_HEX, 16)
+    target_cipher = np.uint64(int(CIPHERTEXT_HEX, 16))
 
-
-# ----------------------------------------------------------------------
-# Step 6: full search pipeline and DES test
-# ----------------------------------------------------------------------
-
-def recover_key_from_sbox_out(top_n):
-    plaintext = bytes.fromhex(PLAINTEXT_HEX)
-    target_cipher = bytes.fromhex(CIPHERTEXT_HEX)
-
-    # Load S-box candidates
-    cand_hex, candidates = load_candidates_from_sbox_out()
-    print("[INFO] Loaded CANDIDATES_HEX from sbox_out.txt:")
-    for i, row in enumerate(cand_hex, start=1):
-        print(f"  S-box {i}: {row}")
+    round_candidates = load_round_candidates(round_files, top_n)
     print(f"[INFO] Using top {top_n} candidates per S-box.")
 
-    tested_56 = 0
-    tested_K1 = 0
-
-    for k1_int in generate_k1_ints(candidates, top_n):
-        tested_K1 += 1
-
-        # For each K1, generate all possible 56-bit values
-        for k56_int in expand_k1_to_56(k1_int):
-            tested_56 += 1
-
-            # Reverse round-1 shift to get C0||D0
-            cd0_bits = reverse_round1_shift(k56_int)
-
-            # Apply PC1_INV to get 64-bit key with parity bits = 0
-            key64_int = apply_pc1_inv(cd0_bits)
-            key_bytes = key64_int.to_bytes(8, "big")
-
-            # Test this key with DES (ECB)
-            cipher = DES.new(key_bytes, DES.MODE_ECB)
-            out = cipher.encrypt(plaintext)
-
-            if out == target_cipher:
-                print("\n[+] Found matching key!")
-                print(f"    Key (hex) = 0x{key64_int:016X}")
-                print(f"[INFO] Tested {tested_56} candidate 56-bit keys (from {tested_K1} K1s).")
-                return key64_int
+    tested_keys = 0
+    tested_combos = 0
+    batch = []
+    batch_len = 0
+
+    def test_batch():
+        # C0||D0 -> 64-bit keys with parity bits = 0, then DES (ECB)
+        keys = cd0_to_key64_array(np.concatenate(batch))
+        hits = np.nonzero(des_bitslice.encrypt(keys, plaintext) == target_cipher)[0]
+        return int(keys[hits[0]]) if len(hits) else None
+
+    with tm.phase("search"):
+        combos = combine_candidates(round_candidates)
+        while True:
+            combo = next(combos, None)
+            if combo is not None:
+                mask, value = combo
+                tested_combos += 1
+                if tested_combos == 1:
+                    print(f"[INFO] {len(free_positions(mask))} key bits left free per combination.")
+                cd0s = enumerate_cd0_array(mask, value)
+                batch.append(cd0s)
+                batch_len += len(cd0s)
+                tm.count("combinations")
+
+            if batch and (combo is None or batch_len >= BATCH_SIZE):
+                key64_int = test_batch()
+                tested_keys += batch_len
+                tm.count("keys", batch_len)
+                tm.progress("search", tested_keys, unit="keys")
+                batch, batch_len = [], 0
+
+                if key64_int is not None:
+                    print("\n[+] Found matching key!")
+                    print(f"    Key (hex) = 0x{key64_int:016X}")
+                    print(f"[INFO] Tested {tested_keys} candidate 56-bit keys "
+                          f"(from {tested_combos} subkey combinations).")
+                    return key64_int
+
+            if combo is None:
+                break
 
     print(f"[INFO] Finished search.")
-    print(f"[INFO] Tested {tested_56} candidate 56-bit keys (from {tested_K1} K1s).")
+    print(f"[INFO] Tested {tested_keys} candidate 56-bit keys "
+          f"(from {tested_combos} subkey combinations).")
     print("[INFO] No matching key found.")
     return None
 
@@ -243,26 +150,53 @@ def recover_key_from_sbox_out(top_n):
 
 def main():
     # Usage:
-    #   python3 recover_key_from_sbox_out.py         -> uses DEFAULT_TOP_N
-    #   python3 recover_key_from_sbox_out.py 3       -> uses top_n = 3
-    if len(sys.argv) == 1:
+    #   python3 find_full_key.py             -> DEFAULT_TOP_N, K1 + K16
+    #   python3 find_full_key.py 3           -> top_n = 3
+    #   python3 find_full_key.py 3 --k1-only -> K1 alone + 2^8 brute force
+    #
+    # With sbox_out_k16.txt (cpa_k16.py) K1 and K16 fix all 56 key bits,
+    # one DES per combination. The K1-only 2^8 brute force is the fallback
+    # when there is no K16 file or K1 + K16 finds no key.
+    args = sys.argv[1:]
+    k1_only = "--k1-only" in args
+    args = [a for a in args if a != "--k1-only"]
+
+    if len(args) == 0:
         top_n = DEFAULT_TOP_N
-    elif len(sys.argv) == 2:
+    elif len(args) == 1:
         try:
-            top_n = int(sys.argv[1])
+            top_n = int(args[0])
         except ValueError:
             print("[ERROR] top_n must be an integer between 1 and 5.")
             sys.exit(1)
     else:
-        print(f"Usage: {sys.argv[0]} [top_n_candidates_per_sbox]")
+        print(f"Usage: {sys.argv[0]} [top_n_candidates_per_sbox] [--k1-only]")
         print("  top_n_candidates_per_sbox must be 1, 2, 3, 4, or 5")
+        print("  --k1-only ignores sbox_out_k16.txt (2^8 brute force per combination)")
         sys.exit(1)
 
     if not (1 <= top_n <= 5):
         print("[ERROR] top_n must be between 1 and 5.")
         sys.exit(1)
 
-    key = recover_key_from_sbox_out(top_n)
+    tm = Telemetry("find_full_key")
+    tm.set("top_n", top_n)
+    key = None
+    rounds = [1]
+    if not k1_only and os.path.exists(SBOX_OUT_K16_FILE):
+        rounds = [1, 16]
+        key = recover_key({1: SBOX_OUT_FILE, 16: SBOX_OUT_K16_FILE}, top_n, tm)
+        if key is None:
+            print("[WARN] K1 + K16 found no key, falling back to K1 brute force")
+    elif not k1_only:
+        print(f"[WARN] {os.path.basename(SBOX_OUT_K16_FILE)} not found (run cpa_k16.py), "
+              f"falling back to K1 brute force")
+    if key is None:
+        rounds = [1]
+        key = recover_key({1: SBOX_OUT_FILE}, top_n, tm)
+    tm.set("rounds", rounds)
+    tm.set("key_found", None if key is None else f"0x{key:016X}")
+    tm.write()
     if key is not None:
         print(f"[RESULT] Full 64-bit key (parity bits = 0): 0x{key:016X}")
 
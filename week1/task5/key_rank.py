@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Full-key rank estimation before running find_full_key.py.
+
+From the 8 x 64 CPA scores (max |corr| per S-box guess) we build a
+per-S-box log-probability for every guess (Fisher z of the correlation,
+normalized over the 64 guesses). A full K1 is then scored by the sum of
+its 8 log-probabilities, and the score distribution of all 2^48 K1s is
+obtained by convolving the 8 per-S-box histograms (no enumeration).
+
+Without a known key we report the expected rank of the true K1 under the
+same probabilities (and its quantiles); with --key the rank of the key
+in full_key.txt is bounded directly. Every K1 still expands to 2^8 keys
+(PC2 drops 8 bits), and the search time uses the measured keys/s of the
+bitsliced DES engine.
+
+Usage:
+  python3 key_rank.py [traces_dir] [--key] [--speed KEYS_PER_S]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+import des_bitslice
+from cpa_engine import all_sbox_hypotheses, correlate, load_trace_set, load_known_k1
+
+
+# --------- config ---------
+TRACES_DIR = "traces_cpa"
+N_BINS = 4096           # histogram bins per S-box
+PC2_EXPANSION = 2 ** 8  # keys per K1
+QUANTILES = [0.5, 0.9, 0.99]
+# --------------------------
+
+
+# ========== scores -> log-probabilities ==========
+
+def load_scores(traces_dir):
+    """
+    Returns (scores, n_traces): scores is the (8, 64) max |corr| table.
+    Uses cpa_scores.npy written by cpa.py, or runs the CPA if it is missing.
+    """
+    traces, plaintexts, _ = load_trace_set(traces_dir)
+    path = os.path.join(traces_dir, "cpa_scores.npy")
+    if os.path.exists(path):
+        return np.load(path), len(plaintexts)
+
+    print("[INFO] No cpa_scores.npy, running CPA on the trace set...")
+    corr = correlate(traces, all_sbox_hypotheses(plaintexts))
+    return np.max(np.abs(corr), axis=1).reshape(8, 64), len(plaintexts)
+
+
+def log_probabilities(scores, n_traces):
+    """
+    Fisher z: atanh(r) * sqrt(N - 3) is ~N(0,1) for a wrong guess, so
+    z^2 / 2 is used as the log-likelihood ratio of each guess.
+    Returns (8, 64) log-probabilities normalized per S-box.
+    """
+    r = np.clip(scores, 0, 1 - 1e-12)
+    z = np.arctanh(r) * np.sqrt(max(n_traces - 3, 1))
+    ll = 0.5 * z**2
+    ll -= ll.max(axis=1, keepdims=True)
+    return ll - np.log(np.exp(ll).sum(axis=1, keepdims=True))
+
+
+# ========== histogram convolution ==========
+
+def build_histograms(logp, n_bins=N_BINS):
+    """
+    Common bin width for all S-boxes, one histogram per S-box.
+    Returns (counts, weights, lo, width):
+      counts[s][b]  = number of guesses of S-box s in bin b
+      weights[s][b] = total probability of those guesses
+      lo[s]         = score of bin 0 for S-box s
+    """
+    width = max(np.ptp(logp, axis=1).max(), 1e-9) / (n_bins - 1)
+    lo = logp.min(axis=1)
+    counts, weights = [], []
+    for s in range(8):
+        b = np.floor((logp[s] - lo[s]) / width).astype(int)
+        counts.append(np.bincount(b, minlength=n_bins).astype(float))
+        weights.append(np.bincount(b, weights=np.exp(logp[s]), minlength=n_bins))
+    return counts, weights, lo, width
+
+
+def convolve_all(hists):
+    total = np.array([1.0])
+    for h in hists:
+        total = np.convolve(total, h)
+    return total
+
+
+def keys_above(total_counts):
+    """above[b] = number of full keys in bins strictly higher than b."""
+    above = np.cumsum(total_counts[::-1])[::-1]
+    return np.append(above[1:], 0.0)
+
+
+def rank_bounds_for_key(logp, key_chunks, counts, lo, width):
+    """
+    Rank of one K1 (given as 8 chunks). Each S-box adds at most one bin of
+    rounding error, so the true rank lies between the counts above bin+8
+    and above bin-8.
+    """
+    total = convolve_all(counts)
+    above = keys_above(total)
+    b = sum(int(np.floor((logp[s, k] - lo[s]) / width)) for s, k in enumerate(key_chunks))
+    lower = above[min(b + 8, len(above) - 1)] + 1
+    upper = above[max(b - 8, 0)] + total[max(b - 8, 0)]
+    estimate = above[b] + 0.5 * total[b] + 0.5
+    return lower, estimate, upper
+
+
+def expected_rank(counts, weights):
+    """
+    Distribution of the true-key rank if the key is drawn from the
+    per-S-box probabilities: P(score bin b) from the weight convolution,
+    rank(b) from the count convolution.
+    Returns (mean_rank, {q: rank quantile}).
+    """
+    total = convolve_all(counts)
+    p = convolve_all(weights)
+    p /= p.sum()
+    rank = keys_above(total) + 0.5 * total + 0.5
+
+    order = np.argsort(rank)
+    cdf = np.cumsum(p[order])
+    quant = {q: float(rank[order][min(np.searchsorted(cdf, q), len(cdf) - 1)])
+             for q in QUANTILES}
+    return float(np.sum(p * rank)), quant
+
+
+def topn_coverage(logp):
+    """P(true K1 inside the top_n^8 product that find_full_key.py searches)."""
+    probs = np.sort(np.exp(logp), axis=1)[:, ::-1]
+    return {n: float(np.prod(probs[:, :n].sum(axis=1))) for n in range(1, 6)}
+
+
+# ========== search time ==========
+
+def measure_speed(n=1 << 16):
+    keys = np.random.randint(0, 1 << 63, size=n, dtype=np.uint64)
+    t0 = time.time()
+    des_bitslice.encrypt(keys, 0x4142434445464748)
+    return n / (time.time() - t0)
+
+
+def fmt_time(seconds):
+    for unit, size in (("years", 31557600), ("days", 86400), ("h", 3600), ("min", 60)):
+        if seconds >= size:
+            return f"{seconds / size:.1f} {unit}"
+    return f"{seconds:.2f} s"
+
+
+def report_keys(label, k1_rank, speed):
+    keys = k1_rank * PC2_EXPANSION
+    print(f"  {label:<14} K1 rank ~ 2^{np.log2(max(k1_rank, 1)):5.1f}"
+          f"  -> 2^{np.log2(max(keys, 1)):5.1f} keys, {fmt_time(keys / speed)}")
+
+
+# ========== main ==========
+
+def main():
+    args = sys.argv[1:]
+    use_key = "--key" in args
+    args = [a for a in args if a != "--key"]
+
+    speed = None
+    if "--speed" in args:
+        i = args.index("--speed")
+        speed = float(args[i + 1])
+        del args[i:i + 2]
+
+    if len(args) > 1:
+        print(f"Usage: {sys.argv[0]} [traces_dir] [--key] [--speed KEYS_PER_S]")
+        sys.exit(1)
+    traces_dir = args[0] if args else TRACES_DIR
+
+    scores, n_traces = load_scores(traces_dir)
+    logp = log_probabilities(scores, n_traces)
+    counts, weights, lo, width = build_histograms(logp)
+
+    if speed is None:
+        speed = measure_speed()
+    print(f"[INFO] {n_traces} traces, search speed {speed:,.0f} keys/s")
+
+    print("\n=== P(true K1 within top_n per S-box) ===")
+    for n, p in topn_coverage(logp).items():
+        keys = n**8 * PC2_EXPANSION
+        print(f"  top_n={n}: P={p:.4f}, {keys} keys, {fmt_time(keys / speed)}")
+
+    print("\n=== Expected rank of the true key ===")
+    mean_rank, quant = expected_rank(counts, weights)
+    report_keys("mean", mean_rank, speed)
+    for q, r in quant.items():
+        report_keys(f"{int(q * 100)}% quantile", r, speed)
+
+    if use_key:
+        key_chunks = load_known_k1()
+        lower, estimate, upper = rank_bounds_for_key(logp, key_chunks, counts, lo, width)
+        print("\n=== Rank of the known key (full_key.txt) ===")
+        report_keys("lower bound", lower, speed)
+        report_keys("estimate", estimate, speed)
+        report_keys("upper bound", upper, speed)
+
+
+if __name__ == "__main__":
+    main()
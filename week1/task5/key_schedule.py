@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+DES key schedule inversion for any round subkey.
+
+Everything is expressed on the 56-bit C0||D0 value (output of PC1, MSB =
+position 1) as packed integers:
+
+  known mask  : 56-bit int, 1 = bit of C0||D0 is fixed by some subkey
+  known value : 56-bit int, the fixed bits (0 where mask is 0)
+
+Recovered subkeys (full 48-bit K_r, or single 6-bit S-box chunks of them)
+are added as constraints; only the still-free bits of C0||D0 are then
+enumerated, and every enumerated value maps to one 64-bit key via PC1^-1.
+"""
+import itertools
+import numpy as np
+
+from sbox_out import PC1, PC2
+from permutation import Permutation
+
+
+# ===== key schedule tables =====
+
+# left shifts per round (1..16)
+SHIFTS = [1, 1, 2, 2, 2, 2, 2, 2, 1, 2, 2, 2, 2, 2, 2, 1]
+
+# CUM_SHIFT[r] = total rotation of C/D after round r (CUM_SHIFT[16] = 28)
+CUM_SHIFT = [0] + list(itertools.accumulate(SHIFTS))
+
+CD_BITS = 56
+CD_MASK = (1 << CD_BITS) - 1
+
+
+def cd_round_pos_to_cd0(pos, round_num):
+    """
+    Position (1..56) in C_r||D_r -> position (1..56) in C0||D0.
+    C_r/D_r are C0/D0 rotated left by CUM_SHIFT[r] inside each 28-bit half.
+    """
+    half, i = divmod(pos - 1, 28)
+    return half * 28 + (i + CUM_SHIFT[round_num]) % 28 + 1
+
+
+# SUBKEY_SRC[r][j] = position (1..56) in C0||D0 of bit j (0 = MSB) of K_r
+SUBKEY_SRC = [None] + [
+    [cd_round_pos_to_cd0(p, r) for p in PC2] for r in range(1, 17)
+]
+
+
+def _spread_table(positions):
+    """
+    For a list of C0||D0 positions (MSB first), return a 2^len table that
+    maps a packed value of that width onto the 56-bit layout.
+    """
+    n = len(positions)
+    table = []
+    for v in range(1 << n):
+        out = 0
+        for b, pos in enumerate(positions):
+            if (v >> (n - 1 - b)) & 1:
+                out |= 1 << (CD_BITS - pos)
+        table.append(out)
+    return table
+
+
+# CHUNK_SPREAD[r][s][v]: 6-bit value v of S-box s+1 in K_r placed into C0||D0
+CHUNK_SPREAD = [None] + [
+    [_spread_table(SUBKEY_SRC[r][s * 6:(s + 1) * 6]) for s in range(8)]
+    for r in range(1, 17)
+]
+CHUNK_MASK = [None] + [
+    [CHUNK_SPREAD[r][s][63] for s in range(8)] for r in range(1, 17)
+]
+
+
+# ===== constraints =====
+
+def constrain_chunk(mask, value, round_num, sbox_num, chunk):
+    """
+    Add the 6-bit S-box chunk (sbox_num 1..8) of K_round_num.
+    Returns the new (mask, value), or None if it contradicts known bits.
+    """
+    cmask = CHUNK_MASK[round_num][sbox_num - 1]
+    cval = CHUNK_SPREAD[round_num][sbox_num - 1][chunk & 0x3F]
+    if (value ^ cval) & mask & cmask:
+        return None
+    return mask | cmask, value | cval
+
+
+def constrain_subkey(mask, value, round_num, subkey_int):
+    """Add a full 48-bit K_round_num (S1 chunk in the 6 MSBs)."""
+    for s in range(8):
+        chunk = (subkey_int >> ((7 - s) * 6)) & 0x3F
+        res = constrain_chunk(mask, value, round_num, s + 1, chunk)
+        if res is None:
+            return None
+        mask, value = res
+    return mask, value
+
+
+def free_positions(mask):
+    """Positions (1..56) of C0||D0 that are still unknown."""
+    return [p for p in range(1, CD_BITS + 1)
+            if not (mask >> (CD_BITS - p)) & 1]
+
+
+def enumerate_cd0(mask, value):
+    """
+    Yield every 56-bit C0||D0 value that satisfies (mask, value).
+
+    The free bits are filled from a packed counter; the counter is split
+    into 8-bit groups with one spread table each, so every candidate costs
+    a few table lookups and ORs.
+    """
+    free = free_positions(mask)
+    groups = [free[i:i + 8] for i in range(0, len(free), 8)]
+    tables = [_spread_table(g) for g in groups]
+
+    for parts in itertools.product(*tables):
+        cd0 = value
+        for part in parts:
+            cd0 |= part
+        yield cd0
+
+
+def enumerate_cd0_array(mask, value):
+    """
+    Same set as enumerate_cd0(), as one uint64 NumPy array (for batch
+    verification with des_bitslice). Only use for small free spaces.
+    """
+    free = free_positions(mask)
+    out = np.full(1, value, dtype=np.uint64)
+    for i in range(0, len(free), 8):
+        table = np.array(_spread_table(free[i:i + 8]), dtype=np.uint64)
+        out = (out[:, None] | table[None, :]).reshape(-1)
+    return out
+
+
+def combine_candidates(round_candidates, mask=0, value=0):
+    """
+    round_candidates: dict round_num -> 8 lists of 6-bit candidates
+                      (one list per S-box; an empty list = S-box unknown)
+
+    Depth-first search over the S-box chunks of all given rounds, keeping
+    only combinations that agree on shared C0||D0 bits.
+    Yields (mask, value) for every consistent combination.
+    """
+    chunks = [(r, s + 1, cands)
+              for r, rows in sorted(round_candidates.items())
+              for s, cands in enumerate(rows) if cands]
+
+    def search(i, mask, value):
+        if i == len(chunks):
+            yield mask, value
+            return
+        r, sbox_num, cands = chunks[i]
+        for chunk in cands:
+            res = constrain_chunk(mask, value, r, sbox_num, chunk)
+            if res is not None:
+                yield from search(i + 1, *res)
+
+    yield from search(0, mask, value)
+
+
+# ===== C0||D0 <-> 64-bit key =====
+
+PC1_PERM = Permutation(PC1, 64)          # 64-bit key -> C0||D0
+PC1_INV_PERM = PC1_PERM.inverse()         # C0||D0 -> key, parity bits = 0
+
+# SUBKEY_PERM[r]: 64-bit key -> K_r in one compiled table (PC1, shifts, PC2)
+SUBKEY_PERM = [None] + [
+    PC1_PERM.then(Permutation(SUBKEY_SRC[r], CD_BITS)) for r in range(1, 17)
+]
+
+
+def cd0_to_key64(cd0):
+    """C0||D0 -> 64-bit DES key with all parity bits = 0."""
+    return PC1_INV_PERM(cd0)
+
+
+def cd0_to_key64_array(cd0):
+    """Vectorized cd0_to_key64 on a uint64 array."""
+    return PC1_INV_PERM.array(cd0)
+
+
+def key64_to_cd0(key64):
+    """64-bit DES key -> C0||D0 (PC1)."""
+    return PC1_PERM(key64)
+
+
+def round_subkey(key64, round_num):
+    """48-bit K_round_num of a 64-bit key (S1 chunk in the 6 MSBs)."""
+    return SUBKEY_PERM[round_num](key64)
+
+
+if __name__ == "__main__":
+    # self-check with the FIPS example key
+    K = int("133457799BBCDFF1", 16)
+    k1 = round_subkey(K, 1)
+    print(f"K1  = 0x{k1:012X}  (expected 0x1B02EFFC7072)")
+
+    mask, value = constrain_subkey(0, 0, 1, k1)
+    print(f"free bits after K1 = {len(free_positions(mask))}")
+
+    mask, value = constrain_subkey(mask, value, 16, round_subkey(K, 16))
+    print(f"free bits after K1+K16 = {len(free_positions(mask))}")
+    keys = [cd0_to_key64(cd0) for cd0 in enumerate_cd0(mask, value)]
+    print(f"key = 0x{keys[0]:016X}  (expected 0x{K & 0xFEFEFEFEFEFEFEFE:016X})")
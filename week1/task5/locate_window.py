@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Find the CPA capture window automatically.
+
+1) Capture a small batch of long, decimated traces that cover the whole
+   DES execution (LONG_SAMPLES x LONG_DECIMATE cycles from LONG_OFFSET).
+2) For every S-box, compute the SNR of the 5 classes HW(S-box output)
+   of round 1 with the known key (full_key.txt). The classes depend on
+   the key, so the plaintext transfer and IP, which only handle
+   plaintext bits, stay at the noise floor; the SNR peaks where the
+   round-1 S-box outputs are processed. With 5 classes every class has a
+   real population (HW 0 and 4 are 1/16 of the traces each).
+   Without full_key.txt the max |corr| over all 64 guesses of the
+   round-1 CPA is used instead (same key-dependent intermediate).
+3) Take the samples whose SNR is clearly above the noise floor, pad the
+   span and convert it back to ADC settings: the narrowest
+   OFFSET/SAMPLES/DECIMATE (smallest decimate that fits MAX_SAMPLES).
+
+The window is written to capture_window.txt, which cpa.py reads at start,
+so the CPA capture only transfers and stores those samples.
+
+Usage:
+  python3 locate_window.py [n_traces]
+"""
+import sys
+import numpy as np
+
+import cpa
+from cpa_engine import (HW_TABLE, KEY_FILE, sbox_outputs, all_sbox_hypotheses, correlate,
+                        load_known_k1)
+
+
+# --------- config ---------
+N_TRACES = 1000          # ~60 traces in the rarest HW class (HW 0 / HW 4)
+MIN_TRACES = 100         # below this the class SNR is mostly noise
+LONG_SAMPLES = 24400     # about the CW-Lite buffer size
+LONG_DECIMATE = 16
+LONG_OFFSET = 0
+MAX_SAMPLES = 24400      # largest window the CPA capture may use
+SNR_FRACTION = 0.5       # keep samples with SNR >= this fraction of the peak
+NOISE_MADS = 10          # ... and this many MADs above the median (noise floor)
+PAD_CYCLES = 100         # extra clock cycles on both sides of the window
+WINDOW_FILE = "capture_window.txt"
+# --------------------------
+
+
+def capture_long_trace(pt_bytes):
+    """One long, decimated trace (uses the scope/target opened by cpa.py)."""
+    scope, target = cpa.scope, cpa.target
+
+    scope.adc.samples = LONG_SAMPLES
+    scope.adc.decimate = LONG_DECIMATE
+    scope.adc.offset = LONG_OFFSET
+    scope.adc.presamples = 0
+    scope.adc.timeout = 2
+
+    scope.arm()
+    target.simpleserial_write('d', pt_bytes)
+    if scope.capture():
+        return None
+    target.simpleserial_read('r', 8)
+    return np.array(scope.get_last_trace(), dtype=float)
+
+
+# ========== SNR ==========
+
+def class_snr(traces, classes, n_classes=64):
+    """
+    SNR per sample = Var(class means) / Mean(class variances).
+    traces: (N, L), classes: (N,) ints in 0..n_classes-1
+    """
+    onehot = np.zeros((n_classes, len(classes)))
+    onehot[classes, np.arange(len(classes))] = 1.0
+    counts = onehot.sum(axis=1)
+    used = counts > 1
+    onehot, counts = onehot[used], counts[used]
+
+    means = (onehot @ traces) / counts[:, None]
+    sq = (onehot @ traces**2) / counts[:, None]
+    variances = np.maximum(sq - means**2, 0)
+
+    noise = variances.mean(axis=0)
+    noise[noise == 0] = np.inf
+    return means.var(axis=0) / noise
+
+
+def sbox_snr(traces, plaintexts, k1_chunks):
+    """(8, L) SNR of the classes HW(round-1 S-box output) for every S-box."""
+    return np.vstack([class_snr(traces, HW_TABLE[sbox_outputs(plaintexts, s)[k1_chunks[s - 1]]],
+                                n_classes=5)
+                      for s in range(1, 9)])
+
+
+def sbox_cpa_peak(traces, plaintexts):
+    """(8, L) max |corr| over the 64 guesses of every S-box (no key needed)."""
+    corr = np.abs(correlate(traces, all_sbox_hypotheses(plaintexts, np.uint8)))
+    return corr.reshape(8, 64, -1).max(axis=1)
+
+
+def derive_window(snr):
+    """
+    snr: (8, L) SNR of the long traces
+    Returns (offset, samples, decimate) in ADC settings for the CPA capture.
+    """
+    peak = snr.max(axis=0)
+    median = np.median(peak)
+    mad = np.median(np.abs(peak - median))
+    threshold = max(SNR_FRACTION * peak.max(), median + NOISE_MADS * mad)
+    hot = np.nonzero(peak >= threshold)[0]
+    first, last = int(hot[0]), int(hot[-1])
+
+    # long-trace sample i covers cycles LONG_OFFSET + i*LONG_DECIMATE ... +LONG_DECIMATE
+    start = max(LONG_OFFSET + first * LONG_DECIMATE - PAD_CYCLES, 0)
+    stop = LONG_OFFSET + (last + 1) * LONG_DECIMATE + PAD_CYCLES
+    cycles = stop - start
+
+    decimate = 1
+    while -(-cycles // decimate) > MAX_SAMPLES:
+        decimate += 1
+    return start, -(-cycles // decimate), decimate
+
+
+def write_window(path, offset, samples, decimate):
+    with open(path, "w") as f:
+        f.write(f"OFFSET = {offset}\n")
+        f.write(f"SAMPLES = {samples}\n")
+        f.write(f"DECIMATE = {decimate}\n")
+
+
+def main():
+    try:
+        if len(sys.argv) > 2:
+            raise ValueError
+        n_traces = int(sys.argv[1]) if len(sys.argv) == 2 else N_TRACES
+        if n_traces < MIN_TRACES:
+            raise ValueError
+    except ValueError:
+        print(f"Usage: {sys.argv[0]} [n_traces]")
+        print(f"[ERROR] n_traces must be an integer >= {MIN_TRACES}")
+        sys.exit(1)
+
+    plaintexts_int = cpa.generate_random_plaintexts(n_traces)
+
+    cpa.init_scope()
+    cpa.reset_target()
+
+    traces_list = []
+    used_pts = []
+    for idx, pt_int in enumerate(plaintexts_int):
+        trace = capture_long_trace(cpa.plaintext_int_to_bytes(pt_int))
+        if trace is None:
+            print(f"[WARN] Capture {idx} timed out, skipping.")
+            continue
+        traces_list.append(trace)
+        used_pts.append(pt_int)
+
+    cpa.scope.dis()
+    cpa.target.dis()
+
+    if len(traces_list) < MIN_TRACES:
+        print("[ERROR] Too few traces for a class SNR, aborting.")
+        sys.exit(1)
+
+    traces = np.vstack(traces_list)
+    pts = np.array(used_pts, dtype=np.uint64)
+    try:
+        snr = sbox_snr(traces, pts, load_known_k1())
+        label = "SNR"
+    except FileNotFoundError:
+        print(f"[WARN] {KEY_FILE} not found, using the max |corr| over all guesses")
+        snr = sbox_cpa_peak(traces, pts)
+        label = "max |corr|"
+    np.save("locate_snr.npy", snr)
+
+    best = snr.max(axis=0)
+    print(f"[INFO] {len(traces_list)} long traces, peak {label} {best.max():.4f} "
+          f"at long sample {int(np.argmax(best))} "
+          f"(cycle ≈ {LONG_OFFSET + int(np.argmax(best)) * LONG_DECIMATE})")
+
+    offset, samples, decimate = derive_window(snr)
+    write_window(WINDOW_FILE, offset, samples, decimate)
+    print(f"[INFO] Window: OFFSET={offset}, SAMPLES={samples}, DECIMATE={decimate}")
+    print(f"[INFO] Written to {WINDOW_FILE} (used by cpa.py)")
+
+
+if __name__ == "__main__":
+    main()
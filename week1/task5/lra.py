@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Linear-regression analysis (stochastic model) on a trace set saved by cpa.py.
+
+Instead of assuming HW leakage, every sample is fitted, per S-box and key
+guess, with a least-squares model on the 4 bits of the S-box output
+  y ~ b0 + b1*bit0 + b2*bit1 + b3*bit2 + b4*bit3  (+ pairwise bit products)
+and the guesses are ranked by the best R^2 over the samples.
+
+The regressors only depend on the 4-bit S-box output v, so all fits go
+through the normal equations built from per-class pieces:
+  T[c]      = sum of traces whose 6-bit S-box input chunk is c    (64, L)
+  S_g[v]    = sum of T[c] over c with SBOX(c ^ g) = v             (16, L)
+  n_g[v]    = number of traces in class v under guess g
+  G_g       = PHI^T diag(n_g) PHI                                 (p, p)
+  explained = S_g^T PHI G_g^-1 PHI^T S_g - (sum y)^2 / N
+so one pass over the traces per S-box gives all 64 x L fits.
+
+Usage:
+  python3 lra.py [traces_dir] [--interactions] [--key]
+
+Writes the candidates to sbox_out_lra.txt in the same format as sbox_out.txt.
+"""
+import sys
+import itertools
+import numpy as np
+
+from cpa_engine import (SBOX_LUT, sbox_inputs, results_from_correlation, load_trace_set,
+                        load_known_k1, rank_and_margin, write_candidates_file)
+
+
+# --------- config ---------
+TRACES_DIR = "traces_cpa"
+OUT_FILE = "sbox_out_lra.txt"
+TOP_N = 5
+# --------------------------
+
+
+def basis(interactions=False):
+    """(16, p) regressors of every S-box output value: 1, 4 bits (, bit products)."""
+    bits = (np.arange(16)[:, None] >> np.arange(4)[None, :]) & 1
+    cols = [np.ones(16)] + [bits[:, b] for b in range(4)]
+    if interactions:
+        cols += [bits[:, a] * bits[:, b] for a, b in itertools.combinations(range(4), 2)]
+    return np.array(cols, dtype=float).T
+
+
+def class_maps(sbox_num):
+    """(64, 16, 64) indicator M[g, v, c] = 1 if SBOX(c ^ g) == v."""
+    c = np.arange(64)
+    v = SBOX_LUT[sbox_num - 1][c[None, :] ^ c[:, None]]              # (64 guesses, 64 chunks)
+    return (v[:, None, :] == np.arange(16)[None, :, None]).astype(float)
+
+
+def lra_r2(traces, plaintexts, sbox_num, phi):
+    """(64, L) R^2 of the regression fit for every guess and sample."""
+    y = np.asarray(traces, dtype=float)
+    n = y.shape[0]
+
+    chunk = sbox_inputs(plaintexts, sbox_num)
+    onehot = np.zeros((64, n))
+    onehot[chunk, np.arange(n)] = 1.0
+    chunk_sums = onehot @ y                                          # (64, L)
+    chunk_counts = onehot.sum(axis=1)                                # (64,)
+
+    maps = class_maps(sbox_num)
+    sums = maps @ chunk_sums                                         # (64, 16, L)
+    counts = maps @ chunk_counts                                     # (64, 16)
+
+    gram = np.einsum("vp,gv,vq->gpq", phi, counts, phi)              # (64, p, p)
+    proj = phi @ np.linalg.pinv(gram) @ phi.T                        # (64, 16, 16)
+    fitted = np.einsum("gvl,gvw,gwl->gl", sums, proj, sums)          # (64, L)
+
+    sum_y = y.sum(axis=0)
+    sst = np.sum(y**2, axis=0) - sum_y**2 / n
+    sst[sst <= 0] = np.inf
+    return (fitted - sum_y**2 / n) / sst
+
+
+def main():
+    args = sys.argv[1:]
+    interactions = "--interactions" in args
+    use_key = "--key" in args
+    args = [a for a in args if a not in ("--interactions", "--key")]
+    if len(args) > 1:
+        print(f"Usage: {sys.argv[0]} [traces_dir] [--interactions] [--key]")
+        sys.exit(1)
+    traces_dir = args[0] if args else TRACES_DIR
+
+    traces, plaintexts, _ = load_trace_set(traces_dir)
+    phi = basis(interactions)
+    print(f"[INFO] Loaded traces {traces.shape} from {traces_dir}")
+    print(f"[INFO] LRA with {phi.shape[1]} regressors per guess")
+
+    r2 = np.vstack([lra_r2(traces, plaintexts, s, phi) for s in range(1, 9)])
+    all_results = results_from_correlation(r2)
+
+    candidates_hex = []
+    print("\n=== LRA top keys per S-box (max R^2) ===")
+    for sbox_num in range(1, 9):
+        print(f"\n[S-box {sbox_num}]")
+        row_hex = []
+        for rank, (key, best_r2, idx) in enumerate(all_results[sbox_num][:TOP_N], start=1):
+            print(f"  #{rank}: key=0x{key:02X} (dec={key:2d}), R2={best_r2:.6f}, sample={idx}")
+            row_hex.append(f"0x{key:02X}")
+        candidates_hex.append(row_hex)
+
+    if use_key:
+        ranks, _ = rank_and_margin(r2, load_known_k1())
+        print(f"\n[INFO] Known key ranks: {ranks}")
+
+    write_candidates_file(OUT_FILE, candidates_hex)
+    print(f"\n[INFO] Written S-box key candidates to {OUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
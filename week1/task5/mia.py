@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Mutual information analysis (MIA) on a trace set saved by cpa.py.
+
+For leakage that is not linear in HW, every sample is quantized into
+N_BINS equal-width bins and each S-box key guess is scored by the mutual
+information between its hypothesis class (HW or value of the S-box
+output) and the sample bin; guesses are ranked by the best MI.
+
+The hypothesis class of a guess only depends on the 6-bit S-box input
+chunk, so one pass accumulates the joint histogram
+  H[c, b, l] = #traces with input chunk c and sample l in bin b
+with np.bincount, block by block over the traces. The histograms of all
+64 guesses are then chunk -> class regroupings of H, so memory is
+64 x bins x window and does not grow with the number of traces.
+
+Usage:
+  python3 mia.py [traces_dir] [--bins B] [--window START:STOP] [--model hw|value] [--key]
+
+Writes the candidates to sbox_out_mia.txt in the same format as sbox_out.txt.
+"""
+import sys
+import numpy as np
+
+from cpa_engine import (HW_TABLE, SBOX_LUT, sbox_inputs, results_from_correlation,
+                        load_trace_set, load_known_k1, rank_and_margin,
+                        write_candidates_file)
+
+
+# --------- config ---------
+TRACES_DIR = "traces_cpa"
+OUT_FILE = "sbox_out_mia.txt"
+N_BINS = 9
+MODEL = "hw"            # "hw": 5 HW classes, "value": 16 S-box output values
+BLOCK = 1000            # traces per bincount pass
+TOP_N = 5
+# --------------------------
+
+
+def bin_traces(traces, lo, width, n_bins):
+    """(N, L) bin index of every sample (equal-width bins per sample)."""
+    b = np.floor((traces - lo) / width).astype(np.int64)
+    return np.clip(b, 0, n_bins - 1)
+
+
+def joint_histogram(traces, chunks, n_bins, block=BLOCK):
+    """(64, n_bins, L) counts of (S-box input chunk, sample bin) per sample."""
+    n, length = traces.shape
+    lo = traces.min(axis=0)
+    width = np.maximum(traces.max(axis=0) - lo, 1e-12) / n_bins
+
+    hist = np.zeros(64 * n_bins * length, dtype=np.int64)
+    cols = np.arange(length)
+    for start in range(0, n, block):
+        bins = bin_traces(traces[start:start + block], lo, width, n_bins)
+        c = chunks[start:start + block].astype(np.int64)[:, None]
+        idx = (c * n_bins + bins) * length + cols
+        hist += np.bincount(idx.ravel(), minlength=hist.size)
+    return hist.reshape(64, n_bins, length)
+
+
+def class_maps(sbox_num, model):
+    """(64, n_classes, 64) indicator M[g, h, c] = 1 if class(SBOX(c ^ g)) == h."""
+    c = np.arange(64)
+    v = SBOX_LUT[sbox_num - 1][c[None, :] ^ c[:, None]]
+    if model == "hw":
+        v, n_classes = HW_TABLE[v], 5
+    else:
+        n_classes = 16
+    return (v[:, None, :] == np.arange(n_classes)[None, :, None]).astype(float)
+
+
+def mutual_information(hist, maps):
+    """
+    hist: (64, B, L) chunk x bin counts, maps: (64, H, 64) chunk -> class
+    Returns (64, L) MI in bits between class and bin for every guess.
+    """
+    n = hist[:, :, 0].sum()
+    flat = hist.reshape(64, -1).astype(float) / n
+    p_b = flat.sum(axis=0).reshape(1, *hist.shape[1:])
+    mi = np.zeros((64, hist.shape[2]))
+    for g in range(64):
+        joint = (maps[g] @ flat).reshape(-1, *hist.shape[1:])           # p(h, b) per sample
+        p_h = joint.sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            terms = joint * np.log2(joint / (p_h * p_b))
+        mi[g] = np.nansum(terms, axis=(0, 1))
+    return mi
+
+
+def parse_args(argv):
+    opts = {"bins": N_BINS, "window": None, "model": MODEL, "key": "--key" in argv}
+    args = [a for a in argv if a != "--key"]
+    for flag, conv in (("--bins", int), ("--window", str), ("--model", str)):
+        if flag in args:
+            i = args.index(flag)
+            opts[flag[2:]] = conv(args[i + 1])
+            del args[i:i + 2]
+    if len(args) > 1 or opts["model"] not in ("hw", "value") or opts["bins"] < 2:
+        raise ValueError
+    if opts["window"] is not None:
+        start, stop = opts["window"].split(":")
+        opts["window"] = (int(start), int(stop))
+    opts["traces_dir"] = args[0] if args else TRACES_DIR
+    return opts
+
+
+def main():
+    try:
+        opts = parse_args(sys.argv[1:])
+    except (ValueError, IndexError):
+        print(f"Usage: {sys.argv[0]} [traces_dir] [--bins B] [--window START:STOP] "
+              f"[--model hw|value] [--key]")
+        sys.exit(1)
+
+    traces, plaintexts, _ = load_trace_set(opts["traces_dir"])
+    start, stop = opts["window"] or (0, traces.shape[1])
+    traces = traces[:, start:stop]
+    print(f"[INFO] Loaded traces {traces.shape} (samples {start}:{stop}) "
+          f"from {opts['traces_dir']}")
+    print(f"[INFO] MIA with {opts['bins']} bins, model={opts['model']}")
+
+    mi = np.vstack([
+        mutual_information(joint_histogram(traces, sbox_inputs(plaintexts, s), opts["bins"]),
+                           class_maps(s, opts["model"]))
+        for s in range(1, 9)
+    ])
+    all_results = results_from_correlation(mi)
+
+    candidates_hex = []
+    print("\n=== MIA top keys per S-box (max MI) ===")
+    for sbox_num in range(1, 9):
+        print(f"\n[S-box {sbox_num}]")
+        row_hex = []
+        for rank, (key, best_mi, idx) in enumerate(all_results[sbox_num][:TOP_N], start=1):
+            print(f"  #{rank}: key=0x{key:02X} (dec={key:2d}), MI={best_mi:.6f} bits, "
+                  f"sample={start + idx}")
+            row_hex.append(f"0x{key:02X}")
+        candidates_hex.append(row_hex)
+
+    if opts["key"]:
+        ranks, _ = rank_and_margin(mi, load_known_k1())
+        print(f"\n[INFO] Known key ranks: {ranks}")
+
+    write_candidates_file(OUT_FILE, candidates_hex)
+    print(f"\n[INFO] Written S-box key candidates to {OUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
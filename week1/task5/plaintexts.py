@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Plaintext strategies for the round-1 captures (cpa.py).
+
+  uniform   n random 64-bit plaintexts in one vectorized draw
+  balanced  blocks of 64 plaintexts in which the 6-bit E(R0) chunk of
+            every S-box takes each of its 64 values exactly once, for all
+            8 S-boxes at once
+  adaptive  balanced blocks until there is a ranking, then the S-box
+            input chunks of every batch are drawn with a preference for
+            the chunks on which the currently likely guesses predict the
+            most different HW values (pairwise HW difference, weighted by
+            the running CPA)
+
+Round 1 only sees R0 (IP(P) bits 33..64); L0 is always uniform random.
+
+Balanced blocks: chunk s reads R0 bits E[6s-5..6s], neighbouring chunks
+share two bits. Every R0 bit p gets a label l(p) in 0..5 such that the 6
+bits of each chunk have 6 different labels (chunk_labels()); then with
+    R0 bit p = bit l(p) of u  XOR  c_p
+a 6-bit counter u running through 0..63 runs every chunk through all 64
+values. Labels, the order of u and c are drawn fresh for every block.
+
+  python3 plaintexts.py [--runs R] [--noise SIGMA]
+compares the traces needed for rank 1 on simulated HW leakage, paired
+runs (same key and noise seed for every mode), with the mean difference
+to balanced and its 95% bootstrap interval. Measured:
+  sigma 2, 1000 runs (~113 traces)  adaptive -1.6 [-4.0, +0.8]  no measurable gain
+  sigma 4,  800 runs (~390 traces)  adaptive -17  [-29, -6]     about 4% fewer traces
+Scoring only the top-k guesses against the rest (k = 2, 4, 8) did no
+better than the weighted score below. The gain grows with the noise, so
+adaptive only pays for long, noisy campaigns.
+"""
+import os
+import sys
+import numpy as np
+
+from sbox_out import IP, E_TABLE
+from permutation import Permutation
+from cpa_engine import HW_TABLE, SBOX_LUT, sbox_inputs, results_from_correlation
+from accumulators import CpaAccumulator
+from evaluate import bootstrap_mean_interval
+
+
+# --------- config ---------
+MODES = ("uniform", "balanced", "adaptive")
+WARMUP = 64             # adaptive: balanced plaintexts before the first ranking
+TEMPERATURE = 2.0       # adaptive: sharpness of the guess weights (0 = uniform)
+# --------------------------
+
+
+# L0||R0 -> plaintext
+IP_INV = Permutation(IP, 64).inverse()
+
+# chunk s (0..7) -> its 6 R0 bit positions (1-based)
+CHUNK_BITS = [E_TABLE[6 * s:6 * s + 6] for s in range(8)]
+
+
+def random_u64(n, rng):
+    return rng.integers(0, 1 << 64, size=n, dtype=np.uint64, endpoint=False)
+
+
+def uniform(n, rng=None):
+    """(n,) uint64 uniform random plaintexts."""
+    rng = rng or np.random.default_rng()
+    return random_u64(n, rng)
+
+
+# ========== balanced blocks ==========
+
+def chunk_labels(rng):
+    """
+    (32,) label 0..5 per R0 bit, all different within every chunk.
+
+    Chunk s is  P_s | M_s | P_s+1  with the shared bit pairs
+    P_s = (4s, 4s+1) (P_0 = (32, 1)) and the middle pair M_s = (4s+2, 4s+3).
+    The 6 labels are cut into 3 label pairs; the P_s get label pairs with
+    neighbours different (a 3-colouring of the cycle P_0..P_7) and M_s
+    gets the third one.
+    """
+    pairs = rng.permutation(6).reshape(3, 2)
+    while True:
+        colour = [int(rng.integers(3))]
+        for _ in range(7):
+            colour.append(int((colour[-1] + rng.integers(1, 3)) % 3))
+        if colour[-1] != colour[0]:
+            break
+
+    labels = np.zeros(33, dtype=int)
+    for s in range(8):
+        a, b = colour[s], colour[(s + 1) % 8]
+        p = [(4 * s - 1) % 32 + 1, 4 * s + 1]
+        m = [4 * s + 2, 4 * s + 3]
+        labels[p] = rng.permutation(pairs[a])
+        labels[m] = rng.permutation(pairs[3 - a - b])
+    return labels[1:]
+
+
+def balanced_block(rng):
+    """(64,) plaintexts; every S-box input chunk takes all 64 values once."""
+    labels = chunk_labels(rng)
+    u = rng.permutation(64).astype(np.uint64)
+    r0 = np.zeros(64, dtype=np.uint64)
+    for p in range(1, 33):
+        bit = (u >> np.uint64(5 - labels[p - 1])) & np.uint64(1)
+        r0 |= bit << np.uint64(32 - p)
+    r0 ^= np.uint64(rng.integers(0, 1 << 32))
+    l0 = random_u64(64, rng) & np.uint64(0xFFFFFFFF00000000)
+    return IP_INV.array(l0 | r0)
+
+
+def balanced(n, rng=None):
+    """(n,) plaintexts from ceil(n / 64) balanced blocks (last one cut)."""
+    rng = rng or np.random.default_rng()
+    blocks = [balanced_block(rng) for _ in range(-(-n // 64))]
+    return np.concatenate(blocks)[:n] if blocks else np.zeros(0, dtype=np.uint64)
+
+
+# ========== adaptive selection ==========
+
+# HW_HYP[s, g, x] = HW(S-box s+1 output) for guess g and input chunk x
+HW_HYP = np.stack([HW_TABLE[SBOX_LUT[s][np.arange(64)[None, :] ^ np.arange(64)[:, None]]]
+                   for s in range(8)]).astype(float)
+
+
+def guess_weights(acc, temp=TEMPERATURE):
+    """
+    (8, 64) weight of every guess from the running CPA (CpaAccumulator
+    over all 8*64 guesses): exp(temp * z^2 / 2) with the Fisher-z of the
+    guess's max |corr|, normalized per S-box.
+    """
+    score = np.max(np.abs(acc.correlation()), axis=1).reshape(8, 64)
+    z2 = np.arctanh(np.minimum(score, 1 - 1e-12))**2 * max(acc.n - 3, 1)
+    w = np.exp(temp * (z2 - z2.max(axis=1, keepdims=True)) / 2)
+    return w / w.sum(axis=1, keepdims=True)
+
+
+def chunk_preference(weights):
+    """
+    (8, 64) sampling probability of every input chunk: the weighted
+    variance of HW over the guesses, which is half the weighted mean of
+    the pairwise differences  sum_a,b w_a w_b (HW_a(x) - HW_b(x))^2.
+    Chunks on which the likely guesses predict the same HW do not help
+    to tell them apart.
+    """
+    mean = np.einsum("sg,sgx->sx", weights, HW_HYP)
+    spread = np.einsum("sg,sgx->sx", weights, (HW_HYP - mean[:, None, :])**2) + 1e-3
+    return spread / spread.sum(axis=1, keepdims=True)
+
+
+def set_chunk(r0, s, chunk, mask=0x3F):
+    """r0 with the chunk bits of S-box s (0..7) in mask set from chunk."""
+    for j, p in enumerate(CHUNK_BITS[s]):
+        if (mask >> (5 - j)) & 1:
+            bit = (chunk.astype(np.uint64) >> np.uint64(5 - j)) & np.uint64(1)
+            r0 = r0 | (bit << np.uint64(32 - p))
+    return r0
+
+
+def get_chunk(r0, s):
+    chunk = np.zeros(len(r0), dtype=np.int64)
+    for j, p in enumerate(CHUNK_BITS[s]):
+        chunk |= ((r0 >> np.uint64(32 - p)) & np.uint64(1)).astype(np.int64) << (5 - j)
+    return chunk
+
+
+def sample_rows(prob, rng):
+    """One index per row of prob (rows sum to 1)."""
+    u = rng.random((prob.shape[0], 1))
+    return np.minimum((np.cumsum(prob, axis=1) < u).sum(axis=1), prob.shape[1] - 1)
+
+
+def adaptive(n, acc=None, rng=None, temp=TEMPERATURE):
+    """
+    (n,) plaintexts for the next batch. acc: CpaAccumulator of the traces
+    so far (EarlyStopMonitor.acc), None or < WARMUP traces -> balanced.
+
+    Chunks 1,3,5,7 share no bits, so they are drawn freely from
+    chunk_preference(); chunks 2,4,6,8 then only have their 2 middle
+    bits left and pick one of those 4 chunks with the same preference.
+    Every other plaintext the roles of odd and even S-boxes swap.
+    """
+    rng = rng or np.random.default_rng()
+    if acc is None or acc.n < WARMUP:
+        return balanced(n, rng)
+    pref = chunk_preference(guess_weights(acc, temp))
+
+    r0 = np.zeros(n, dtype=np.uint64)
+    parity = np.arange(n) % 2
+    for first in (0, 1):
+        rows = parity == first
+        part = np.zeros(int(rows.sum()), dtype=np.uint64)
+        for s in range(first, 8, 2):
+            part = set_chunk(part, s, rng.choice(64, size=len(part), p=pref[s]))
+        for s in range(1 - first, 8, 2):
+            options = (get_chunk(part, s) & 0b110011)[:, None] | (np.arange(4) << 2)
+            prob = pref[s][options]
+            pick = sample_rows(prob / prob.sum(axis=1, keepdims=True), rng)
+            part = set_chunk(part, s, options[np.arange(len(part)), pick], mask=0b001100)
+        r0[rows] = part
+    l0 = random_u64(n, rng) & np.uint64(0xFFFFFFFF00000000)
+    return IP_INV.array(l0 | r0)
+
+
+def generate(mode, n, rng=None):
+    """First n plaintexts of a strategy as a list of Python ints (cpa.py)."""
+    if mode not in MODES:
+        raise ValueError(f"unknown plaintext mode {mode!r}")
+    pts = uniform(n, rng) if mode == "uniform" else balanced(n, rng)
+    return [int(p) for p in pts]
+
+
+# ========== simulation ==========
+
+def simulate(mode, correct, noise, rng, step=16, max_traces=4000):
+    """
+    Traces until the correct key is rank 1 on all 8 S-boxes, with one
+    sample per S-box:  HW(S-box out) + N(0, noise^2).
+    """
+    acc = CpaAccumulator(8 * 64, 8)
+    pts = np.zeros(0, dtype=np.uint64)
+    while acc.n < max_traces:
+        if mode == "adaptive":
+            batch = adaptive(step, acc, rng)
+        elif mode == "balanced":
+            # one balanced block at a time, so every check sees whole blocks
+            if len(pts) < step:
+                pts = np.concatenate([pts, balanced_block(rng)])
+            batch, pts = pts[:step], pts[step:]
+        else:
+            batch = uniform(step, rng)
+
+        leak = np.stack([HW_TABLE[SBOX_LUT[s][sbox_inputs(batch, s + 1) ^ correct[s]]]
+                         for s in range(8)], axis=1)
+        traces = leak + rng.normal(0, noise, leak.shape)
+        acc.update(np.vstack([HW_TABLE[SBOX_LUT[s][sbox_inputs(batch, s + 1)[None, :]
+                                                   ^ np.arange(64, dtype=np.uint8)[:, None]]]
+                              for s in range(8)]), traces)
+        results = results_from_correlation(acc.correlation())
+        if all(results[s + 1][0][0] == correct[s] for s in range(8)):
+            return acc.n
+    return max_traces
+
+
+def main():
+    args = sys.argv[1:]
+    opts = {"runs": 200, "noise": 4.0}
+    try:
+        for flag, conv in (("--runs", int), ("--noise", float)):
+            if flag in args:
+                i = args.index(flag)
+                opts[flag[2:]] = conv(args[i + 1])
+                del args[i:i + 2]
+        if args:
+            raise ValueError
+    except (ValueError, IndexError):
+        print(f"Usage: {sys.argv[0]} [--runs R] [--noise SIGMA]")
+        sys.exit(1)
+
+    rng = np.random.default_rng(int.from_bytes(os.urandom(4), "big"))
+    for _ in range(100):
+        pts = balanced_block(rng)
+        for s in range(1, 9):
+            assert np.array_equal(np.sort(sbox_inputs(pts, s)), np.arange(64))
+    print("[INFO] Balanced blocks: every S-box chunk takes all 64 values ✅")
+
+    print(f"[INFO] Traces to rank 1 on all 8 S-boxes, noise sigma={opts['noise']}, "
+          f"{opts['runs']} paired runs")
+    seeds = rng.integers(0, 1 << 32, opts["runs"])
+    needed = {}
+    for mode in MODES:
+        needed[mode] = np.array([simulate(mode, run_rng.integers(0, 64, 8), opts["noise"], run_rng)
+                                 for run_rng in map(np.random.default_rng, seeds)])
+    for mode in MODES:
+        line = f"  {mode:9s} median {np.median(needed[mode]):6.0f}   mean {np.mean(needed[mode]):7.1f}"
+        if mode != "balanced":
+            lo, hi = bootstrap_mean_interval(needed[mode] - needed["balanced"])
+            diff = np.mean(needed[mode] - needed["balanced"])
+            line += f"   vs balanced {diff:+6.1f} [{lo:+.1f}, {hi:+.1f}]"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
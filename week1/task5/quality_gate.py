@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Streaming quality gate for captured traces.
+
+Every trace is checked before it is stored:
+  - clipped : too many samples at the ADC rails
+  - flat    : (almost) no variation, e.g. a missed trigger
+  - energy  : trace energy far outside the running energy envelope
+  - shape   : correlation with the running mean template far below the
+              usual value, e.g. a trace shifted by trigger jitter
+
+The template and the energy/correlation envelopes are running statistics
+of the accepted traces only, so one bad capture cannot pull them along.
+During the first WARMUP accepted traces only the clipped/flat checks run.
+"""
+import numpy as np
+
+
+# --------- config ---------
+CLIP_LEVEL = 0.495      # CW ADC values are in [-0.5, 0.5)
+MAX_CLIPPED = 0         # clipped samples allowed per trace
+MIN_STD = 1e-4          # below this the trace counts as flat
+WARMUP = 20             # accepted traces before energy/shape checks start
+N_SIGMA = 5.0           # width of the energy and correlation envelopes
+# --------------------------
+
+
+class RunningStat:
+    """Welford mean/variance of a scalar or an array."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta / self.n
+        self.m2 = self.m2 + delta * (x - self.mean)
+
+    def variance(self):
+        """Sample variance (0 for fewer than two values)."""
+        return self.m2 / (self.n - 1) if self.n > 1 else np.zeros_like(self.mean)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+
+class TraceQualityGate:
+
+    def __init__(self, clip_level=CLIP_LEVEL, max_clipped=MAX_CLIPPED, min_std=MIN_STD,
+                 warmup=WARMUP, n_sigma=N_SIGMA):
+        self.clip_level = clip_level
+        self.max_clipped = max_clipped
+        self.min_std = min_std
+        self.warmup = warmup
+        self.n_sigma = n_sigma
+
+        self.template = RunningStat()     # per-sample mean trace
+        self.energy = RunningStat()       # mean square of the centered trace
+        self.shape = RunningStat()        # correlation with the template
+        self.counters = {"accepted": 0, "timeout": 0, "clipped": 0,
+                         "flat": 0, "energy": 0, "shape": 0}
+
+    def _template_corr(self, trace):
+        t = self.template.mean
+        a = trace - trace.mean()
+        b = t - t.mean()
+        denom = np.sqrt(np.sum(a**2) * np.sum(b**2))
+        return float(np.sum(a * b) / denom) if denom > 0 else 0.0
+
+    def _outside(self, stat, value, low_only=False):
+        sigma = stat.std()
+        if sigma == 0:
+            return False
+        if low_only:
+            return value < stat.mean - self.n_sigma * sigma
+        return abs(value - stat.mean) > self.n_sigma * sigma
+
+    def check(self, trace):
+        """
+        Returns None if the trace is accepted (and updates the running
+        statistics), or the rejection reason. Pass None for a timeout.
+        """
+        if trace is None:
+            reason = "timeout"
+        elif np.count_nonzero(np.abs(trace) >= self.clip_level) > self.max_clipped:
+            reason = "clipped"
+        elif trace.std() < self.min_std:
+            reason = "flat"
+        else:
+            reason = None
+            energy = float(np.mean((trace - trace.mean())**2))
+            corr = self._template_corr(trace) if self.template.n > 0 else 1.0
+
+            if self.counters["accepted"] >= self.warmup:
+                if self._outside(self.energy, energy):
+                    reason = "energy"
+                elif self._outside(self.shape, corr, low_only=True):
+                    reason = "shape"
+
+        if reason is not None:
+            self.counters[reason] += 1
+            return reason
+
+        self.template.add(np.asarray(trace, dtype=float))
+        self.energy.add(energy)
+        if self.template.n > 1:
+            self.shape.add(corr)
+        self.counters["accepted"] += 1
+        return None
+
+    def report(self):
+        """One-line summary of the per-reason counters."""
+        total = sum(self.counters.values())
+        parts = ", ".join(f"{k}={v}" for k, v in self.counters.items())
+        return f"[INFO] Quality gate: {total} captures ({parts})"
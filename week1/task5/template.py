@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Template attack on the round-1 S-box subkeys.
+
+Profiling (traces captured with a known key, e.g. cpa.py after
+programming the key in full_key.txt):
+  For every S-box, every trace is labelled with its class under the known
+  key: the 6-bit S-box input (64 classes) or the 4-bit S-box output (16
+  classes). POIs are the N_POI samples with the highest class SNR. Each
+  class gets a mean vector on the POIs, and all classes share one pooled
+  covariance matrix (within-class scatter / (N - n_classes)).
+
+Attack (traces with an unknown key):
+  With a pooled covariance the Gaussian log-likelihood of trace t for
+  class c is, up to a constant,
+      LL[t, c] = t . S^-1 mu_c - 0.5 * mu_c . S^-1 mu_c
+  so all traces x all classes is one matrix product. The score of a
+  guess k is the sum over traces of LL[t, class of t under k].
+
+Usage:
+  python3 template.py profile <profile_dir> [key_file] [--classes in|out] [--poi N]
+  python3 template.py attack  <attack_dir> [--key]
+
+Templates are saved to templates.npz; the attack writes sbox_out_tpl.txt.
+"""
+import sys
+import numpy as np
+
+from cpa_engine import (KEY_FILE, sbox_inputs, sbox_outputs,
+                        load_trace_set, load_known_k1, write_candidates_file)
+
+
+# --------- config ---------
+TEMPLATE_FILE = "templates.npz"
+OUT_FILE = "sbox_out_tpl.txt"
+CLASSES = "in"          # "in": 64 S-box input classes, "out": 16 S-box output classes
+N_POI = 10
+MIN_POI_SPACING = 2     # samples between two POIs
+TOP_N = 5
+# --------------------------
+
+
+N_CLASSES = {"in": 64, "out": 16}
+
+
+# ========== classes ==========
+
+def class_labels(blocks, sbox_num, kind):
+    """(64, N) class of every trace under every 6-bit guess."""
+    if kind == "out":
+        return sbox_outputs(blocks, sbox_num)
+    chunk = sbox_inputs(blocks, sbox_num)
+    return chunk[None, :] ^ np.arange(64, dtype=np.uint8)[:, None]
+
+
+def class_sums(traces, labels, n_classes):
+    """Per-class counts, means and mean squares of every sample."""
+    onehot = np.zeros((n_classes, len(labels)))
+    onehot[labels, np.arange(len(labels))] = 1.0
+    counts = onehot.sum(axis=1)
+    safe = np.maximum(counts, 1)[:, None]
+    return counts, (onehot @ traces) / safe, (onehot @ traces**2) / safe
+
+
+def select_pois(snr, n_poi, spacing=MIN_POI_SPACING):
+    """Highest-SNR samples, at least `spacing` samples apart."""
+    pois = []
+    for idx in np.argsort(snr)[::-1]:
+        if all(abs(idx - p) >= spacing for p in pois):
+            pois.append(int(idx))
+        if len(pois) == n_poi:
+            break
+    return np.array(sorted(pois))
+
+
+# ========== profiling ==========
+
+def build_template(traces, labels, n_classes, n_poi):
+    """
+    traces: (N, L), labels: (N,) known classes
+    Returns (pois, means (C, P), pooled covariance (P, P)).
+    """
+    counts, means, sq = class_sums(traces, labels, n_classes)
+    used = counts > 1
+    noise = np.maximum(sq[used] - means[used]**2, 0).mean(axis=0)
+    noise[noise == 0] = np.inf
+    snr = means[used].var(axis=0) / noise
+    pois = select_pois(snr, n_poi)
+
+    x = traces[:, pois]
+    class_means = means[:, pois]
+    resid = x - class_means[labels]
+    pooled = resid.T @ resid / max(len(labels) - int(np.sum(counts > 0)), 1)
+
+    missing = counts == 0
+    if np.any(missing):
+        print(f"[WARN] {int(missing.sum())} classes have no profiling traces")
+        class_means[missing] = x.mean(axis=0)
+    return pois, class_means, pooled
+
+
+def profile(traces, plaintexts, key_chunks, kind, n_poi):
+    """Templates of all 8 S-boxes as arrays stacked over the S-box axis."""
+    all_pois, all_means, all_cov = [], [], []
+    for s in range(8):
+        labels = class_labels(plaintexts, s + 1, kind)[key_chunks[s]]
+        pois, means, cov = build_template(traces, labels, N_CLASSES[kind], n_poi)
+        print(f"  S{s + 1}: POIs {pois.tolist()}")
+        all_pois.append(pois)
+        all_means.append(means)
+        all_cov.append(cov)
+    return np.array(all_pois), np.array(all_means), np.array(all_cov)
+
+
+# ========== attack ==========
+
+def log_likelihoods(x, means, cov):
+    """(N, C) pooled-covariance Gaussian log-likelihood (up to a constant)."""
+    w = np.linalg.solve(cov, means.T)                   # S^-1 mu_c, (P, C)
+    bias = -0.5 * np.sum(means.T * w, axis=0)           # (C,)
+    return x @ w + bias
+
+
+def guess_scores(traces, plaintexts, sbox_num, pois, means, cov, kind):
+    """(64,) summed log-likelihood of every guess of one S-box."""
+    ll = log_likelihoods(traces[:, pois], means, cov)   # (N, C)
+    labels = class_labels(plaintexts, sbox_num, kind)   # (64, N)
+    return np.take_along_axis(ll.T, labels.astype(np.intp), axis=0).sum(axis=1)
+
+
+def save_templates(path, pois, means, cov, kind):
+    np.savez(path, pois=pois, means=means, cov=cov, kind=kind)
+
+
+def load_templates(path):
+    data = np.load(path)
+    return data["pois"], data["means"], data["cov"], str(data["kind"])
+
+
+# ========== main ==========
+
+def parse_opts(args):
+    opts = {"classes": CLASSES, "poi": N_POI, "key": "--key" in args}
+    args = [a for a in args if a != "--key"]
+    for flag, conv in (("--classes", str), ("--poi", int)):
+        if flag in args:
+            i = args.index(flag)
+            opts[flag[2:]] = conv(args[i + 1])
+            del args[i:i + 2]
+    if opts["classes"] not in N_CLASSES:
+        raise ValueError
+    return args, opts
+
+
+def usage():
+    print(f"Usage: {sys.argv[0]} profile <profile_dir> [key_file] [--classes in|out] [--poi N]")
+    print(f"       {sys.argv[0]} attack  <attack_dir> [--key]")
+    sys.exit(1)
+
+
+def main():
+    try:
+        args, opts = parse_opts(sys.argv[1:])
+    except (ValueError, IndexError):
+        usage()
+
+    if len(args) in (2, 3) and args[0] == "profile":
+        key_file = args[2] if len(args) == 3 else KEY_FILE
+        traces, plaintexts, _ = load_trace_set(args[1])
+        key_chunks = load_known_k1(key_file)
+        print(f"[INFO] Profiling on {traces.shape} from {args[1]}, key from {key_file}, "
+              f"{N_CLASSES[opts['classes']]} classes, {opts['poi']} POIs")
+        pois, means, cov = profile(traces, plaintexts, key_chunks, opts["classes"], opts["poi"])
+        save_templates(TEMPLATE_FILE, pois, means, cov, opts["classes"])
+        print(f"[INFO] Saved templates to {TEMPLATE_FILE}")
+
+    elif len(args) == 2 and args[0] == "attack":
+        pois, means, cov, kind = load_templates(TEMPLATE_FILE)
+        traces, plaintexts, _ = load_trace_set(args[1])
+        correct = load_known_k1() if opts["key"] else None
+        print(f"[INFO] Template attack on {traces.shape} from {args[1]}")
+
+        candidates_hex = []
+        for s in range(8):
+            scores = guess_scores(traces, plaintexts, s + 1, pois[s], means[s], cov[s], kind)
+            order = np.argsort(scores)[::-1]
+            line = "  ".join(f"0x{k:02X}" for k in order[:TOP_N])
+            if correct is not None:
+                rank = 1 + int(np.sum(scores > scores[correct[s]]))
+                line += f"   (known key rank {rank})"
+            print(f"  S{s + 1}: {line}")
+            candidates_hex.append([f"0x{k:02X}" for k in order[:TOP_N]])
+
+        write_candidates_file(OUT_FILE, candidates_hex)
+        print(f"[INFO] Written S-box key candidates to {OUT_FILE}")
+
+    else:
+        usage()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Level-of-detail trace plotting.
+
+A 200k-sample trace drawn with plt.plot at dpi=300 is ~3000 pixels wide,
+so ~60 samples land on every pixel column: matplotlib still strokes all of
+them (slow) and the picture aliases. Here the trace is cut into one bin
+per pixel column and only the min and max of every bin are drawn, as a
+line min0 -> max0 -> min1 -> max1 ..., which covers exactly the pixels
+the full-resolution line would cover. Drawing cost depends on the image
+width, not on the trace length.
+
+  envelope(trace, n_bins)      vectorized reshape min/max reduction
+  Pyramid(trace)               min/max levels with bins of 4, 16, 64, ...
+                               samples; envelope(start, stop, n_bins)
+                               reads the coarsest level that is still
+                               fine enough (zooming into long / memmapped
+                               traces without touching every sample)
+  plot_envelope(ax, trace)     drop-in for ax.plot(x, trace, ...)
+"""
+import numpy as np
+
+
+# --------- config ---------
+PYRAMID_FACTOR = 4          # samples per bin grow by this factor per level
+PYRAMID_MIN_BINS = 1024     # stop building levels below this many bins
+CHUNK = 1 << 22             # samples per read when building the first level
+# --------------------------
+
+
+def _reduce(lo, hi, k):
+    """Min of lo / max of hi over groups of k (the last group may be short)."""
+    full = len(lo) // k * k
+    out_lo = lo[:full].reshape(-1, k).min(axis=1)
+    out_hi = hi[:full].reshape(-1, k).max(axis=1)
+    if full < len(lo):
+        out_lo = np.append(out_lo, lo[full:].min())
+        out_hi = np.append(out_hi, hi[full:].max())
+    return out_lo, out_hi
+
+
+def envelope(trace, n_bins):
+    """
+    (x, lo, hi): min/max of trace over about n_bins equal bins, x = first
+    sample of every bin. Short traces (<= 2 * n_bins) come back unreduced
+    with lo = hi = trace.
+    """
+    trace = np.asarray(trace)
+    n = len(trace)
+    if n <= 2 * n_bins:
+        return np.arange(n), trace, trace
+    size = -(-n // n_bins)
+    lo, hi = _reduce(trace, trace, size)
+    return np.arange(len(lo)) * size, lo, hi
+
+
+class Pyramid:
+    """Min/max pyramid of a (possibly memory-mapped) 1-D trace."""
+
+    def __init__(self, trace, factor=PYRAMID_FACTOR, min_bins=PYRAMID_MIN_BINS):
+        self.trace = trace
+        self.n = len(trace)
+        self.factor = factor
+        # level 0: bins of `factor` samples, built chunk by chunk
+        chunk = CHUNK // factor * factor
+        parts = []
+        for s in range(0, self.n, chunk):
+            block = np.asarray(trace[s:s + chunk])
+            parts.append(_reduce(block, block, factor))
+        lo = np.concatenate([p[0] for p in parts])
+        hi = np.concatenate([p[1] for p in parts])
+        self.levels = [(factor, lo, hi)]
+        while len(lo) > min_bins:
+            lo, hi = _reduce(lo, hi, factor)
+            self.levels.append((self.levels[-1][0] * factor, lo, hi))
+
+    def envelope(self, start=0, stop=None, n_bins=2000):
+        """(x, lo, hi) of trace[start:stop] with about n_bins bins."""
+        stop = self.n if stop is None else min(stop, self.n)
+        span = stop - start
+        if span <= 2 * n_bins:
+            raw = np.asarray(self.trace[start:stop])
+            return np.arange(start, stop), raw, raw
+        want = span / n_bins
+        size, lo, hi = self.levels[0]
+        for level in self.levels:
+            if level[0] <= want:
+                size, lo, hi = level
+        a, b = start // size, -(-stop // size)
+        k = max(1, int(want // size))
+        lo, hi = _reduce(lo[a:b], hi[a:b], k)
+        return a * size + np.arange(len(lo)) * size * k, lo, hi
+
+    def save(self, path):
+        np.savez(path, n=self.n, factor=self.factor,
+                 **{f"lo{i}": lo for i, (_, lo, _) in enumerate(self.levels)},
+                 **{f"hi{i}": hi for i, (_, _, hi) in enumerate(self.levels)})
+
+    @classmethod
+    def load(cls, path, trace=None):
+        """Pyramid from save(); trace (e.g. a memmap) is only needed to zoom to raw."""
+        data = np.load(path)
+        pyr = cls.__new__(cls)
+        pyr.trace = trace
+        pyr.n = int(data["n"])
+        pyr.factor = int(data["factor"])
+        pyr.levels = []
+        size = pyr.factor
+        while f"lo{len(pyr.levels)}" in data:
+            i = len(pyr.levels)
+            pyr.levels.append((size, data[f"lo{i}"], data[f"hi{i}"]))
+            size *= pyr.factor
+        return pyr
+
+
+def pixel_width(ax, dpi):
+    """
+    Pixel width of the saved figure: an upper bound for the axes width,
+    which only settles at tight_layout() after the plot call.
+    """
+    return max(1, int(ax.figure.get_figwidth() * dpi))
+
+
+def plot_envelope(ax, trace, x0=0, dpi=300, start=0, stop=None, **kwargs):
+    """
+    ax.plot() of a trace (array or Pyramid) reduced to one min/max pair per
+    pixel column of an image saved at dpi. x0 is the x of sample 0;
+    kwargs go to ax.plot (label, linewidth, color, ...).
+    """
+    n_bins = pixel_width(ax, dpi)
+    if isinstance(trace, Pyramid):
+        x, lo, hi = trace.envelope(start, stop, n_bins)
+    else:
+        x, lo, hi = envelope(np.asarray(trace)[start:stop], n_bins)
+        x = x + start
+    if lo is hi:
+        return ax.plot(x0 + x, lo, **kwargs)
+    # min -> max inside a bin, then on to the next bin's min
+    return ax.plot(x0 + np.repeat(x, 2), np.column_stack([lo, hi]).ravel(), **kwargs)
+
+
+if __name__ == "__main__":
+    # self-test: envelope and pyramid agree with a direct min/max
+    rng = np.random.default_rng(0)
+    t = np.cumsum(rng.normal(0, 1, 1_000_003))
+    x, lo, hi = envelope(t, 3000)
+    size = x[1] - x[0]
+    assert lo[5] == t[5 * size:6 * size].min() and hi[-1] == t[x[-1]:].max()
+    pyr = Pyramid(t)
+    for start, stop in ((0, None), (123_456, 654_321), (10, 5000)):
+        x, lo, hi = pyr.envelope(start, stop, 1000)
+        end = len(t) if stop is None else stop
+        assert lo.min() <= t[start:end].min() and hi.max() >= t[start:end].max()
+        assert x[0] <= start and len(lo) <= 4 * 1000
+    print(f"[INFO] trace_plot self-test passed ✅ ({len(pyr.levels)} pyramid levels)")
@@ -3,6 +3,8 @@ import time
 import numpy as np
 import matplotlib.pyplot as plt
 
+from trace_plot import plot_envelope
+
 CW_SERIAL = "442031204c5032433130333234313031"
 
 scope = None
@@ -119,8 +121,7 @@ def capture_readmem_trace():
 
     # Plot and save PNG
     plt.figure(figsize=(10, 3))
-    x = np.arange(len(trace))
-    plt.plot(x, trace, linewidth=0.6)
+    plot_envelope(plt.gca(), trace, linewidth=0.6)
     plt.title("Power trace – Read Memory command (0x11 0xEE, RDP0)")
     plt.xlabel("Sample index")
     plt.ylabel("Power (ADC units)")